@@ -1,26 +1,97 @@
+import logging
+import signal
+import sys
+
 from aiogram import executor
 
 import handlers
-from handlers.schedule_jobs import schedule_all
-from loader import dp, sched
+import middlewares
+from data import config
+from handlers.schedule_jobs import start_scheduling, stop_scheduling
+from loader import bot, db, dp, leader, sched
+from utils import startup_profile
+from utils.get_coordinates import close_geocoder
+from utils.get_db_data import tz_cache_info
+from utils.in_flight import jobs_in_flight, track_jobs, updates_in_flight
+from utils.metrics import start_server, stop_server, track_job_lag
 from utils.notify_admin import notify_on_shutdown, notify_on_startup
+from utils.send_message import message_queue
 from utils.set_bot_commands import set_default_commands
 
 
 async def on_startup(dispatcher):
     """Set default commands for the bot and notify of bot startup."""
+    startup_profile.imported()
+    sched.start()
     await set_default_commands(dispatcher)
-    # recreate jobs for the apscheduler
-    await schedule_all()
+    message_queue.start()
+    track_jobs(sched)
+    track_job_lag(sched)
+    await start_server(config.METRICS_HOST, config.METRICS_PORT)
+    # recreate jobs for the apscheduler (right away if this instance is the
+    # leader, else once it's elected)
+    await leader.start(start_scheduling, stop_scheduling)
+
+    if config.USE_WEBHOOK:
+        await dispatcher.bot.set_webhook(
+            config.WEBHOOK_URL,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        )
+
     await notify_on_startup(dispatcher)
+    # logged only if started with `python -m utils.startup_profile`
+    startup_profile.report()
 
 
 async def on_shutdown(dispatcher):
+    # stop taking new updates and jobs, then let the running ones finish
+    dispatcher.stop_polling()
+    sched.pause()
+
+    if not await updates_in_flight.wait(config.SHUTDOWN_TIMEOUT):
+        logging.error(
+            f"UNEXPECTED: {updates_in_flight.count} updates still being "
+            "handled on shutdown."
+        )
+    if not await jobs_in_flight.wait(config.SHUTDOWN_TIMEOUT):
+        logging.error(
+            f"UNEXPECTED: {jobs_in_flight.count} jobs still running on "
+            "shutdown."
+        )
+
+    # let another instance take over right away
+    await leader.stop()
     await notify_on_shutdown(dispatcher)
     sched.shutdown()
+    # let messages that are already queued go out
+    await message_queue.stop(config.SHUTDOWN_TIMEOUT)
+    logging.info(f"Message queue: {message_queue.stats()}")
+    await bot.close_sessions()
+    await db.close()
+    await close_geocoder()
+    await stop_server()
+    logging.info(f"Time zone cache: {tz_cache_info()}")
 
 
 if __name__ == "__main__":
-    executor.start_polling(
-        dp, on_startup=on_startup, on_shutdown=on_shutdown, skip_updates=True
-    )
+    if config.USE_WEBHOOK:
+        executor.start_webhook(
+            dp,
+            webhook_path=config.WEBHOOK_PATH,
+            on_startup=on_startup,
+            on_shutdown=on_shutdown,
+            skip_updates=True,
+            check_ip=config.WEBHOOK_CHECK_IP,
+            host=config.WEBAPP_HOST,
+            port=config.WEBAPP_PORT,
+        )
+    else:
+        # docker stops containers with SIGTERM, shut down gracefully on it
+        # like on ctrl+c (aiohttp already does this in webhook mode)
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        executor.start_polling(
+            dp,
+            on_startup=on_startup,
+            on_shutdown=on_shutdown,
+            skip_updates=True,
+        )
@@ -0,0 +1,23 @@
+"""Offline benchmarks. Run them from the repository root with `python -m`.
+
+Benchmarks never talk to real services, so required settings get dummy
+values if they are not set.
+"""
+
+import os
+
+for name in (
+    "ADMIN",
+    "REDIS_HOST",
+    "REDIS_PORT",
+    "REDIS_DB",
+    "REDIS_PASSWORD",
+    "SUPABASE_KEY",
+):
+    os.environ.setdefault(name, "0")
+
+# default address of benchmarks.fake_postgrest.FakePostgrest
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:8765")
+
+# aiogram validates the token format
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
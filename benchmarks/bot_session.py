@@ -0,0 +1,138 @@
+"""Outgoing messages per second with different Bot API sessions.
+
+Messages are sent with `send_message` of the bot, `concurrency` at a time, in
+bursts (like reminders every minute) with a pause between them that's longer
+than aiogram's default keep-alive. The fake Bot API server runs in a separate
+process (so that it doesn't take the bot's CPU) and answers every request
+after `latency` seconds.
+
+    aiogram  aiogram's default session
+    pooled   `PooledBot` (aiohttp, connections kept open and reused)
+    httpx    `PooledBot` with `http2` (only with the h2 package installed;
+             the fake server has no TLS, so it's HTTP/1.1 here)
+
+For every session: messages per second in every burst and the number of
+connections the server saw opened.
+
+    python -m benchmarks.bot_session [--messages N] [--concurrency N]
+                                     [--bursts N] [--pause SECONDS]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import time
+from typing import List
+
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer
+
+from benchmarks.fake_telegram import FakeTelegram
+from data.config import BOT_TOKEN
+from utils.bot_session import PooledBot
+
+MESSAGES = 2000
+CONCURRENCY = 50
+BURSTS = 2
+# longer than aiogram's keep-alive (15 seconds)
+PAUSE = 20.0
+LATENCY = 0.02
+PORT = 8767
+SESSIONS = ["aiogram", "pooled", "httpx"]
+
+
+def serve(conn, latency: float):
+    """Run the fake Bot API, report its number of connections when asked."""
+    server = FakeTelegram(
+        latency=latency, rate=10**6, per_chat_interval=0, port=PORT
+    ).start()
+    conn.send("ready")
+
+    while conn.recv() == "connections":
+        conn.send(len(server.peers))
+    server.stop()
+
+
+def new_bot(name: str) -> Bot:
+    server = TelegramAPIServer.from_base(f"http://127.0.0.1:{PORT}")
+    if name == "aiogram":
+        return Bot(BOT_TOKEN, server=server)
+    return PooledBot(BOT_TOKEN, http2=name == "httpx", server=server)
+
+
+async def burst(bot: Bot, messages: int, concurrency: int) -> float:
+    """Send the messages, return how many were sent per second."""
+    chats = iter(range(messages))
+
+    async def send():
+        for chat in chats:
+            await bot.send_message(chat + 1, f"Reminder {chat}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send() for _ in range(concurrency)))
+    return messages / (time.perf_counter() - start)
+
+
+async def run(name: str, args) -> List[float]:
+    bot = new_bot(name)
+    rates = []
+
+    for i in range(args.bursts):
+        if i:
+            await asyncio.sleep(args.pause)
+        rates.append(await burst(bot, args.messages, args.concurrency))
+
+    if isinstance(bot, PooledBot):
+        await bot.close_sessions()
+    else:
+        await (await bot.get_session()).close()
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=MESSAGES)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--bursts", type=int, default=BURSTS)
+    parser.add_argument("--pause", type=float, default=PAUSE)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    conn, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(
+        target=serve, args=(child, args.latency), daemon=True
+    )
+    server.start()
+    conn.recv()
+
+    print(
+        f"{args.bursts} bursts of {args.messages} messages, "
+        f"{args.concurrency} at a time, {args.pause:.0f} s apart, "
+        f"{args.latency * 1000:.0f} ms per Bot API call\n"
+        f"{'session':<9}{'msg/s per burst':>24}{'connections':>13}",
+        flush=True,
+    )
+
+    for name in SESSIONS:
+        if name == "httpx" and importlib.util.find_spec("h2") is None:
+            print(f"{name:<9}{'skipped, h2 is not installed':>37}")
+            continue
+
+        conn.send("connections")
+        before = conn.recv()
+        rates = asyncio.run(run(name, args))
+        conn.send("connections")
+        opened = conn.recv() - before
+
+        rates = " ".join(f"{rate:.0f}" for rate in rates)
+        print(f"{name:<9}{rates:>24}{opened:>13}", flush=True)
+
+    conn.send("stop")
+    server.join()
+
+
+if __name__ == "__main__":
+    main()
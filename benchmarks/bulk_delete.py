@@ -0,0 +1,89 @@
+"""Cleaning up countdowns that end together: one by one vs in bulk.
+
+A lot of countdowns end at midnight. They are cleaned up with a
+`goodbye_countdown` call each (all at once, limited by the db connection
+pool) and with one `goodbye_countdowns` call for the whole batch, against a
+fake PostgREST server with `latency` seconds per request. Messages are
+counted instead of sent.
+
+    python -m benchmarks.bulk_delete [countdowns] [latency]
+"""
+
+import asyncio
+import datetime as dt
+import logging
+import sys
+import time
+
+from benchmarks.fake_postgrest import FakePostgrest
+from benchmarks.fake_redis import patch_storage
+from loader import db, storage
+from utils.countdown_index import Countdown
+
+COUNTDOWNS = 1000
+LATENCY = 0.05
+MIDNIGHT = dt.datetime(2030, 1, 1, tzinfo=dt.timezone.utc)
+
+
+def rows(size: int):
+    return [
+        {
+            "tg_user_id": 100_000_000 + i,
+            "name": f"countdown {i}",
+            "date_time": MIDNIGHT.isoformat(),
+        }
+        for i in range(size)
+    ]
+
+
+async def run(server: FakePostgrest, size: int, bulk: bool):
+    import handlers.delete_countdown as delete_countdown
+
+    sent = []
+
+    async def send_message(user_id: int, text: str):
+        sent.append(user_id)
+
+    delete_countdown.send_message = send_message
+    server.tables["Countdowns"] = rows(size)
+    server.requests = 0
+    ended = [Countdown.from_row(r["tg_user_id"], r) for r in rows(size)]
+
+    start = time.perf_counter()
+    if bulk:
+        await delete_countdown.goodbye_countdowns(ended)
+    else:
+        await asyncio.gather(
+            *(
+                delete_countdown.goodbye_countdown(c.user_id, c.name)
+                for c in ended
+            )
+        )
+    elapsed = time.perf_counter() - start
+
+    assert not server.tables["Countdowns"] and len(sent) == size
+    await db.close()
+
+    print(
+        f"{'bulk' if bulk else 'one by one':<12}{elapsed:>8.2f} s"
+        f"{server.requests:>10} db requests"
+    )
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else COUNTDOWNS
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else LATENCY
+
+    logging.disable(logging.CRITICAL)
+    server = FakePostgrest(latency=latency).start()
+    patch_storage(storage)
+
+    print(f"{size} countdowns, {latency * 1000:.0f} ms per db request")
+    for bulk in (False, True):
+        asyncio.run(run(server, size, bulk))
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
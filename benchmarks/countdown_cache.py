@@ -0,0 +1,148 @@
+"""Db requests per /my_countdowns browse session with the countdown cache.
+
+Every user opens /my_countdowns, looks at three of their countdowns, then
+starts /new_countdown, picks a format, types a name (which is checked against
+their countdown names) and cancels. All users do that three times: with
+nothing cached, with the countdowns cached in memory and in redis, and with
+only redis (the in-memory cache cleared, like after a restart). The Bot API,
+PostgREST and redis are fakes (5 ms, 20 ms and 1 ms per round trip).
+
+    python -m benchmarks.countdown_cache [users]
+"""
+
+import asyncio
+import logging
+import sys
+import time
+from typing import List
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+
+import handlers
+from benchmarks.fake_postgrest import FakePostgrest
+from benchmarks.fake_redis import patch_storage
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.startup import synthetic_countdowns
+from loader import bot, db, dp, storage
+from middlewares.state_session import StateSessionMiddleware
+from utils import countdown_cache
+
+USERS = 200
+# handlers of /my_countdowns, /new_countdown and /cancel are throttled
+THROTTLE_RATE = 3
+
+
+def browse_session(user_id: int, first_update_id: int) -> List[dict]:
+    """Updates sent by one user."""
+    user = {"id": user_id, "is_bot": False, "first_name": f"user {user_id}"}
+    chat = {"id": user_id, "type": "private"}
+    # countdowns of the user (see synthetic_countdowns)
+    cd_names = [f"countdown {(user_id - 1) * 3 + i}" for i in range(3)]
+
+    def message(text: str) -> dict:
+        entities = []
+        if text.startswith("/"):
+            entities.append(
+                {"type": "bot_command", "offset": 0, "length": len(text)}
+            )
+        return {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": user,
+            "text": text,
+            "entities": entities,
+        }
+
+    def callback(data: str) -> dict:
+        return {
+            "id": str(user_id),
+            "from": user,
+            "message": message("Please choose a countdown:"),
+            "chat_instance": str(user_id),
+            "data": data,
+        }
+
+    updates = [
+        {"message": message("/my_countdowns")},
+        *({"callback_query": callback(f"countdown:{n}")} for n in cd_names),
+        {"message": message("/new_countdown")},
+        {"message": message("1")},
+        {"message": message("Graduation")},
+        {"message": message("/cancel")},
+    ]
+    for i, update in enumerate(updates):
+        update["update_id"] = first_update_id + i
+    return updates
+
+
+async def browse(updates: List[dict]):
+    for update in updates:
+        # a task per update like the dispatcher does
+        await asyncio.ensure_future(
+            dp.updates_handler.notify(types.Update(**update))
+        )
+
+
+async def benchmark(users: int, postgrest: FakePostgrest):
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+
+    print(
+        f"{'round':<16}{'sessions':>9}{'db req/session':>16}"
+        f"{'memory':>8}{'redis':>7}{'db':>5}"
+    )
+
+    for round_, name in enumerate(("nothing cached", "cached", "redis only")):
+        if name == "redis only":
+            countdown_cache.local_cache.__init__(
+                countdown_cache.local_cache.maxsize,
+                countdown_cache.local_cache.ttl,
+            )
+
+        requests = postgrest.requests
+        before = countdown_cache.cache_info()
+
+        await asyncio.gather(
+            *(
+                browse(browse_session(user, (round_ * users + user) * 10))
+                for user in range(1, users + 1)
+            )
+        )
+
+        after = countdown_cache.cache_info()
+        lookups = [after[k] - before[k] for k in after]
+        print(
+            f"{name:<16}{users:>9}"
+            f"{(postgrest.requests - requests) / users:>16.2f}"
+            f"{lookups[0]:>8}{lookups[1]:>7}{lookups[2]:>5}",
+            flush=True,
+        )
+
+        await asyncio.sleep(THROTTLE_RATE)
+
+    await (await bot.get_session()).close()
+    await db.close()
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else USERS
+
+    logging.disable(logging.CRITICAL)
+    patch_storage(storage, latency=0.001)
+    dp.middleware.setup(StateSessionMiddleware(storage))
+
+    telegram = FakeTelegram(latency=0.005, rate=10**6, per_chat_interval=0)
+    bot.server = TelegramAPIServer.from_base(telegram.start().url)
+    postgrest = FakePostgrest(latency=0.02).start()
+    postgrest.tables["Countdowns"] = list(synthetic_countdowns(3 * users))
+
+    asyncio.run(benchmark(users, postgrest))
+
+    postgrest.stop()
+    telegram.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Memory per countdown: row dicts and clean up jobs vs the countdown index.
+
+Countdowns are kept as:
+
+    rows    Countdowns rows as decoded from PostgREST (what the cache and
+            the loaders used to hold)
+    jobs    an apscheduler clean up job per countdown, the way they used to
+            be added (user id, name and date string args)
+    index   `Countdown` records in the `CountdownIndex` (with their clean
+            ups in its wheel), half of them with daily reminders on
+
+Every structure is built in a separate process from countdowns generated one
+by one, and its memory is the growth of the peak RSS while building it. Ends
+are increasing, so that apscheduler adds every job at the end of its list.
+
+    python -m benchmarks.countdown_memory [sizes...]
+"""
+
+import datetime as dt
+import subprocess
+import sys
+import time
+import uuid
+
+from apscheduler.jobstores.memory import MemoryJobStore
+
+from benchmarks.reminders import Scheduler, peak_rss
+from utils.countdown_index import CountdownIndex
+
+SIZES = [1_000_000]
+START = dt.datetime(2030, 1, 1, tzinfo=dt.timezone.utc)
+
+
+def rows(size: int):
+    # spread over a year
+    step = 365 * 24 * 60 * 60 / size
+    for i in range(size):
+        end = START + dt.timedelta(seconds=int(i * step))
+        yield {
+            "id": i + 1,
+            "tg_user_id": 100_000_000 + i // 3,
+            "name": f"countdown {i}",
+            "date_time": end.isoformat(),
+            "reminders": i % 2 == 0,
+            "cd_format": i % 2 + 1,
+        }
+
+
+def build_rows(size: int):
+    return list(rows(size))
+
+
+def build_jobs(size: int):
+    def scheduled_goodbye(*args):
+        pass
+
+    sched = Scheduler(timezone="UTC")
+    store = MemoryJobStore()
+    sched.add_jobstore(store)
+    sched.state = 1  # STATE_RUNNING, so jobs are added to the store
+
+    for row in rows(size):
+        user_id, name = row["tg_user_id"], row["name"]
+        run_dt = dt.datetime.fromisoformat(row["date_time"]) + dt.timedelta(
+            seconds=10
+        )
+        sched.add_job(
+            scheduled_goodbye,
+            args=[user_id, name, row["date_time"]],
+            trigger="date",
+            id=str(uuid.uuid5(uuid.NAMESPACE_DNS, f"bye {user_id} {name}")),
+            run_date=run_dt,
+            replace_existing=True,
+            misfire_grace_time=None,
+        )
+
+    return store
+
+
+def build_index(size: int):
+    index = CountdownIndex()
+
+    for row in rows(size):
+        user_id, name = row["tg_user_id"], row["name"]
+        if row["reminders"]:
+            index.set_reminders(
+                user_id, name, row["date_time"], row["cd_format"]
+            )
+        else:
+            index.add(user_id, name, row["date_time"])
+
+    return index
+
+
+APPROACHES = {"rows": build_rows, "jobs": build_jobs, "index": build_index}
+
+
+def main():
+    if sys.argv[1:2] == ["--run"]:
+        name, size = sys.argv[2], int(sys.argv[3])
+
+        before = peak_rss()
+        start = time.perf_counter()
+        # peak RSS is a high-water mark, it stays after the structure is gone
+        APPROACHES[name](size)
+        elapsed = time.perf_counter() - start
+        memory = peak_rss() - before
+
+        print(
+            f"{name:<8}{size:>10}{memory / 2**20:>10.1f}"
+            f"{memory / size:>8.0f}{elapsed:>10.2f}",
+            flush=True,
+        )
+        return
+
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+
+    print(
+        f"{'kept as':<8}{'size':>10}{'MiB':>10}{'B/cd':>8}{'build s':>10}",
+        flush=True,
+    )
+
+    for size in sizes:
+        for name in APPROACHES:
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.countdown_memory",
+                    "--run",
+                    name,
+                    str(size),
+                ]
+            )
+
+
+if __name__ == "__main__":
+    main()
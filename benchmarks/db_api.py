@@ -0,0 +1,66 @@
+"""Updates/sec with blocking vs async db queries under simulated latency.
+
+Every simulated update does what `/start` does: one time zone lookup. The
+"before" case does it with a blocking request inside the coroutine (like the
+supabase-py client did), the "after" case uses `utils.db_api.PostgrestClient`.
+
+Run from the repository root:
+
+    python -m benchmarks.db_api
+"""
+
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fake_postgrest import FakePostgrest
+from utils.db_api import PostgrestClient
+
+UPDATES = 100
+LATENCY = 0.2
+
+
+async def blocking_updates(url: str) -> float:
+    client = httpx.Client(base_url=f"{url}/rest/v1")
+
+    async def handle(user_id: int):
+        client.get(
+            "/Accounts",
+            params={"select": "time_zone", "tg_user_id": f"eq.{user_id}"},
+        )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handle(i) for i in range(UPDATES)))
+    elapsed = time.perf_counter() - start
+
+    client.close()
+    return UPDATES / elapsed
+
+
+async def async_updates(url: str) -> float:
+    db = PostgrestClient(url, "key", max_connections=50)
+
+    async def handle(user_id: int):
+        await db.select("Accounts", "time_zone", tg_user_id=user_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handle(i) for i in range(UPDATES)))
+    elapsed = time.perf_counter() - start
+
+    await db.close()
+    return UPDATES / elapsed
+
+
+def main():
+    server = FakePostgrest(latency=LATENCY).start()
+
+    print(f"{UPDATES} updates, {LATENCY * 1000:.0f} ms backend latency")
+    print(f"blocking: {asyncio.run(blocking_updates(server.url)):8.1f} upd/s")
+    print(f"async:    {asyncio.run(async_updates(server.url)):8.1f} upd/s")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Clean up scheduling: an apscheduler date job per countdown vs the wheel.
+
+Countdowns end at random seconds over a day. Each approach adds a clean up
+for every countdown (insert), cancels every other one (cancel, like deleted
+or renamed countdowns) and then expires the rest going through the day one
+tick per second, the way the clean up task does (expire). Numbers are
+thousands of operations per second; for expire, countdowns cleaned up per
+second of run time (ticks with nothing due included).
+
+    jobs    `sched.add_job` / `sched.remove_job` with a date trigger per
+            countdown, due jobs taken with `get_due_jobs` and removed after
+            they run (what the scheduler does with date jobs)
+    wheel   `ExpiryWheel` alone
+    index   `CountdownIndex`, which keeps the wheel in sync with the
+            countdowns (`add` / `remove` / `ended`)
+
+    python -m benchmarks.expiry_wheel [sizes...]
+"""
+
+import datetime as dt
+import random
+import sys
+import time
+
+from apscheduler.jobstores.memory import MemoryJobStore
+
+from benchmarks.reminders import Scheduler
+from utils.countdown_index import Countdown, CountdownIndex
+from utils.expiry_wheel import ExpiryWheel
+
+SIZES = [10_000, 100_000]
+START = int(dt.datetime(2030, 1, 1, tzinfo=dt.timezone.utc).timestamp())
+DAY = 24 * 60 * 60
+DELAY = 10
+
+
+def countdowns(size: int):
+    rng = random.Random(42)
+    return [
+        Countdown(i, f"countdown {i}", START + rng.randrange(DAY))
+        for i in range(size)
+    ]
+
+
+def timed(run) -> float:
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def jobs(records):
+    def scheduled_goodbye(*args):
+        pass
+
+    sched = Scheduler(timezone="UTC")
+    store = MemoryJobStore()
+    sched.add_jobstore(store)
+    sched.state = 1  # STATE_RUNNING, so jobs are added to the store
+    run_dates = {
+        c: dt.datetime.fromtimestamp(c.end + DELAY, dt.timezone.utc)
+        for c in records
+    }
+    expired = []
+
+    def insert():
+        for c in records:
+            sched.add_job(
+                scheduled_goodbye,
+                args=[c.user_id, c.name, c.date_time],
+                trigger="date",
+                id=f"bye {c.user_id} {c.name}",
+                run_date=run_dates[c],
+                replace_existing=True,
+                misfire_grace_time=None,
+            )
+
+    def cancel():
+        for c in records[::2]:
+            sched.remove_job(f"bye {c.user_id} {c.name}")
+
+    def expire():
+        for second in range(START, START + DAY + DELAY + 1):
+            now = dt.datetime.fromtimestamp(second, dt.timezone.utc)
+            for job in store.get_due_jobs(now):
+                expired.append(job)
+                store.remove_job(job.id)
+
+    return timed(insert), timed(cancel), timed(expire), len(expired)
+
+
+def wheel(records):
+    wheel = ExpiryWheel()
+    expired = []
+
+    def insert():
+        for c in records:
+            wheel.add(c, c.end + DELAY)
+
+    def cancel():
+        for c in records[::2]:
+            wheel.cancel(c, c.end + DELAY)
+
+    def expire():
+        wheel.expire(START - 1)
+        for second in range(START, START + DAY + DELAY + 1):
+            expired.extend(wheel.expire(second))
+
+    return timed(insert), timed(cancel), timed(expire), len(expired)
+
+
+def index(records):
+    index = CountdownIndex(cleanup_delay=DELAY)
+    rows = [(c.user_id, c.name, c.date_time) for c in records]
+    expired = []
+
+    def insert():
+        for row in rows:
+            index.add(*row)
+
+    def cancel():
+        for user_id, name, _ in rows[::2]:
+            index.remove(user_id, name)
+
+    def expire():
+        index.ended(START - 1)
+        for second in range(START, START + DAY + DELAY + 1):
+            expired.extend(index.ended(second))
+
+    return timed(insert), timed(cancel), timed(expire), len(expired)
+
+
+APPROACHES = {"jobs": jobs, "wheel": wheel, "index": index}
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+
+    print(
+        f"{'approach':<8}{'size':>10}{'insert k/s':>12}{'cancel k/s':>12}"
+        f"{'expire k/s':>12}{'expired':>9}"
+    )
+
+    for size in sizes:
+        records = countdowns(size)
+
+        for name, approach in APPROACHES.items():
+            insert, cancel, expire, expired = approach(records)
+            print(
+                f"{name:<8}{size:>10}{size / insert / 1000:>12.0f}"
+                f"{size // 2 / cancel / 1000:>12.0f}"
+                f"{expired / expire / 1000:>12.0f}{expired:>9}",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Several bot instances with leader election: duplicates and failover.
+
+The schedule store is filled with one countdown per chat: daily reminders
+due at every minute of the run and countdowns that end (and get cleaned up)
+during it. Then `instances` bot processes are started with leader election
+on (3 s lease) and the leader is killed with SIGKILL in the middle of the
+run, right before reminders are due. Every message the fake Bot API server
+gets is checked in the end: each chat should get exactly one message.
+
+Instances share the schedule through redis, so this needs a real redis
+server (e.g. the one from docker-compose). It's flushed of the schedule
+keys first.
+
+    REDIS_HOST=127.0.0.1 REDIS_PORT=6379 REDIS_PASSWORD= \\
+        python -m benchmarks.failover [instances] [minutes]
+"""
+
+import asyncio
+import datetime as dt
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from aiogram.bot.api import TelegramAPIServer
+
+from benchmarks.fake_postgrest import FakePostgrest
+from benchmarks.fake_telegram import FakeTelegram
+from loader import bot, leader, sched, storage
+from utils import schedule_store
+
+INSTANCES = 3
+MINUTES = 4
+REMINDERS_PER_MINUTE = 20
+CLEANUPS_PER_MINUTE = 5
+LEADER_TTL = 3
+# clean ups run 10 seconds (plus up to CLEANUP_WINDOW) after the end
+GRACE = 30
+
+
+def schedule(start: dt.datetime, minutes: int):
+    """Reminders and clean ups due at every minute from `start`."""
+    reminders, cleanups = [], []
+    chat = 0
+
+    for minute in range(minutes):
+        at = start + dt.timedelta(minutes=minute)
+
+        for _ in range(REMINDERS_PER_MINUTE):
+            chat += 1
+            # ends in a month, reminded every day at this minute
+            end = (at + dt.timedelta(days=30)).isoformat()
+            reminders.append((chat, f"countdown {chat}", end, 1))
+
+        for _ in range(CLEANUPS_PER_MINUTE):
+            chat += 1
+            cleanups.append((chat, f"countdown {chat}", at.isoformat()))
+
+    return reminders, cleanups
+
+
+async def reset_redis():
+    redis = await storage.redis()
+    keys = await redis.keys("schedule:*")
+    if keys:
+        await redis.delete(*keys)
+
+
+async def current_leader() -> str:
+    redis = await storage.redis()
+    return await redis.get(leader.key) or ""
+
+
+async def run(instances: int, minutes: int):
+    now = dt.datetime.now(dt.timezone.utc).replace(second=0, microsecond=0)
+    start = now + dt.timedelta(minutes=1)
+    reminders, cleanups = schedule(start, minutes)
+
+    await reset_redis()
+    await schedule_store.save(reminders, cleanups)
+    await schedule_store.mark_synced()
+
+    postgrest = FakePostgrest(latency=0.02).start()
+    postgrest.tables["Countdowns"] = [
+        {"tg_user_id": chat, "name": name, "date_time": end}
+        for chat, name, end in cleanups
+    ]
+    telegram = FakeTelegram(latency=0.02, rate=10**6, per_chat_interval=0)
+    telegram.start()
+
+    env = dict(
+        os.environ,
+        LEADER_ELECTION="true",
+        LEADER_TTL=str(LEADER_TTL),
+        FAKE_TELEGRAM_URL=telegram.url,
+    )
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.failover", "--worker"], env=env
+        )
+        for _ in range(instances)
+    ]
+
+    # kill the leader just before a tick, so that the next leader has to
+    # catch up on that minute
+    kill_at = start + dt.timedelta(minutes=minutes // 2, seconds=58)
+    end_at = start + dt.timedelta(minutes=minutes, seconds=GRACE)
+    killed, killed_at, failover = None, 0.0, None
+
+    while dt.datetime.now(dt.timezone.utc) < end_at:
+        await asyncio.sleep(0.1)
+        holder = await current_leader()
+        pid = int(holder.rsplit(":", 1)[1]) if holder else None
+
+        if killed is None and dt.datetime.now(dt.timezone.utc) >= kill_at:
+            print(f"killing the leader (pid {pid})", flush=True)
+            os.kill(pid, signal.SIGKILL)  # type: ignore
+            killed, killed_at = pid, time.monotonic()
+        elif killed and failover is None and pid and pid != killed:
+            failover = time.monotonic() - killed_at
+            print(f"pid {pid} took over in {failover:.1f} s", flush=True)
+
+    for process in workers:
+        process.terminate()
+        process.wait()
+
+    postgrest.stop()
+    telegram.stop()
+
+    received = Counter(int(chat) for chat, _ in telegram.messages)
+    reminder_chats = {chat for chat, *_ in reminders}
+    cleanup_chats = {chat for chat, *_ in cleanups}
+
+    for kind, chats in (
+        ("reminders", reminder_chats),
+        ("clean ups", cleanup_chats),
+    ):
+        sent = sum(1 for chat in chats if received[chat])
+        duplicates = sum(
+            received[chat] - 1 for chat in chats if received[chat] > 1
+        )
+        print(f"{kind:<10} {sent}/{len(chats)} sent, {duplicates} duplicates")
+
+    await (await storage.redis()).close()
+
+
+def worker():
+    from handlers.schedule_jobs import start_scheduling, stop_scheduling
+    from utils.send_message import message_queue
+
+    bot.server = TelegramAPIServer.from_base(os.environ["FAKE_TELEGRAM_URL"])
+
+    async def serve():
+        sched.start()
+        message_queue.start()
+        await leader.start(start_scheduling, stop_scheduling)
+        await asyncio.Event().wait()
+
+    asyncio.get_event_loop().run_until_complete(serve())
+
+
+def main():
+    if sys.argv[1:2] == ["--worker"]:
+        logging.disable(logging.INFO)
+        worker()
+        return
+
+    instances = int(sys.argv[1]) if len(sys.argv) > 1 else INSTANCES
+    minutes = int(sys.argv[2]) if len(sys.argv) > 2 else MINUTES
+
+    logging.disable(logging.CRITICAL)
+    print(f"{instances} instances, {minutes} minutes", flush=True)
+    asyncio.get_event_loop().run_until_complete(run(instances, minutes))
+
+
+if __name__ == "__main__":
+    main()
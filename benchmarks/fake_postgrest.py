@@ -0,0 +1,127 @@
+"""Local stand-in for the Supabase REST (PostgREST) API used in benchmarks.
+
+Tables are kept in memory and only the small subset of PostgREST that the bot
+uses is supported (column selection, `eq`/`in`/`gt`/`gte`/`lt`/`lte` filters,
+`order` and `limit`). Every request is delayed by `latency` seconds to mimic
+the round trip to a remote database.
+"""
+
+import asyncio
+import bisect
+import itertools
+from typing import Dict, List
+
+from aiohttp import web
+
+from benchmarks.fake_server import BackgroundServer
+
+
+def _cast(column_value, value: str):
+    """Cast filter value to the type of the column."""
+    if isinstance(column_value, bool):
+        return value.lower() == "true"
+    if isinstance(column_value, int):
+        return int(value)
+    return value
+
+
+OPERATORS = {
+    "eq": lambda a, b: a == _cast(a, b),
+    "gt": lambda a, b: a > _cast(a, b),
+    "gte": lambda a, b: a >= _cast(a, b),
+    "lt": lambda a, b: a < _cast(a, b),
+    "lte": lambda a, b: a <= _cast(a, b),
+    "in": lambda a, b: a
+    in [_cast(a, v.strip('"')) for v in b[1:-1].split(",")],
+}
+
+
+class FakePostgrest(BackgroundServer):
+    """In-memory PostgREST server running in a background thread."""
+
+    def __init__(self, latency: float = 0.2, port: int = 8765):
+        super().__init__(port)
+        self.latency = latency
+        self.tables: Dict[str, List[dict]] = {"Accounts": [], "Countdowns": []}
+        self.requests = 0
+        self._last_id = 0
+
+    def _matches(self, row: dict, query) -> bool:
+        for column, condition in query.items():
+            if column in ("select", "order", "limit", "offset"):
+                continue
+            operator, _, value = condition.partition(".")
+            if not OPERATORS[operator](row.get(column), value):
+                return False
+        return True
+
+    def _filter(self, table: str, query) -> List[dict]:
+        rows = self.tables[table]
+
+        if query.get("order") == "id.asc" and "limit" in query:
+            # keyset pagination: rows are kept in id order, so stop as soon
+            # as the page is full instead of scanning the whole table
+            start = 0
+            if query.get("id", "").startswith("gt."):
+                ids = [r["id"] for r in rows]
+                start = bisect.bisect_right(ids, int(query["id"][3:]))
+
+            page = []
+            for row in itertools.islice(rows, start, None):
+                if self._matches(row, query):
+                    page.append(row)
+                    if len(page) == int(query["limit"]):
+                        break
+            return page
+
+        rows = [r for r in rows if self._matches(r, query)]
+
+        if "order" in query:
+            column, _, direction = query["order"].partition(".")
+            rows.sort(key=lambda r: r[column], reverse=direction == "desc")
+        if "limit" in query:
+            rows = rows[: int(query["limit"])]
+
+        return rows
+
+    @staticmethod
+    def _columns(rows: List[dict], query) -> List[dict]:
+        columns = query.get("select", "*")
+        if columns == "*":
+            return rows
+        columns = columns.split(",")
+        return [{c: r.get(c) for c in columns} for r in rows]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+
+        table = request.match_info["table"]
+        query = request.query
+
+        if request.method == "GET":
+            rows = self._columns(self._filter(table, query), query)
+        elif request.method == "POST":
+            rows = await request.json()
+            if isinstance(rows, dict):
+                rows = [rows]
+            for row in rows:
+                self._last_id += 1
+                row.setdefault("id", self._last_id)
+            self.tables[table].extend(rows)
+        elif request.method == "PATCH":
+            values = await request.json()
+            rows = self._filter(table, query)
+            for row in rows:
+                row.update(values)
+        else:
+            rows = self._filter(table, query)
+            ids = set(map(id, rows))
+            self.tables[table] = [
+                r for r in self.tables[table] if id(r) not in ids
+            ]
+
+        return web.json_response(rows)
+
+    def setup(self, app: web.Application):
+        app.router.add_route("*", "/rest/v1/{table}", self.handle)
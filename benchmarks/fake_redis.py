@@ -0,0 +1,177 @@
+"""In-memory stand-in for the aioredis client used in benchmarks.
+
+Only the commands the bot uses are implemented. Values are stored as strings
+like the real client returns them (aiogram connects with
+`decode_responses=True`). Every round trip (a command or a whole pipeline)
+takes `latency` seconds. Lua scripts are run by Python versions of them.
+"""
+
+import asyncio
+import time
+
+from utils import countdown_cache
+
+
+class FakeRedis:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data = {}
+        self.expires = {}
+        self.commands = 0
+        self.round_trips = 0
+        self._pipelined = False
+
+    async def _call(self):
+        self.commands += 1
+        if not self._pipelined:
+            await self._round_trip()
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _get(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires < time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    async def get(self, key):
+        await self._call()
+        return self._get(key)
+
+    async def mget(self, *keys):
+        await self._call()
+        return [self._get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, nx=False, px=None):
+        await self._call()
+        if nx and self._get(key) is not None:
+            return None
+        self.data[key] = str(value)
+        self.expires.pop(key, None)
+        if ex or px:
+            self.expires[key] = time.monotonic() + (ex or px / 1000)
+        return True
+
+    async def delete(self, *keys):
+        await self._call()
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def exists(self, *keys):
+        await self._call()
+        return sum(self._get(key) is not None for key in keys)
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        await self._call()
+        hash_ = self.data.setdefault(key, {})
+        if field is not None:
+            hash_[field] = str(value)
+        for field, value in (mapping or {}).items():
+            hash_[field] = str(value)
+
+    async def hget(self, key, field):
+        await self._call()
+        return self.data.get(key, {}).get(field)
+
+    async def hdel(self, key, *fields):
+        await self._call()
+        hash_ = self.data.get(key, {})
+        return sum(hash_.pop(field, None) is not None for field in fields)
+
+    async def hgetall(self, key):
+        await self._call()
+        return dict(self.data.get(key, {}))
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        await self._call()
+        keys = keys_and_args[:numkeys]
+        args = [str(arg) for arg in keys_and_args[numkeys:]]
+        return SCRIPTS[script](self, keys, args)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues commands and runs them on `execute` (without a transaction)."""
+
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands.clear()
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append(getattr(self.redis, name)(*args, **kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        self.redis._pipelined = True
+        try:
+            results = [await command for command in self.commands]
+        finally:
+            self.redis._pipelined = False
+        self.commands.clear()
+
+        await self.redis._round_trip()
+        return results
+
+
+def _fill_countdowns(redis: FakeRedis, keys, args):
+    key, version_key = keys
+    if (redis._get(version_key) or "0") != args[0]:
+        return 0
+
+    fields = args[2:]
+    redis.data[key] = dict(zip(fields[::2], fields[1::2]))
+    redis.data[key][countdown_cache.VERSION_FIELD] = args[0]
+    return 1
+
+
+def _write_countdowns(redis: FakeRedis, keys, args):
+    key, version_key = keys
+    version = int(redis._get(version_key) or 0) + 1
+    redis.data[version_key] = str(version)
+
+    hash_ = redis.data.get(key)
+    if not hash_ or hash_[countdown_cache.VERSION_FIELD] != str(version - 1):
+        redis.data.pop(key, None)
+        return version
+
+    deleted = int(args[1])
+    for field in args[2 : 2 + deleted]:
+        hash_.pop(field, None)
+    changed = args[2 + deleted :]
+    hash_.update(zip(changed[::2], changed[1::2]))
+    hash_[countdown_cache.VERSION_FIELD] = str(version)
+    return version
+
+
+SCRIPTS = {
+    countdown_cache.FILL_SCRIPT: _fill_countdowns,
+    countdown_cache.WRITE_SCRIPT: _write_countdowns,
+}
+
+
+def patch_storage(storage, latency: float = 0.0) -> FakeRedis:
+    """Make the FSM storage use a fake redis client."""
+    fake = FakeRedis(latency)
+
+    async def redis():
+        return fake
+
+    storage.redis = redis
+    # states, data and throttling buckets go through the adapter, which has
+    # the same get/set/delete as the client
+    storage._get_adapter = redis
+    return fake
@@ -0,0 +1,45 @@
+"""Base for the local fake servers used in benchmarks."""
+
+import abc
+import asyncio
+import threading
+
+from aiohttp import web
+
+
+class BackgroundServer(abc.ABC):
+    """aiohttp server running in its own thread and event loop.
+
+    Subclasses add their routes in `setup`.
+    """
+
+    def __init__(self, port: int):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @abc.abstractmethod
+    def setup(self, app: web.Application):
+        """Add the server's routes to the app."""
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        self.setup(app)
+        runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", self.port)
+        self._loop.run_until_complete(site.start())
+        self._started.set()
+        self._loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,131 @@
+"""Local stand-in for the Telegram Bot API used in benchmarks.
+
+Every method succeeds after `latency` seconds. `sendMessage` enforces limits
+like Telegram does (`rate` messages per second overall and one message per
+second to the same chat) and answers with 429 flood control errors otherwise.
+Updates added with `push_updates` are served through long polling
+(`getUpdates`). `peers` are the client addresses requests came from, one for
+every connection opened to the server.
+"""
+
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from aiohttp import web
+
+from benchmarks.fake_server import BackgroundServer
+
+
+class FakeTelegram(BackgroundServer):
+    """Fake Bot API server running in a background thread."""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        rate: int = 30,
+        per_chat_interval: float = 1.0,
+        port: int = 8766,
+    ):
+        super().__init__(port)
+        self.latency = latency
+        self.rate = rate
+        self.per_chat_interval = per_chat_interval
+        self.calls = defaultdict(int)
+        self.flood_errors = 0
+        self.messages = []
+        self.peers = set()
+
+        self._sent = deque()
+        self._last_per_chat = {}
+        self._updates = []
+        self._new_updates = None
+
+    def _flood_wait(self, chat_id: str) -> int:
+        """Seconds to wait if sending now would exceed the limits, else 0."""
+        now = time.monotonic()
+
+        while self._sent and self._sent[0] < now - 1:
+            self._sent.popleft()
+
+        if len(self._sent) >= self.rate:
+            return 1
+        if now - self._last_per_chat.get(chat_id, 0) < self.per_chat_interval:
+            return 1
+
+        self._sent.append(now)
+        self._last_per_chat[chat_id] = now
+        return 0
+
+    def push_updates(self, updates: list):
+        """Make updates available to `getUpdates` (thread safe)."""
+
+        def push():
+            self._updates.extend(updates)
+            self._new_updates.set()
+
+        self._loop.call_soon_threadsafe(push)
+
+    async def get_updates(self, data: dict) -> list:
+        """Wait up to `timeout` seconds for updates after `offset`."""
+        offset = int(data.get("offset", 0))
+        # confirmed updates are forgotten, like telegram does
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(
+                    self._new_updates.wait(), float(data.get("timeout", 0))
+                )
+            except asyncio.TimeoutError:
+                pass
+
+        return self._updates[: int(data.get("limit", 100))]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        self.peers.add(request.transport.get_extra_info("peername"))
+        data = dict(await request.post())
+        await asyncio.sleep(self.latency)
+
+        if method == "getUpdates":
+            updates = await self.get_updates(data)
+            return web.json_response({"ok": True, "result": updates})
+
+        if method != "sendMessage":
+            return web.json_response({"ok": True, "result": True})
+
+        chat_id = data.get("chat_id", "0")
+        retry_after = self._flood_wait(chat_id)
+
+        if retry_after:
+            self.flood_errors += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after "
+                    f"{retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                },
+                status=429,
+            )
+
+        self.messages.append((chat_id, data.get("text")))
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": len(self.messages),
+                    "date": int(time.time()),
+                    "chat": {"id": int(chat_id), "type": "private"},
+                    "text": data.get("text"),
+                },
+            }
+        )
+
+    def setup(self, app: web.Application):
+        self._new_updates = asyncio.Event()
+        app.router.add_post("/bot{token}/{method}", self.handle)
@@ -0,0 +1,34 @@
+"""Latency of city name lookups answered by the bundled cities table.
+
+    python -m benchmarks.geocoding
+"""
+
+import asyncio
+import time
+
+from utils.get_coordinates import get_coordinates, load_cities
+
+QUERIES = ["Tashkent", "tashkent", "Toshkent", "Ташкент", "New York", "Berlin"]
+ROUNDS = 10000
+
+
+async def run():
+    for _ in range(ROUNDS):
+        for query in QUERIES:
+            await get_coordinates(query)
+
+
+def main():
+    start = time.perf_counter()
+    cities = load_cities()
+    print(f"table load: {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(f"names in table: {len(cities)}")
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    print(f"bundled hit: {elapsed / (ROUNDS * len(QUERIES)) * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
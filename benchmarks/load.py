@@ -0,0 +1,349 @@
+"""Load test of the whole dispatcher: handlers, middlewares and FSM storage.
+
+Synthetic users go through the bot's main flows. Their updates go straight
+to the dispatcher from loader (with the middlewares app.py sets up), the Bot
+API and PostgREST are fakes running in a separate process (so that they
+don't take the bot's CPU or show up in its allocations) and redis is the
+in-process fake. Each flow is run by all users at the same time.
+
+    new      /new_countdown, format, name, reminders, date and time
+    browse   /my_countdowns, two countdowns picked, back to the list
+    edit     /my_countdowns, a countdown picked, new date and time
+    delete   /my_countdowns, a countdown picked, deleted
+
+For every flow: updates per second, latency of an update (from reaching the
+dispatcher to its handlers finishing) and memory allocated per flow, traced
+with tracemalloc in a second, sequential pass (peak, and what's still
+allocated after the flow, e.g. caches).
+
+    python -m benchmarks.load [--users N] [--flows new,browse,...]
+                              [--save FILE] [--compare FILE]
+
+Results saved with --save can be compared against later with --compare,
+which exits with status 1 if a flow is slower (lower throughput or higher
+p99 latency, by more than --tolerance) or an update failed, so it can be
+used as a regression gate for performance work.
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import gc
+import json
+import logging
+import multiprocessing
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+
+import handlers
+import middlewares
+from benchmarks.fake_postgrest import FakePostgrest
+from benchmarks.fake_redis import patch_storage
+from benchmarks.fake_telegram import FakeTelegram
+from loader import bot, db, dp, storage
+from utils.send_message import message_queue
+
+USERS = 200
+# users whose flows are traced with tracemalloc (one after another)
+TRACED_USERS = 20
+TOLERANCE = 0.2
+TELEGRAM_LATENCY = 0.005
+DB_LATENCY = 0.005
+TELEGRAM_PORT = 8766
+COUNTDOWNS_PER_USER = 3
+FLOWS = ["new", "browse", "edit", "delete"]
+
+
+def flow(name: str) -> List[tuple]:
+    """("message", text) and ("callback", data) updates of a flow."""
+    if name == "new":
+        return [
+            ("message", "/new_countdown"),
+            ("message", "1"),
+            ("message", "Graduation"),
+            ("message", "Yes"),
+            ("message", "2031-05-01 12:00"),
+        ]
+    if name == "browse":
+        return [
+            ("message", "/my_countdowns"),
+            ("callback", "countdown:countdown 0"),
+            ("callback", "countdown:countdown 1"),
+            ("callback", "back_to_list"),
+        ]
+    if name == "edit":
+        return [
+            ("message", "/my_countdowns"),
+            ("callback", "countdown:countdown 0"),
+            ("callback", "edit_countdown"),
+            ("callback", "edit_dt"),
+            ("message", "2031-06-01 09:30"),
+        ]
+    if name == "delete":
+        return [
+            ("message", "/my_countdowns"),
+            ("callback", "countdown:countdown 0"),
+            ("callback", "delete_countdown"),
+            ("callback", "delete_confirmed"),
+        ]
+    raise ValueError(f"Unknown flow: {name}")
+
+
+def user_ids(flow_index: int, users: int) -> List[int]:
+    """Users of a flow, the timed ones and then the traced ones.
+
+    Every flow has its own users, so that flows don't see each other's
+    changes (or cached data).
+    """
+    first = (flow_index + 1) * 1_000_000
+    return list(range(first, first + users + TRACED_USERS))
+
+
+def seed(postgrest: FakePostgrest, ids: List[int]):
+    """Give every user a time zone and a few countdowns."""
+    end = dt.datetime(2031, 1, 1, 12, tzinfo=dt.timezone.utc)
+
+    for user_id in ids:
+        postgrest.tables["Accounts"].append(
+            {"tg_user_id": user_id, "time_zone": "Europe/Berlin"}
+        )
+        for i in range(COUNTDOWNS_PER_USER):
+            postgrest.tables["Countdowns"].append(
+                {
+                    "tg_user_id": user_id,
+                    "name": f"countdown {i}",
+                    "date_time": (end + dt.timedelta(days=i)).isoformat(),
+                    "reminders": i % 2 == 0,
+                    "cd_format": i % 2 + 1,
+                }
+            )
+
+
+def serve(ready, stop, ids: List[int], telegram_latency, db_latency):
+    """Run the fake Bot API and PostgREST until `stop` is set."""
+    telegram = FakeTelegram(
+        latency=telegram_latency,
+        rate=10**6,
+        per_chat_interval=0,
+        port=TELEGRAM_PORT,
+    ).start()
+    postgrest = FakePostgrest(latency=db_latency).start()
+    seed(postgrest, ids)
+
+    ready.set()
+    stop.wait()
+    postgrest.stop()
+    telegram.stop()
+
+
+def update(user_id: int, update_id: int, kind: str, text: str) -> types.Update:
+    user = {"id": user_id, "is_bot": False, "first_name": f"user {user_id}"}
+    chat = {"id": user_id, "type": "private"}
+
+    def message(text: str) -> dict:
+        entities = []
+        if text.startswith("/"):
+            entities.append(
+                {"type": "bot_command", "offset": 0, "length": len(text)}
+            )
+        return {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": user,
+            "text": text,
+            "entities": entities,
+        }
+
+    if kind == "message":
+        return types.Update(update_id=update_id, message=message(text))
+
+    callback = {
+        "id": str(update_id),
+        "from": user,
+        "message": message("Please choose a countdown:"),
+        "chat_instance": str(user_id),
+        "data": text,
+    }
+    return types.Update(update_id=update_id, callback_query=callback)
+
+
+async def run_user(user_id: int, steps: List[tuple], latencies, errors):
+    for i, (kind, text) in enumerate(steps):
+        start = time.perf_counter()
+        try:
+            # a task per update like the dispatcher does, aiogram keeps the
+            # user's state in a context variable while handling an update
+            await asyncio.ensure_future(
+                dp.updates_handler.notify(
+                    update(user_id, user_id * 10 + i, kind, text)
+                )
+            )
+        except Exception:
+            errors.append(user_id)
+            return
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_flow(name: str, timed: List[int], traced: List[int]) -> dict:
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    message_queue.start()
+    steps = flow(name)
+    latencies: List[float] = []
+    errors: List[int] = []
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(run_user(user, steps, latencies, errors) for user in timed)
+    )
+    elapsed = time.perf_counter() - start
+
+    peaks, retained = [], []
+    tracemalloc.start()
+    for user in traced:
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        await run_user(user, steps, [], errors)
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        retained.append(current - before)
+    tracemalloc.stop()
+
+    await message_queue.stop()
+    await (await bot.get_session()).close()
+    await db.close()
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        index = min(len(latencies) - 1, int(len(latencies) * p))
+        return latencies[index] * 1000 if latencies else 0.0
+
+    return {
+        "updates": len(latencies),
+        "errors": len(errors),
+        "updates_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "peak_kib": sum(peaks) / len(peaks) / 1024,
+        "retained_kib": sum(retained) / len(retained) / 1024,
+    }
+
+
+def regressions(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float
+) -> List[str]:
+    found = []
+
+    for name, result in results.items():
+        if result["errors"]:
+            found.append(f"{name}: {result['errors']} updates failed")
+
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["updates_per_s"] < base["updates_per_s"] * (1 - tolerance):
+            found.append(
+                f"{name}: {result['updates_per_s']:.0f} updates/s, was "
+                f"{base['updates_per_s']:.0f}"
+            )
+        if result["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            found.append(
+                f"{name}: p99 {result['p99_ms']:.1f} ms, was "
+                f"{base['p99_ms']:.1f} ms"
+            )
+
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=USERS)
+    parser.add_argument("--flows", default=",".join(FLOWS))
+    parser.add_argument("--save", help="save the results to this file")
+    parser.add_argument("--compare", help="compare with results in this file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument(
+        "--telegram-latency", type=float, default=TELEGRAM_LATENCY
+    )
+    parser.add_argument("--db-latency", type=float, default=DB_LATENCY)
+    args = parser.parse_args()
+
+    names = args.flows.split(",")
+    for name in names:
+        flow(name)
+
+    logging.disable(logging.CRITICAL)
+    users = {name: user_ids(FLOWS.index(name), args.users) for name in names}
+
+    ready, stop = multiprocessing.Event(), multiprocessing.Event()
+    servers = multiprocessing.Process(
+        target=serve,
+        args=(
+            ready,
+            stop,
+            [user for ids in users.values() for user in ids],
+            args.telegram_latency,
+            args.db_latency,
+        ),
+        daemon=True,
+    )
+    servers.start()
+    ready.wait()
+    bot.server = TelegramAPIServer.from_base(
+        f"http://127.0.0.1:{TELEGRAM_PORT}"
+    )
+
+    print(
+        f"{args.users} users per flow, {args.telegram_latency * 1000:.0f} ms "
+        f"per Bot API call, {args.db_latency * 1000:.0f} ms per db request\n"
+        f"{'flow':<8}{'updates':>8}{'errors':>7}{'upd/s':>8}{'p50 ms':>8}"
+        f"{'p95 ms':>8}{'p99 ms':>8}{'peak KiB':>10}{'kept KiB':>10}",
+        flush=True,
+    )
+
+    results = {}
+    for name in names:
+        # a fresh redis for every flow
+        patch_storage(storage)
+        ids = users[name]
+        result = results[name] = asyncio.run(
+            run_flow(name, ids[: args.users], ids[args.users :])
+        )
+        print(
+            f"{name:<8}{result['updates']:>8}{result['errors']:>7}"
+            f"{result['updates_per_s']:>8.0f}{result['p50_ms']:>8.1f}"
+            f"{result['p95_ms']:>8.1f}{result['p99_ms']:>8.1f}"
+            f"{result['peak_kib']:>10.1f}{result['retained_kib']:>10.1f}",
+            flush=True,
+        )
+
+    stop.set()
+    servers.join()
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    found = regressions(results, baseline, args.tolerance)
+    for regression in found:
+        print(f"REGRESSION {regression}")
+    if found:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Loading countdowns on startup: one big select vs keyset pages.
+
+The fake PostgREST server (20 ms latency) runs in its own process so that
+only the bot side is measured. Each approach runs in a separate process and
+reports its duration and peak RSS. Countdowns are put into the countdown
+index as they are loaded, like `schedule_all` does.
+
+    python -m benchmarks.load_countdowns [countdowns]
+"""
+
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.fake_postgrest import FakePostgrest
+from benchmarks.startup import synthetic_countdowns
+
+COUNTDOWNS = 200_000
+
+
+def peak_rss_mib() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+async def load_all():
+    from loader import db
+    from utils.countdown_index import CountdownIndex
+
+    index = CountdownIndex()
+    countdowns = await db.select("Countdowns")
+    for countdown in countdowns:
+        index.set_reminders(
+            countdown["tg_user_id"],
+            countdown["name"],
+            countdown["date_time"],
+            countdown["cd_format"],
+        )
+    await db.close()
+
+
+async def load_paged():
+    from loader import db
+    from utils.get_db_data import iter_countdowns
+    from utils.countdown_index import CountdownIndex
+
+    index = CountdownIndex()
+    async for page in iter_countdowns("tg_user_id,name,date_time,cd_format"):
+        for countdown in page:
+            index.set_reminders(
+                countdown["tg_user_id"],
+                countdown["name"],
+                countdown["date_time"],
+                countdown["cd_format"],
+            )
+    await db.close()
+
+
+def main():
+    if sys.argv[1:2] == ["--serve"]:
+        server = FakePostgrest(latency=0.02)
+        server.tables["Countdowns"] = [
+            {"id": i + 1, **countdown}
+            for i, countdown in enumerate(
+                synthetic_countdowns(int(sys.argv[2]))
+            )
+        ]
+        server.start()
+        print("ready", flush=True)
+        sys.stdin.read()
+        return
+
+    if sys.argv[1:2] == ["--run"]:
+        start = time.perf_counter()
+        asyncio.run(load_all() if sys.argv[2] == "all" else load_paged())
+        elapsed = time.perf_counter() - start
+        print(
+            f"{sys.argv[2]:<6} {elapsed:6.2f} s, peak RSS {peak_rss_mib():.0f} MiB"
+        )
+        return
+
+    size = sys.argv[1] if len(sys.argv) > 1 else str(COUNTDOWNS)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load_countdowns", "--serve", size],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    server.stdout.readline()
+
+    print(f"{size} countdowns")
+    for mode in ("all", "paged"):
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.load_countdowns", "--run", mode]
+        )
+
+    server.stdin.close()
+    server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Overhead of the metrics: recording values and the metrics middleware.
+
+First the cost of recording one value (a histogram without and with labels,
+a counter) and of rendering /metrics. Then the conversations of
+benchmarks.state_session go through the dispatcher with and without
+`MetricsMiddleware`, against fakes without latency so that the time is the
+bot's own. Each run is a separate process, runs with and without the
+middleware take turns (`repeat` times each) and the mean throughputs are
+compared at the end.
+
+    python -m benchmarks.metrics [users] [repeat]
+"""
+
+import asyncio
+import logging
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+from aiogram.bot.api import TelegramAPIServer
+
+from benchmarks.fake_postgrest import FakePostgrest
+from benchmarks.fake_redis import patch_storage
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.startup import synthetic_countdowns
+from benchmarks.state_session import TimingMiddleware, benchmark
+from loader import bot, dp, storage
+from middlewares.metrics import MetricsMiddleware
+from middlewares.state_session import StateSessionMiddleware
+from utils.metrics import Counter, Histogram, Registry
+
+USERS = 200
+REPEAT = 5
+NUMBER = 100_000
+
+
+def micro():
+    registry = Registry()
+    histogram = registry.register(Histogram("h", "histogram"))
+    labelled = registry.register(Histogram("l", "labelled", ["kind"]))
+    counter = registry.register(Counter("c", "counter"))
+
+    for name, statement in (
+        ("histogram.observe", lambda: histogram.observe(0.03)),
+        ("labels().observe", lambda: labelled.labels("msg").observe(0.03)),
+        ("counter.inc", lambda: counter.inc()),
+    ):
+        elapsed = timeit.timeit(statement, number=NUMBER)
+        print(f"{name:<20}{elapsed / NUMBER * 10**9:>10.0f} ns")
+
+    for i in range(20):
+        labelled.labels(f"kind {i}").observe(0.03)
+    elapsed = timeit.timeit(registry.render, number=1000)
+    print(f"{'render (22 series)':<20}{elapsed / 1000 * 10**6:>10.0f} us")
+
+
+def run(name: str, users: int):
+    # metrics first, like middlewares/__init__.py does
+    if name == "metrics":
+        dp.middleware.setup(MetricsMiddleware())
+    patch_storage(storage)
+    dp.middleware.setup(StateSessionMiddleware(storage))
+    timing = TimingMiddleware()
+    dp.middleware.setup(timing)
+
+    logging.disable(logging.CRITICAL)
+    telegram = FakeTelegram(latency=0, rate=10**6, per_chat_interval=0)
+    bot.server = TelegramAPIServer.from_base(telegram.start().url)
+    postgrest = FakePostgrest(latency=0).start()
+    postgrest.tables["Countdowns"] = list(synthetic_countdowns(3 * users))
+
+    start = time.perf_counter()
+    asyncio.run(benchmark(users, timing))
+    elapsed = time.perf_counter() - start
+
+    times = sorted(timing.times)
+    count = len(times)
+    print(
+        f"{name:<10}{count:>8}{count / elapsed:>10.0f}"
+        f"{times[count // 2] * 1000:>10.2f}"
+        f"{times[min(count - 1, int(count * 0.99))] * 1000:>10.2f}",
+        flush=True,
+    )
+
+    postgrest.stop()
+    telegram.stop()
+
+
+def main():
+    if sys.argv[1:2] == ["--run"]:
+        run(sys.argv[2], int(sys.argv[3]))
+        return
+
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else USERS
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else REPEAT
+
+    micro()
+    print(
+        f"\n{'run':<10}{'updates':>8}{'upd/s':>10}{'p50 ms':>10}"
+        f"{'p99 ms':>10}",
+        flush=True,
+    )
+    rates = {"plain": [], "metrics": []}
+    for _ in range(repeat):
+        for name in rates:
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.metrics",
+                    "--run",
+                    name,
+                    str(users),
+                ],
+                stdout=subprocess.PIPE,
+                text=True,
+            ).stdout
+            print(output, end="", flush=True)
+            rates[name].append(float(output.split()[2]))
+
+    plain, metrics = (statistics.mean(rates[name]) for name in rates)
+    print(
+        f"\nmean upd/s: plain {plain:.0f} "
+        f"(stdev {statistics.stdev(rates['plain']):.0f}), metrics "
+        f"{metrics:.0f} (stdev {statistics.stdev(rates['metrics']):.0f}), "
+        f"overhead {(1 - metrics / plain) * 100:.1f}%"
+    )
+
+
+if __name__ == "__main__":
+    main()
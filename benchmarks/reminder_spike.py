@@ -0,0 +1,140 @@
+"""A spike of reminders at one minute: all at once vs the pipeline.
+
+Every reminder in the index is due at the same minute (like at midnight).
+They're sent the way `send_reminders` used to (claimed, rendered and handed
+to the message queue all at once, a coroutine per reminder) and through
+`fan_out_reminders`. Both send through the message queue to a fake Bot API
+server with Telegram-like limits, sped up to `rate` messages per second
+(the fake server shares the CPU, so it gets fewer through); redis is the
+in-process fake. Each run is a separate process.
+
+    first    seconds until the first reminder was delivered
+    drained  seconds until all of them were delivered
+    tasks    most asyncio tasks alive at once
+    memory   growth of peak RSS while sending
+    flood    flood control errors from the Bot API
+
+    python -m benchmarks.reminder_spike [reminders] [rate]
+"""
+
+import asyncio
+import datetime as dt
+import logging
+import resource
+import subprocess
+import sys
+import time
+
+from aiogram.bot.api import TelegramAPIServer
+
+import utils.send_message
+from benchmarks.fake_redis import patch_storage
+from benchmarks.fake_telegram import FakeTelegram
+from handlers.schedule_jobs import SENT_REMINDERS_TTL, fan_out_reminders
+from handlers.show_countdown import render_countdowns
+from loader import bot, countdowns, storage
+from utils import schedule_store
+from utils.send_message import MessageQueue, send_message
+
+REMINDERS = 20_000
+RATE = 1000
+MINUTE = dt.datetime(2030, 1, 1, tzinfo=dt.timezone.utc)
+
+
+async def at_once(minute: dt.datetime, due: list) -> int:
+    """How a minute's reminders used to be sent."""
+    claimed = await schedule_store.claim_sends(
+        [f"{r.user_id}:{r.name}:{minute:%Y%m%d%H%M}" for r in due],
+        SENT_REMINDERS_TTL,
+    )
+    due = [r for r, claim in zip(due, claimed) if claim]
+    texts = render_countdowns((r.name, r.end, r.cd_format) for r in due)
+    await asyncio.gather(
+        *(send_message(r.user_id, text) for r, text in zip(due, texts))
+    )
+    return len(due)
+
+
+async def spike(name: str, size: int, rate: float, server: FakeTelegram):
+    queue = utils.send_message.message_queue = MessageQueue(
+        rate=rate, workers=8, maxsize=10000
+    )
+    queue.start()
+
+    for i in range(size):
+        end = MINUTE + dt.timedelta(days=1 + i % 1000)
+        countdowns.set_reminders(i + 1, f"countdown {i}", end.isoformat(), 1)
+    due = countdowns.due(MINUTE)
+
+    most_tasks = 0
+    first = None
+    start = time.perf_counter()
+
+    async def watch():
+        nonlocal most_tasks, first
+        while True:
+            most_tasks = max(most_tasks, len(asyncio.all_tasks()))
+            if first is None and server.messages:
+                first = time.perf_counter() - start
+            await asyncio.sleep(0.01)
+
+    watcher = asyncio.ensure_future(watch())
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    send = fan_out_reminders if name == "pipeline" else at_once
+    await send(MINUTE, due)
+    await queue.stop()
+    drained = time.perf_counter() - start
+
+    watcher.cancel()
+    grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    await (await bot.get_session()).close()
+
+    assert len(server.messages) == size
+    print(
+        f"{name:<10}{first or drained:>8.2f}{drained:>10.2f}{most_tasks:>8}"
+        f"{grown / 1024:>10.1f}{server.flood_errors:>7}",
+        flush=True,
+    )
+
+
+def run(name: str, size: int, rate: float):
+    logging.disable(logging.CRITICAL)
+    server = FakeTelegram(latency=0.02, rate=int(rate) + 1).start()
+    bot.server = TelegramAPIServer.from_base(server.url)
+    patch_storage(storage)
+
+    asyncio.run(spike(name, size, rate, server))
+    server.stop()
+
+
+def main():
+    if sys.argv[1:2] == ["--run"]:
+        run(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]))
+        return
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else REMINDERS
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else RATE
+
+    print(f"{size} reminders at one minute, {rate:.0f} messages per second")
+    print(
+        f"{'approach':<10}{'first s':>8}{'drained s':>10}{'tasks':>8}"
+        f"{'memory MB':>10}{'flood':>7}",
+        flush=True,
+    )
+    for name in ("at once", "pipeline"):
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.reminder_spike",
+                "--run",
+                name,
+                str(size),
+                str(rate),
+            ]
+        )
+
+
+if __name__ == "__main__":
+    main()
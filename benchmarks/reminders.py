@@ -0,0 +1,162 @@
+"""Memory and per-minute tick cost: cron job per countdown vs the index.
+
+Reminder times are spread uniformly over the day. The tick cost is the work
+done to find the reminders due in one minute (and, for apscheduler, to
+compute the jobs' next run times). Every run happens in a separate process
+and memory is the growth of its peak RSS while building the structure.
+
+    python -m benchmarks.reminders [sizes...]
+
+The cron job approach is only measured up to 100k countdowns by default, as
+it takes minutes (and gigabytes) to build 1M apscheduler jobs.
+"""
+
+import datetime as dt
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.base import BaseScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from utils.countdown_index import CountdownIndex
+
+SIZES = [10_000, 100_000, 1_000_000]
+MAX_CRON_JOBS = 100_000
+NOW = dt.datetime(2030, 1, 1, 12, 0, tzinfo=dt.timezone.utc)
+
+
+class Scheduler(BaseScheduler):
+    """Scheduler that is never started, jobs only go to the job store."""
+
+    def shutdown(self, wait=True):
+        pass
+
+    def wakeup(self):
+        pass
+
+
+def countdowns(size: int):
+    rng = random.Random(42)
+    for i in range(size):
+        end = NOW + dt.timedelta(
+            days=rng.randint(1, 365), minutes=rng.randint(0, 1439)
+        )
+        yield i, f"countdown {i}", end.strftime("%Y-%m-%dT%H:%M:%S%z"), 1
+
+
+def peak_rss() -> int:
+    # kilobytes on linux, bytes on macos
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def measure(build):
+    before = peak_rss()
+    start = time.perf_counter()
+    structure = build()
+    elapsed = time.perf_counter() - start
+    return structure, peak_rss() - before, elapsed
+
+
+def cron_jobs(size: int):
+    def send(*args):
+        pass
+
+    def build():
+        sched = Scheduler(timezone="UTC")
+        store = MemoryJobStore()
+        sched.add_jobstore(store)
+        sched.state = 1  # STATE_RUNNING, so jobs are added to the store
+
+        for user_id, name, date_time, cd_format in countdowns(size):
+            end = dt.datetime.strptime(date_time, "%Y-%m-%dT%H:%M:%S%z")
+            trigger = CronTrigger(
+                day="*",
+                hour=end.hour,
+                minute=end.minute,
+                end_date=end,
+                timezone="UTC",
+            )
+            sched.add_job(
+                send,
+                args=[user_id, name, date_time, cd_format],
+                trigger=trigger,
+                id=f"{user_id} {name}",
+                next_run_time=trigger.get_next_fire_time(None, NOW),
+            )
+        return store
+
+    store, memory, elapsed = measure(build)
+
+    start = time.perf_counter()
+    due = store.get_due_jobs(NOW)
+    for job in due:
+        next_run = job.trigger.get_next_fire_time(NOW, NOW)
+        job._modify(next_run_time=next_run)
+        store.update_job(job)
+    tick = time.perf_counter() - start
+
+    return memory, elapsed, tick, len(due)
+
+
+def countdown_index(size: int):
+    def build():
+        index = CountdownIndex()
+        for countdown in countdowns(size):
+            index.set_reminders(*countdown)
+        return index
+
+    index, memory, elapsed = measure(build)
+
+    start = time.perf_counter()
+    due = index.due(NOW)
+    tick = time.perf_counter() - start
+
+    return memory, elapsed, tick, len(due)
+
+
+APPROACHES = {"cron": cron_jobs, "index": countdown_index}
+
+
+def main():
+    if sys.argv[1:2] == ["--run"]:
+        name, size = sys.argv[2], int(sys.argv[3])
+        memory, elapsed, tick, due = APPROACHES[name](size)
+        print(
+            f"{name:<8}{size:>10}{memory / 2**20:>10.1f}"
+            f"{memory / size:>8.0f}{elapsed:>10.2f}{tick * 1000:>10.2f}"
+            f"{due:>6}",
+            flush=True,
+        )
+        return
+
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+
+    print(
+        f"{'approach':<8}{'size':>10}{'MiB':>10}{'B/cd':>8}{'build s':>10}"
+        f"{'tick ms':>10}{'due':>6}",
+        flush=True,
+    )
+
+    for size in sizes:
+        for name in APPROACHES:
+            if name == "cron" and size > MAX_CRON_JOBS and not sys.argv[1:]:
+                continue
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.reminders",
+                    "--run",
+                    name,
+                    str(size),
+                ]
+            )
+
+
+if __name__ == "__main__":
+    main()
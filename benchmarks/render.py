@@ -0,0 +1,130 @@
+"""Countdown text rendering: humanize (as before) vs the epoch renderer.
+
+Renders a batch of reminders due in the same minute both ways and checks that
+every text is exactly the same, then times both. Countdown ends are random
+(up to 3 years away) plus the edge cases: right around whole days, half days
+left over from months, the last seconds and countdowns that have just ended.
+
+    python -m benchmarks.render [reminders]
+"""
+
+import datetime as dt
+import random
+import sys
+import time
+
+from humanize.time import precisedelta
+
+from handlers.show_countdown import render_countdown
+from utils.calculate_diff import DT_FORMAT, parse_dt
+
+REMINDERS = 10_000
+ROUNDS = 5
+
+
+def humanize_text(
+    cd_name: str, date_time: str, cd_format: int, now: dt.datetime
+) -> str:
+    """Text as send_countdown_details rendered it with humanize."""
+    dt_obj = dt.datetime.strptime(date_time, DT_FORMAT)
+    difference = dt_obj - now
+
+    if difference.seconds >= 86390 and difference.seconds <= 86400:
+        time_diff = precisedelta(
+            difference, minimum_unit="days", format="%0.f"
+        )
+    else:
+        time_diff = precisedelta(difference, format="%0.f")
+
+    text_divider = "=" * len(cd_name)
+    text = f"<b>{cd_name}</b>\n{text_divider}\n"
+
+    if cd_format == 1:
+        text += f"{time_diff} left"
+    else:
+        text += "<i>Time left:</i>\n"
+        time_diff_list = time_diff.split(", ")
+
+        if "and" in time_diff_list[-1]:
+            time_diff_list[-1:] = time_diff_list[-1].split(" and ")
+
+        for item in time_diff_list:
+            text += f"{item}\n"
+
+    return text
+
+
+def reminders(size: int, now: dt.datetime):
+    rng = random.Random(42)
+    edge_cases = [
+        dt.timedelta(days=rng.randint(0, 1000), seconds=-rng.randint(0, 12)),
+        dt.timedelta(days=rng.choice([31, 92, 366 + 31, 400])),
+        dt.timedelta(seconds=rng.randint(-90, 90)),
+        dt.timedelta(hours=rng.randint(0, 72)),
+    ]
+
+    for i in range(size):
+        if i % 4 == 0:
+            left = rng.choice(edge_cases)
+        else:
+            left = dt.timedelta(seconds=rng.randint(0, 3 * 365 * 24 * 3600))
+
+        end = (now + left).replace(microsecond=0)
+        yield f"countdown {i}", end.strftime(DT_FORMAT), rng.choice([1, 2])
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else REMINDERS
+
+    # reminders go out a little after the minute starts
+    now = dt.datetime.now(dt.timezone.utc).replace(second=1, microsecond=0)
+    now += dt.timedelta(microseconds=random.randint(0, 999_999))
+    now_us = int(now.timestamp()) * 1_000_000 + now.microsecond
+
+    batch = list(reminders(size, now))
+    ends = [(name, parse_dt(date_time), fmt) for name, date_time, fmt in batch]
+
+    mismatches = 0
+    for (name, date_time, fmt), (_, end, _) in zip(batch, ends):
+        expected = humanize_text(name, date_time, fmt, now)
+        rendered = render_countdown(name, end, fmt, now_us)
+        if rendered != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"mismatch:\n{expected!r}\n{rendered!r}")
+
+    print(f"{size} reminders, {mismatches} mismatches")
+
+    timings = {}
+    for name, render in (
+        (
+            "humanize",
+            lambda: [humanize_text(*r, now) for r in batch],
+        ),
+        (
+            "epoch",
+            lambda: [render_countdown(*r, now_us) for r in ends],
+        ),
+        (
+            "epoch + parse",
+            lambda: [
+                render_countdown(n, parse_dt(d), f, now_us)
+                for n, d, f in batch
+            ],
+        ),
+    ):
+        best = float("inf")
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            render()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+        print(
+            f"{name:<16}{best * 1000:8.1f} ms"
+            f"{best / size * 1e6:8.2f} us/message"
+            f"{timings['humanize'] / best:8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
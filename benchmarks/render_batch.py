@@ -0,0 +1,72 @@
+"""Time left for a minute's reminders: one by one vs in a batch.
+
+All reminders due in one minute end at that time of day, from tomorrow to
+three years from now. They're done with a `calculate_diff` call per
+countdown (its own "now" every time), with `render_countdown` per countdown
+and with `render_countdowns` for the whole batch. The batch texts are checked
+against the one by one ones (with the same "now"). Speedups are against
+`calculate_diff` and `render_countdown`.
+
+    python -m benchmarks.render_batch [sizes...]
+"""
+
+import datetime as dt
+import random
+import sys
+import time
+
+from handlers.show_countdown import render_countdown, render_countdowns
+from utils.calculate_diff import DT_FORMAT, calculate_diff, parse_dt
+
+SIZES = [1_000, 10_000, 100_000]
+ROUNDS = 5
+
+
+def due_reminders(size: int, minute: dt.datetime):
+    rng = random.Random(42)
+    for i in range(size):
+        end = minute + dt.timedelta(days=rng.randint(1, 3 * 365))
+        yield f"countdown {i}", end.strftime(DT_FORMAT), rng.choice([1, 2])
+
+
+def best_of(run) -> float:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+
+    minute = dt.datetime.now(dt.timezone.utc).replace(second=0, microsecond=0)
+    now = time.time_ns() // 1000
+
+    print(
+        f"{'reminders':>10}{'calculate_diff':>16}{'render_countdown':>18}"
+        f"{'render_countdowns':>19}{'speedup':>9}{'':>8}"
+    )
+
+    for size in sizes:
+        batch = list(due_reminders(size, minute))
+        # ends are kept parsed in the countdown index
+        countdowns = [(n, parse_dt(d), f) for n, d, f in batch]
+
+        one_by_one = [render_countdown(*c, now) for c in countdowns]
+        assert render_countdowns(countdowns, now) == one_by_one
+
+        diffs = best_of(lambda: [calculate_diff(d) for _, d, _ in batch])
+        single = best_of(lambda: [render_countdown(*c) for c in countdowns])
+        batched = best_of(lambda: render_countdowns(countdowns))
+
+        print(
+            f"{size:>10}{diffs * 1000:>13.1f} ms{single * 1000:>15.1f} ms"
+            f"{batched * 1000:>16.1f} ms{diffs / batched:>8.1f}x"
+            f"{single / batched:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Sending a burst of reminders: all at once vs through the message queue.
+
+A fake Bot API server enforces Telegram-like limits (30 messages per second,
+one message per second per chat) and answers with flood control errors.
+With `in_a_row`, every chat gets that many messages one after another (like
+a user's goodbye messages after deleting countdowns).
+
+    python -m benchmarks.send_queue [messages] [in_a_row]
+"""
+
+import asyncio
+import logging
+import sys
+import time
+
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.utils import exceptions
+
+from benchmarks.fake_telegram import FakeTelegram
+from loader import bot
+from utils.send_message import MessageQueue
+
+MESSAGES = 300
+# some users have several reminders at the same minute
+CHATS = 200
+IN_A_ROW = 1
+
+
+async def send_recursive(user_id: int, text: str):
+    """How messages used to be sent: sleep and retry on flood control."""
+    try:
+        await bot.send_message(user_id, text)
+    except exceptions.RetryAfter as e:
+        await asyncio.sleep(e.timeout)
+        return await send_recursive(user_id, text)
+
+
+async def burst(server: FakeTelegram, queued: bool) -> str:
+    server.flood_errors = 0
+    server.messages.clear()
+    start = time.perf_counter()
+
+    if queued:
+        queue = MessageQueue(rate=30, workers=8, maxsize=10000)
+        queue.start()
+        for i in range(MESSAGES):
+            await queue.put(i // IN_A_ROW % CHATS + 1, f"reminder {i}")
+        await queue.stop()
+    else:
+        await asyncio.gather(
+            *(
+                send_recursive(i // IN_A_ROW % CHATS + 1, f"reminder {i}")
+                for i in range(MESSAGES)
+            )
+        )
+
+    elapsed = time.perf_counter() - start
+    await (await bot.get_session()).close()
+
+    return (
+        f"{'queue' if queued else 'at once':<8} {len(server.messages)} sent in "
+        f"{elapsed:5.1f} s, {server.flood_errors} flood errors"
+    )
+
+
+def main():
+    global MESSAGES, IN_A_ROW
+    if len(sys.argv) > 1:
+        MESSAGES = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        IN_A_ROW = int(sys.argv[2])
+
+    logging.disable(logging.CRITICAL)
+    server = FakeTelegram(latency=0.05).start()
+    bot.server = TelegramAPIServer.from_base(server.url)
+
+    chats = min(CHATS, -(-MESSAGES // IN_A_ROW))
+    print(f"{MESSAGES} messages to {chats} chats, {IN_A_ROW} in a row")
+    print(asyncio.run(burst(server, queued=False)))
+    print(asyncio.run(burst(server, queued=True)))
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
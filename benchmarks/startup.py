@@ -0,0 +1,69 @@
+"""Time to recreate scheduled jobs on startup (`schedule_all`).
+
+The Countdowns table is filled with synthetic countdowns in a fake PostgREST
+server (200 ms latency). The first run reads them from the db (like every
+startup used to), the second one restores them from the schedule store.
+
+    python -m benchmarks.startup [countdowns]
+"""
+
+import asyncio
+import datetime as dt
+import logging
+import random
+import sys
+import time
+
+from benchmarks.fake_postgrest import FakePostgrest
+from benchmarks.fake_redis import patch_storage
+from handlers.schedule_jobs import schedule_all
+from loader import countdowns, db, sched, storage
+
+COUNTDOWNS = 100_000
+
+
+def synthetic_countdowns(size: int):
+    rng = random.Random(42)
+    now = dt.datetime.now(dt.timezone.utc).replace(second=0, microsecond=0)
+
+    for i in range(size):
+        end = now + dt.timedelta(minutes=rng.randint(60, 365 * 24 * 60))
+        yield {
+            "name": f"countdown {i}",
+            "tg_user_id": i // 3 + 1,
+            "date_time": end.isoformat(),
+            "reminders": rng.random() < 0.5,
+            "cd_format": rng.choice([1, 2]),
+        }
+
+
+async def startup() -> float:
+    start = time.perf_counter()
+    await schedule_all()
+    elapsed = time.perf_counter() - start
+
+    # forget everything, like a restart would
+    sched.remove_all_jobs()
+    countdowns.clear()
+    await db.close()
+
+    return elapsed
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else COUNTDOWNS
+
+    logging.disable(logging.CRITICAL)
+    server = FakePostgrest(latency=0.2).start()
+    server.tables["Countdowns"] = list(synthetic_countdowns(size))
+    patch_storage(storage)
+
+    print(f"{size} countdowns")
+    print(f"from db:    {asyncio.run(startup()):6.2f} s")
+    print(f"from store: {asyncio.run(startup()):6.2f} s")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Cold start: time to import the bot in a fresh process.
+
+Every run is a new interpreter that imports `app` (everything the bot loads
+before `on_startup`), so nothing is cached in memory between runs (the
+files are, by the os, after the first run, which is not counted). The
+import time is measured inside the process and the whole process (with
+interpreter start and exit) from outside. Also measured is what is now
+deferred to the first use: importing timezonefinder and geopy when the
+first new user shares their location.
+
+    python -m benchmarks.startup_time [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RUNS = 10
+IMPORT_APP = """
+import time
+start = time.perf_counter()
+import app
+print(time.perf_counter() - start)
+"""
+FIRST_LOCATION = """
+import time
+import app
+start = time.perf_counter()
+import timezonefinder, geopy.geocoders, geopy.adapters
+print(time.perf_counter() - start)
+"""
+# the bot only needs these to be set to be imported
+ENV = {
+    "BOT_TOKEN": "123456:ABCdefGhIJKlmnoPQRstuVWXyz012345678",
+    "ADMIN": "1",
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": "6379",
+    "REDIS_DB": "0",
+    "REDIS_PASSWORD": "",
+    "SUPABASE_URL": "http://localhost",
+    "SUPABASE_KEY": "key",
+}
+
+
+def run(code: str):
+    env = dict(os.environ, **{k: os.environ.get(k, v) for k, v in ENV.items()})
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.split()[-1]), time.perf_counter() - start
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+
+    run(IMPORT_APP)  # warm up the os file cache
+    imports, processes = zip(*(run(IMPORT_APP) for _ in range(runs)))
+    first_location = [run(FIRST_LOCATION)[0] for _ in range(runs)]
+
+    print(f"{runs} runs, median (min)")
+    for name, times in (
+        ("import app", imports),
+        ("whole process", processes),
+        ("first location", first_location),
+    ):
+        print(
+            f"{name:<16}{statistics.median(times) * 1000:8.1f} ms"
+            f" ({min(times) * 1000:.1f} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""FSM state round trips: plain RedisStorage2 vs per-update state sessions.
+
+Every user goes through /my_countdowns, picks a countdown, starts
+/new_countdown, picks a format, types a name and cancels. Updates go straight
+to the dispatcher, the Bot API, PostgREST and redis are fakes (5 ms, 5 ms and
+1 ms per round trip). Each storage runs in a separate process.
+
+    python -m benchmarks.state_session [users]
+"""
+
+import asyncio
+import logging
+import subprocess
+import sys
+import time
+from typing import List
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.contrib.fsm_storage.redis import RedisStorage2
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+import handlers
+from benchmarks.fake_postgrest import FakePostgrest
+from benchmarks.fake_redis import patch_storage
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.startup import synthetic_countdowns
+from loader import bot, db, dp, storage
+from middlewares.state_session import StateSessionMiddleware
+
+USERS = 200
+REDIS_LATENCY = 0.001
+
+
+class TimingMiddleware(BaseMiddleware):
+    def __init__(self):
+        super().__init__()
+        self.times: List[float] = []
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data["started_at"] = time.monotonic()
+
+    async def on_post_process_update(
+        self, update: types.Update, results: list, data: dict
+    ):
+        self.times.append(time.monotonic() - data["started_at"])
+
+
+def conversation(user_id: int, first_update_id: int) -> List[dict]:
+    """Updates sent by one user."""
+    user = {"id": user_id, "is_bot": False, "first_name": f"user {user_id}"}
+    chat = {"id": user_id, "type": "private"}
+    # the first countdown of the user (see synthetic_countdowns)
+    cd_name = f"countdown {(user_id - 1) * 3}"
+
+    def message(text: str) -> dict:
+        entities = []
+        if text.startswith("/"):
+            entities.append(
+                {"type": "bot_command", "offset": 0, "length": len(text)}
+            )
+        return {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": user,
+            "text": text,
+            "entities": entities,
+        }
+
+    def callback(data: str) -> dict:
+        return {
+            "id": str(user_id),
+            "from": user,
+            "message": message("Please choose a countdown:"),
+            "chat_instance": str(user_id),
+            "data": data,
+        }
+
+    updates = [
+        {"message": message("/my_countdowns")},
+        {"callback_query": callback(f"countdown:{cd_name}")},
+        {"message": message("/new_countdown")},
+        {"message": message("1")},
+        {"message": message("Graduation")},
+        {"message": message("/cancel")},
+    ]
+    for i, update in enumerate(updates):
+        update["update_id"] = first_update_id + i
+    return updates
+
+
+async def talk(updates: List[dict]):
+    for update in updates:
+        # a task per update like the dispatcher does, aiogram keeps the
+        # user's state in a context variable while handling an update
+        await asyncio.ensure_future(
+            dp.updates_handler.notify(types.Update(**update))
+        )
+
+
+async def benchmark(users: int, timing: TimingMiddleware):
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+
+    await asyncio.gather(
+        *(talk(conversation(user, user * 10)) for user in range(1, users + 1))
+    )
+
+    await (await bot.get_session()).close()
+    await db.close()
+
+
+def run(name: str, users: int):
+    if name == "sessions":
+        fake = patch_storage(storage, REDIS_LATENCY)
+        dp.middleware.setup(StateSessionMiddleware(storage))
+    else:
+        dp.storage = RedisStorage2()
+        fake = patch_storage(dp.storage, REDIS_LATENCY)
+
+    timing = TimingMiddleware()
+    dp.middleware.setup(timing)
+
+    logging.disable(logging.CRITICAL)
+    telegram = FakeTelegram(latency=0.005, rate=10**6, per_chat_interval=0)
+    bot.server = TelegramAPIServer.from_base(telegram.start().url)
+    postgrest = FakePostgrest(latency=0.005).start()
+    postgrest.tables["Countdowns"] = list(synthetic_countdowns(3 * users))
+
+    asyncio.run(benchmark(users, timing))
+
+    times = sorted(timing.times)
+    count = len(times)
+    print(
+        f"{name:<10}{count:>8}{fake.commands / count:>10.1f}"
+        f"{fake.round_trips / count:>8.1f}"
+        f"{times[count // 2] * 1000:>10.1f}"
+        f"{times[min(count - 1, int(count * 0.99))] * 1000:>10.1f}",
+        flush=True,
+    )
+
+    postgrest.stop()
+    telegram.stop()
+
+
+def main():
+    if sys.argv[1:2] == ["--run"]:
+        run(sys.argv[2], int(sys.argv[3]))
+        return
+
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else USERS
+
+    print(
+        f"{'storage':<10}{'updates':>8}{'cmds/upd':>10}{'rt/upd':>8}"
+        f"{'p50 ms':>10}{'p99 ms':>10}",
+        flush=True,
+    )
+    for name in ("plain", "sessions"):
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.state_session",
+                "--run",
+                name,
+                str(users),
+            ]
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Time zone lookup latency and memory: new finder per lookup vs shared one.
+
+Lookups are drawn from a fixed set of random "cities" (with a little jitter
+inside the same grid cell), like onboarding answers are. Each mode runs in a
+separate process so that peak RSS is measured independently.
+
+    python -m benchmarks.timezone
+"""
+
+import asyncio
+import random
+import resource
+import subprocess
+import sys
+import time
+
+LOOKUPS = 3000
+CITIES = 300
+
+
+def coordinates():
+    rng = random.Random(42)
+    cities = [
+        (rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(CITIES)
+    ]
+    for _ in range(LOOKUPS):
+        lat, lng = rng.choice(cities)
+        yield lat + rng.uniform(0, 0.001), lng + rng.uniform(0, 0.001)
+
+
+def before() -> float:
+    from timezonefinder import TimezoneFinder
+
+    start = time.perf_counter()
+    for lat, lng in coordinates():
+        TimezoneFinder().timezone_at(lng=lng, lat=lat)
+    return time.perf_counter() - start
+
+
+def after() -> float:
+    from utils.get_timezone import get_timezone
+
+    async def run():
+        for lat, lng in coordinates():
+            await get_timezone(lat, lng)
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return time.perf_counter() - start
+
+
+def main():
+    if len(sys.argv) > 1:
+        elapsed = {"before": before, "after": after}[sys.argv[1]]()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(
+            f"{sys.argv[1]:>6}: {elapsed / LOOKUPS * 1e6:8.1f} us/lookup, "
+            f"peak RSS {rss:.1f} MiB"
+        )
+        return
+
+    print(f"{LOOKUPS} lookups over {CITIES} locations")
+    for mode in ("before", "after"):
+        subprocess.run([sys.executable, "-m", "benchmarks.timezone", mode])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Update handling latency: long polling vs webhook.
+
+Updates are replayed at a steady rate. In polling mode the fake Bot API
+server hands them out through `getUpdates` (like `executor.start_polling`
+gets them), in webhook mode they are posted to a local webhook with up to 40
+requests at the same time (like telegram does). Latency is measured from the
+moment an update is available to its handlers finishing, handler time is
+the time spent in the handlers alone.
+
+    python -m benchmarks.webhook [--updates FILE] [--count N] [--rate R]
+
+FILE has recorded updates, one Bot API update object (JSON) per line. They
+are renumbered and replayed in order. Without it, /help and /my_countdowns
+messages from synthetic users are used.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List
+
+import aiohttp
+from aiogram import types
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.dispatcher.webhook import get_new_configured_app
+from aiohttp import web
+
+import handlers
+from benchmarks.fake_postgrest import FakePostgrest
+from benchmarks.fake_redis import patch_storage
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.startup import synthetic_countdowns
+from data.config import WEBHOOK_PATH
+from loader import bot, db, dp, storage
+
+COUNT = 2000
+RATE = 100
+USERS = 1000
+WEBHOOK_PORT = 8767
+# telegram's default number of simultaneous webhook requests
+WEBHOOK_CONNECTIONS = 40
+
+
+class LatencyMiddleware(BaseMiddleware):
+    """Record latency and handler time of every update."""
+
+    def __init__(self):
+        super().__init__()
+        # update id -> time when the update became available
+        self.available: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.handler_times: List[float] = []
+        self.expected = 0
+        self.finished = asyncio.Event()
+
+    def reset(self, expected: int):
+        self.available.clear()
+        self.latencies.clear()
+        self.handler_times.clear()
+        self.expected = expected
+        self.finished.clear()
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data["started_at"] = time.monotonic()
+
+    async def on_post_process_update(
+        self, update: types.Update, results: list, data: dict
+    ):
+        now = time.monotonic()
+        self.handler_times.append(now - data["started_at"])
+        self.latencies.append(now - self.available[update.update_id])
+
+        if len(self.latencies) == self.expected:
+            self.finished.set()
+
+
+def synthetic_updates(count: int) -> List[dict]:
+    updates = []
+    for i in range(count):
+        user_id = i % USERS + 1
+        command = "/help" if i % 2 else "/my_countdowns"
+        updates.append(
+            {
+                "update_id": i + 1,
+                "message": {
+                    "message_id": i + 1,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {
+                        "id": user_id,
+                        "is_bot": False,
+                        "first_name": f"user {user_id}",
+                    },
+                    "text": command,
+                    "entities": [
+                        {
+                            "type": "bot_command",
+                            "offset": 0,
+                            "length": len(command),
+                        }
+                    ],
+                },
+            }
+        )
+    return updates
+
+
+def recorded_updates(path: str, count: int) -> List[dict]:
+    with open(path) as f:
+        updates = [json.loads(line) for line in f if line.strip()][:count]
+
+    for i, update in enumerate(updates):
+        update["update_id"] = i + 1
+    return updates
+
+
+async def replay(updates: List[dict], rate: float, deliver):
+    """Call `deliver` with every update at its time."""
+    start = time.monotonic()
+    for i, update in enumerate(updates):
+        delay = start + i / rate - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        deliver(update)
+
+
+async def run_polling(
+    server: FakeTelegram, updates: List[dict], rate: float, latency
+):
+    polling = asyncio.create_task(dp.start_polling(reset_webhook=False))
+
+    def deliver(update: dict):
+        latency.available[update["update_id"]] = time.monotonic()
+        server.push_updates([update])
+
+    await replay(updates, rate, deliver)
+    await latency.finished.wait()
+
+    dp.stop_polling()
+    polling.cancel()
+    await asyncio.gather(polling, return_exceptions=True)
+
+
+async def run_webhook(updates: List[dict], rate: float, latency):
+    runner = web.AppRunner(
+        get_new_configured_app(dp, path=WEBHOOK_PATH), access_log=None
+    )
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", WEBHOOK_PORT).start()
+
+    url = f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}"
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=WEBHOOK_CONNECTIONS)
+    )
+    requests = []
+
+    async def post(update: dict):
+        async with session.post(url, json=update) as response:
+            response.raise_for_status()
+
+    def deliver(update: dict):
+        latency.available[update["update_id"]] = time.monotonic()
+        requests.append(asyncio.create_task(post(update)))
+
+    await replay(updates, rate, deliver)
+    await asyncio.gather(*requests)
+    await latency.finished.wait()
+
+    await session.close()
+    await runner.cleanup()
+
+
+def summary(mode: str, latency: LatencyMiddleware, elapsed: float) -> str:
+    def percentile(values: List[float], p: float) -> float:
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+    return (
+        f"{mode:<8}{len(latency.latencies) / elapsed:>8.1f}"
+        f"{percentile(latency.latencies, 0.5):>10.1f}"
+        f"{percentile(latency.latencies, 0.99):>10.1f}"
+        f"{percentile(latency.handler_times, 0.5):>10.1f}"
+        f"{percentile(latency.handler_times, 0.99):>10.1f}"
+    )
+
+
+async def benchmark(server: FakeTelegram, updates: List[dict], rate: float):
+    latency = LatencyMiddleware()
+    dp.middleware.setup(latency)
+
+    print(
+        f"{'mode':<8}{'upd/s':>8}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'handler':>10}{'p99':>10}",
+        flush=True,
+    )
+
+    for mode in ("polling", "webhook"):
+        latency.reset(len(updates))
+        start = time.monotonic()
+
+        if mode == "polling":
+            await run_polling(server, updates, rate, latency)
+        else:
+            await run_webhook(updates, rate, latency)
+
+        print(summary(mode, latency, time.monotonic() - start), flush=True)
+
+    await (await bot.get_session()).close()
+    await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", help="file with recorded updates")
+    parser.add_argument("--count", type=int, default=COUNT)
+    parser.add_argument("--rate", type=float, default=RATE)
+    args = parser.parse_args()
+
+    if args.updates:
+        updates = recorded_updates(args.updates, args.count)
+    else:
+        updates = synthetic_updates(args.count)
+
+    logging.disable(logging.CRITICAL)
+    server = FakeTelegram(latency=0.05, rate=10**6, per_chat_interval=0)
+    server.start()
+    bot.server = TelegramAPIServer.from_base(server.url)
+
+    postgrest = FakePostgrest(latency=0.05).start()
+    postgrest.tables["Countdowns"] = list(synthetic_countdowns(3 * USERS))
+    patch_storage(storage)
+
+    print(f"{len(updates)} updates at {args.rate:g} per second")
+    asyncio.run(benchmark(server, updates, args.rate))
+
+    postgrest.stop()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import hashlib
+
 from environs import Env
 
 env = Env()
@@ -15,3 +17,85 @@ REDIS_PASSWORD = env.str("REDIS_PASSWORD")
 # supabase stuff
 SUPABASE_URL = env.str("SUPABASE_URL")
 SUPABASE_KEY = env.str("SUPABASE_KEY")
+DB_MAX_CONNECTIONS = env.int("DB_MAX_CONNECTIONS", 20)
+DB_TIMEOUT = env.float("DB_TIMEOUT", 10.0)
+
+# timezone lookup stuff
+TZ_IN_MEMORY = env.bool("TZ_IN_MEMORY", False)
+TZ_CACHE_SIZE = env.int("TZ_CACHE_SIZE", 4096)
+
+# outgoing messages stuff
+SEND_RATE = env.float("SEND_RATE", 30)
+SEND_WORKERS = env.int("SEND_WORKERS", 8)
+SEND_QUEUE_SIZE = env.int("SEND_QUEUE_SIZE", 10000)
+
+# Bot API stuff
+# connections to the Bot API (and requests to it at the same time)
+BOT_CONNECTIONS = env.int("BOT_CONNECTIONS", 100)
+# seconds DNS lookups of the Bot API host are cached for
+BOT_DNS_TTL = env.int("BOT_DNS_TTL", 300)
+# seconds an idle connection to the Bot API is kept open for, longer than
+# the minute between reminders so that connections are reused
+BOT_KEEPALIVE = env.float("BOT_KEEPALIVE", 75.0)
+# seconds a Bot API request can take, and opening a connection of them
+BOT_TIMEOUT = env.float("BOT_TIMEOUT", 30.0)
+BOT_CONNECT_TIMEOUT = env.float("BOT_CONNECT_TIMEOUT", 5.0)
+# make Bot API requests over HTTP/2 with httpx (needs the h2 package)
+BOT_HTTP2 = env.bool("BOT_HTTP2", False)
+
+# scheduler stuff
+# read countdowns from the db on startup instead of the schedule store
+RESYNC_SCHEDULE = env.bool("RESYNC_SCHEDULE", False)
+# elect a leader to send reminders when running more than one instance
+LEADER_ELECTION = env.bool("LEADER_ELECTION", False)
+# seconds without a leader (at most) after the leader dies
+LEADER_TTL = env.float("LEADER_TTL", 15.0)
+# seconds of ended countdowns that are cleaned up together (one db request)
+CLEANUP_WINDOW = env.int("CLEANUP_WINDOW", 5)
+# minutes between sweeps for ended countdowns that were not cleaned up
+SWEEP_INTERVAL = env.int("SWEEP_INTERVAL", 60)
+# minutes before a countdown's time of day to spread its daily reminders over
+# (0 = sent at that time), so that not all of them go out at e.g. midnight
+REMINDER_SPREAD = env.int("REMINDER_SPREAD", 0)
+# users who turn the digest on get the reminders due in the same window of
+# DIGEST_WINDOW minutes as one message (at the start of the window)
+DIGEST_WINDOW = env.int("DIGEST_WINDOW", 60)
+# reminders due at the same minute are sent in batches of REMINDER_BATCH,
+# with up to REMINDER_CLAIM_WORKERS batches claimed in redis and up to
+# REMINDER_RENDER_WORKERS batches rendered at the same time
+REMINDER_BATCH = env.int("REMINDER_BATCH", 500)
+REMINDER_CLAIM_WORKERS = env.int("REMINDER_CLAIM_WORKERS", 2)
+REMINDER_RENDER_WORKERS = env.int("REMINDER_RENDER_WORKERS", 1)
+# seconds reminders and clean ups can be late (p99 of a minute) before the
+# admin is told
+LATENESS_SLO = env.float("LATENESS_SLO", 60.0)
+# minutes between lateness alerts to the admin (at most)
+LATENESS_ALERT_INTERVAL = env.int("LATENESS_ALERT_INTERVAL", 30)
+
+# webhook stuff
+# get updates through a webhook instead of long polling
+USE_WEBHOOK = env.bool("USE_WEBHOOK", False)
+# public https address of the bot, e.g. https://example.com
+WEBHOOK_HOST = env.str("WEBHOOK_HOST") if USE_WEBHOOK else ""
+# secret part of the webhook path so that only telegram knows where to post
+# updates (derived from the bot token if not set)
+WEBHOOK_SECRET = (
+    env.str("WEBHOOK_SECRET", "")
+    or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()
+)
+WEBHOOK_PATH = f"/webhook/{WEBHOOK_SECRET}"
+WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}"
+# only accept updates from telegram's ip addresses
+WEBHOOK_CHECK_IP = env.bool("WEBHOOK_CHECK_IP", False)
+# number of updates telegram sends at the same time
+WEBHOOK_MAX_CONNECTIONS = env.int("WEBHOOK_MAX_CONNECTIONS", 40)
+WEBAPP_HOST = env.str("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = env.int("WEBAPP_PORT", 8080)
+# seconds to wait for running handlers and jobs to finish (and for queued
+# messages to be sent) on shutdown
+SHUTDOWN_TIMEOUT = env.float("SHUTDOWN_TIMEOUT", 30.0)
+
+# metrics stuff
+# serve metrics on http://METRICS_HOST:METRICS_PORT/metrics (0 = off)
+METRICS_HOST = env.str("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = env.int("METRICS_PORT", 0)
@@ -1,19 +1,26 @@
 """Everything related to deleting a countdown and removing scheduled jobs."""
 
+import asyncio
 import logging
-from typing import Union
-import uuid
+from typing import Callable, Dict, Iterable, List, Tuple, Union
 
 from aiogram import types
 from aiogram.dispatcher import FSMContext
-from apscheduler.jobstores.base import JobLookupError
 
-from loader import dp, sched, supabase
+from loader import countdowns, dp, leader
 from states.states import MyCountdowns
+from utils import schedule_store
+from utils.countdown_index import Countdown
+from utils.send_message import send_message
+from utils.set_db_data import (
+    remove_all_ended,
+    remove_countdown,
+    remove_ended,
+)
 
 
 async def disable_daily_reminders(user_id: int, cd_name: str):
-    """Delete scheduled reminders job if it exists.
+    """Remove daily reminders of the countdown if there are any.
 
     Parameters
     ----------
@@ -23,18 +30,13 @@ async def disable_daily_reminders(user_id: int, cd_name: str):
         Countdown name
     """
 
-    job_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{user_id} {cd_name}"))
-
-    try:
-        sched.remove_job(job_id)
-    except JobLookupError:
-        # daily reminders were not on or the job already reached its end date
-        # and deleted itself
-        pass
+    # does nothing if daily reminders were not on or already reached their end
+    countdowns.remove_reminders(user_id, cd_name)
+    await schedule_store.delete_reminders(user_id, cd_name)
 
 
 async def disable_cleanup(user_id: int, cd_name: str):
-    """Delete scheduled last clean up job if it exists.
+    """Delete scheduled last clean up if it exists.
 
     Parameters
     ----------
@@ -44,19 +46,18 @@ async def disable_cleanup(user_id: int, cd_name: str):
         Countdown name
     """
 
-    job_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"bye {user_id} {cd_name}"))
+    await schedule_store.delete_cleanup(user_id, cd_name)
 
-    try:
-        sched.remove_job(job_id)
-    except JobLookupError:
-        logging.exception(
-            "UNEXPECTED: User was deleting/editing a countdown and last clean "
-            "up job was not found."
+    # otherwise the leader removes it when it gets the change
+    if leader.is_leader and not countdowns.remove(user_id, cd_name):
+        logging.error(
+            "UNEXPECTED: User was deleting/editing a countdown and its clean "
+            "up was not found."
         )
 
 
-async def delete_countdown(user_id: int, cd_name: str) -> Union[list, None]:
-    """Delete specific countdown from db.
+async def goodbye_countdown(user_id: int, cd_name: str):
+    """Disable countdown reminders and delete countdown from db.
 
     Parameters
     ----------
@@ -64,58 +65,125 @@ async def delete_countdown(user_id: int, cd_name: str) -> Union[list, None]:
         Telegram user id
     cd_name : str
         Countdown name
+    """
+
+    await disable_daily_reminders(user_id, cd_name)
+    countdowns.remove(user_id, cd_name)
+    await schedule_store.delete_cleanup(user_id, cd_name)
+
+    deleted = await remove_countdown(user_id, cd_name)
+
+    if deleted:
+        await send_message(user_id, f"Countdown <b>{cd_name}</b> deleted")
+    else:
+        logging.error(
+            f"UNEXPECTED: Delete operation failed. Countdown '{cd_name}' from "
+            f"user '{user_id}' not found."
+        )
+        await send_message(
+            user_id,
+            "Sorry, I ran into sth unexpected. Please try again later.",
+        )
+
+
+async def goodbye_countdowns(
+    ended: List[Countdown],
+    on_sent: Union[Dict[Tuple[int, str], Callable[[bool], None]], None] = None,
+):
+    """Clean up countdowns that have ended, all at once.
+
+    Same as `goodbye_countdown` for each of them, but the countdowns are
+    deleted from the db together (see `remove_ended`) and forgotten by the
+    schedule store in one go. They're already out of the countdown index.
+
+    Parameters
+    ----------
+    ended : List[Countdown]
+        Countdowns to clean up
+    on_sent : Union[Dict[Tuple[int, str], Callable[[bool], None]], None]
+        (user_id, cd_name) -> called when the message about the countdown
+        is sent (see `send_message`)
+    """
+
+    deleted = await remove_ended(ended)
+    await _say_goodbye(deleted, [(c.user_id, c.name) for c in ended], on_sent)
+
+
+async def sweep_ended(date_time: str) -> int:
+    """Clean up every countdown that ended by the given time.
+
+    Countdowns are deleted from the db with one request and only the ones
+    that were deleted by it are cleaned up, so nothing is cleaned up twice
+    even if two instances sweep at the same time.
+
+    Parameters
+    ----------
+    date_time : str
+        Countdown date and time (in the '%Y-%m-%dT%H:%M:%S%z' format)
 
     Returns
     -------
-    Union[list, None]
-        List containing deleted row if countdown was found, else None
+    int
+        Number of countdowns cleaned up
     """
-    data = (
-        supabase.table("Countdowns")
-        .delete()
-        .eq("tg_user_id", user_id)
-        .eq("name", cd_name)
-        .execute()
-    )
 
-    try:
-        # data[0] -> what just got deleted
-        assert len(data[0]) > 0
-    except AssertionError:
-        return None
-    else:
-        return data[0]
+    deleted = await remove_all_ended(date_time)
+    await _say_goodbye(deleted)
+    return len(deleted)
 
 
-async def goodbye_countdown(user_id: int, cd_name: str):
-    """Disable countdown reminders and delete countdown from db.
+async def _say_goodbye(
+    deleted: list,
+    expected: Iterable[Tuple[int, str]] = (),
+    on_sent: Union[Dict[Tuple[int, str], Callable[[bool], None]], None] = None,
+):
+    """Tell users their countdowns were deleted and forget the countdowns.
 
     Parameters
     ----------
-    user_id : int
-        Telegram user id
-    cd_name : str
-        Countdown name
+    deleted : list
+        Deleted rows (with tg_user_id and name)
+    expected : Iterable[Tuple[int, str]]
+        (user_id, cd_name) of countdowns that should have been deleted
+    on_sent : Union[Dict[Tuple[int, str], Callable[[bool], None]], None]
+        (user_id, cd_name) -> called when the message about the countdown
+        is sent
     """
 
-    await disable_daily_reminders(user_id, cd_name)
+    on_sent = on_sent or {}
 
-    deleted = await delete_countdown(user_id, cd_name)
+    deleted = {(row["tg_user_id"], row["name"]) for row in deleted}
+    missing = set(expected) - deleted
 
-    if deleted:
-        await dp.bot.send_message(
-            user_id, f"Countdown <b>{cd_name}</b> deleted"
+    for user_id, cd_name in deleted:
+        # deleted along with the expected ones or swept up
+        countdowns.remove(user_id, cd_name)
+    await schedule_store.delete_ended(list(deleted | missing))
+
+    messages = [
+        send_message(
+            user_id,
+            f"Countdown <b>{cd_name}</b> deleted",
+            on_sent.get((user_id, cd_name)),
         )
-    else:
+        for user_id, cd_name in deleted
+    ]
+    for user_id, cd_name in missing:
         logging.error(
-            f"UNEXPECTED: Delete operation failed. Countdown '{cd_name}' from "
-            f"user '{user_id}' not found."
+            f"UNEXPECTED: Delete operation failed. Countdown '{cd_name}' "
+            f"from user '{user_id}' not found."
         )
-        await dp.bot.send_message(
-            user_id,
-            "Sorry, I ran into sth unexpected. Please try again later.",
+        messages.append(
+            send_message(
+                user_id,
+                "Sorry, I ran into sth unexpected. Please try again later.",
+                on_sent.get((user_id, cd_name)),
+            )
         )
 
+    # queued all at once, the message queue keeps to telegram's limits
+    await asyncio.gather(*messages)
+
 
 @dp.callback_query_handler(
     text="delete_countdown", state=MyCountdowns.countdown_selected
@@ -159,8 +227,8 @@ async def user_delete_countdown(call: types.CallbackQuery, state: FSMContext):
     state_data = await state.get_data()
     cd_name = state_data["cd_name"]
 
+    # also deletes the clean up
     await goodbye_countdown(user_id, cd_name)
-    await disable_cleanup(user_id, cd_name)
 
     keyboard = types.InlineKeyboardMarkup()
     keyboard.add(
@@ -1,20 +1,25 @@
 """Edit countdown operations are all done here. Sorry for the mess."""
 
-import datetime as dt
 import logging
-import uuid
 
 from aiogram import types
 from aiogram.dispatcher import FSMContext
 
-from aiogram.utils.emoji import emojize
+from data.config import DIGEST_WINDOW
 from handlers.delete_countdown import disable_cleanup, disable_daily_reminders
-from handlers.schedule_jobs import schedule_goodbye_cd, schedule_reminders
-from loader import dp, sched, supabase
+from handlers.my_countdowns import LOADING
+from handlers.schedule_jobs import (
+    schedule_digest,
+    schedule_goodbye_cd,
+    schedule_reminders,
+)
+from loader import dp
 from states.states import MyCountdowns
+from utils import schedule_store
 from utils.check_cd_name import check_countdown_name
 from utils.convert_dt import convert_dt
 from utils.get_db_data import get_tz_info
+from utils.set_db_data import update_countdown
 from utils.validate_date import validate_dt
 
 
@@ -24,7 +29,7 @@ from utils.validate_date import validate_dt
 async def ask_what_to_edit(call: types.CallbackQuery, state: FSMContext):
     """Ask what specific countdown information to edit."""
     # let the user know that its loading and not stuck
-    await call.message.edit_text(emojize(":hourglass_flowing_sand:"))
+    await call.message.edit_text(LOADING)
 
     user_id = call.from_user.id
     state_data = await state.get_data()
@@ -49,12 +54,23 @@ async def ask_what_to_edit(call: types.CallbackQuery, state: FSMContext):
         reminders_data = "turn_reminders_on"
         countdown_reminders = "OFF"
 
+    # the digest is for all countdowns of the user
+    if await schedule_store.is_digest(user_id):
+        digest_text = "Turn Digest OFF"
+        digest_data = "turn_digest_off"
+        digest = "ON"
+    else:
+        digest_text = "Turn Digest ON"
+        digest_data = "turn_digest_on"
+        digest = "OFF"
+
     text = (
         "What info do you want me to edit?\n\n"
         f"<b>Name</b>: {countdown_name}\n"
         f"<b>DateTime</b>: {countdown_in_users_tz}\n"
         f"<b>Format</b>: {countdown_format}\n"
         f"<b>Reminders</b>: {countdown_reminders}\n"
+        f"<b>Digest</b> (all countdowns): {digest}\n"
     )
 
     keyboard = types.InlineKeyboardMarkup(row_width=2)
@@ -71,6 +87,9 @@ async def ask_what_to_edit(call: types.CallbackQuery, state: FSMContext):
         types.InlineKeyboardButton(
             text=reminders_text, callback_data=reminders_data
         ),
+        types.InlineKeyboardButton(
+            text=digest_text, callback_data=digest_data
+        ),
         types.InlineKeyboardButton(
             text="<< Back to Countdown",
             callback_data=f"countdown:{countdown_name}",
@@ -117,15 +136,10 @@ async def update_countdown_name(message: types.Message, state: FSMContext):
         state_data = await state.get_data()
         old_countdown_name = state_data["cd_name"]
 
-        data = (
-            supabase.table("Countdowns")
-            .update({"name": new_countdown_name})
-            .eq("tg_user_id", user_id)
-            .eq("name", old_countdown_name)
-            .execute()
+        countdown_data = await update_countdown(
+            user_id, old_countdown_name, {"name": new_countdown_name}
         )
 
-        countdown_data = data[0][0]
         countdown_dt = countdown_data["date_time"]
         countdown_reminders = countdown_data["reminders"]
         countdown_format = countdown_data["cd_format"]
@@ -192,52 +206,22 @@ async def update_countdown_dt(message: types.Message, state: FSMContext):
         state_data = await state.get_data()
         countdown_name = state_data["cd_name"]
 
-        data = (
-            supabase.table("Countdowns")
-            .update({"date_time": utc_dt})
-            .eq("tg_user_id", user_id)
-            .eq("name", countdown_name)
-            .execute()
+        countdown_data = await update_countdown(
+            user_id, countdown_name, {"date_time": utc_dt}
         )
 
-        countdown_data = data[0][0]
         countdown_dt = countdown_data["date_time"]
         countdown_reminders = countdown_data["reminders"]
         cd_format = countdown_data["cd_format"]
 
-        dt_format = "%Y-%m-%dT%H:%M:%S%z"
-        dt_obj = dt.datetime.strptime(countdown_dt, dt_format)
-
         if countdown_reminders:
-            job_id = str(
-                uuid.uuid5(uuid.NAMESPACE_DNS, f"{user_id} {countdown_name}")
-            )
-            sched.modify_job(
-                job_id, args=[user_id, countdown_name, countdown_dt, cd_format]
-            )
-            sched.reschedule_job(
-                job_id,
-                trigger="cron",
-                day="*",
-                hour=dt_obj.hour,
-                minute=dt_obj.minute,
-                end_date=dt_obj,
-                timezone="UTC",
+            # replaces reminders at the old time
+            await schedule_reminders(
+                user_id, countdown_name, countdown_dt, cd_format
             )
 
-        # countdown will be up. if user has reminders on, last reminder should
-        # be delivered by this time unless sth went wrong.
-        run_dt = dt_obj + dt.timedelta(seconds=10)
-
-        job_id = str(
-            uuid.uuid5(uuid.NAMESPACE_DNS, f"bye {user_id} {countdown_name}")
-        )
-
-        sched.reschedule_job(
-            job_id,
-            trigger="date",
-            run_date=run_dt,
-        )
+        # replaces clean up at the old date and time
+        await schedule_goodbye_cd(user_id, countdown_name, countdown_dt)
 
         keyboard = types.InlineKeyboardMarkup()
         keyboard.add(
@@ -272,26 +256,19 @@ async def update_cd_format(call: types.CallbackQuery, state: FSMContext):
     user_id = call.from_user.id
     state_data = await state.get_data()
     countdown_name = state_data["cd_name"]
-    cd_format = call.data.split(":")[-1]
-
-    data = (
-        supabase.table("Countdowns")
-        .update({"cd_format": cd_format})
-        .eq("tg_user_id", user_id)
-        .eq("name", countdown_name)
-        .execute()
+    cd_format = int(call.data.split(":")[-1])
+
+    countdown_data = await update_countdown(
+        user_id, countdown_name, {"cd_format": cd_format}
     )
 
-    countdown_data = data[0][0]
     countdown_dt = countdown_data["date_time"]
     countdown_reminders = countdown_data["reminders"]
 
     if countdown_reminders:
-        job_id = str(
-            uuid.uuid5(uuid.NAMESPACE_DNS, f"{user_id} {countdown_name}")
-        )
-        sched.modify_job(
-            job_id, args=[user_id, countdown_name, countdown_dt, cd_format]
+        # replaces reminders in the old format
+        await schedule_reminders(
+            user_id, countdown_name, countdown_dt, cd_format
         )
 
     keyboard = types.InlineKeyboardMarkup()
@@ -318,15 +295,10 @@ async def turn_reminders_on(call: types.CallbackQuery, state: FSMContext):
     state_data = await state.get_data()
     countdown_name = state_data["cd_name"]
 
-    data = (
-        supabase.table("Countdowns")
-        .update({"reminders": True})
-        .eq("tg_user_id", user_id)
-        .eq("name", countdown_name)
-        .execute()
+    countdown_data = await update_countdown(
+        user_id, countdown_name, {"reminders": True}
     )
 
-    countdown_data = data[0][0]
     countdown_dt = countdown_data["date_time"]
     countdown_format = countdown_data["cd_format"]
 
@@ -357,13 +329,7 @@ async def turn_reminders_off(call: types.CallbackQuery, state: FSMContext):
     state_data = await state.get_data()
     countdown_name = state_data["cd_name"]
 
-    _ = (
-        supabase.table("Countdowns")
-        .update({"reminders": False})
-        .eq("tg_user_id", user_id)
-        .eq("name", countdown_name)
-        .execute()
-    )
+    await update_countdown(user_id, countdown_name, {"reminders": False})
     await disable_daily_reminders(user_id, countdown_name)
 
     keyboard = types.InlineKeyboardMarkup()
@@ -378,3 +344,38 @@ async def turn_reminders_off(call: types.CallbackQuery, state: FSMContext):
         "You got it! Reminders are OFF.", reply_markup=keyboard
     )
     await call.answer()
+
+
+@dp.callback_query_handler(
+    text=["turn_digest_on", "turn_digest_off"],
+    state=MyCountdowns.countdown_selected,
+)
+async def toggle_digest(call: types.CallbackQuery, state: FSMContext):
+    """Turn the digest of daily reminders on or off (for all countdowns).
+
+    With the digest on, reminders of all countdowns that are due within the
+    same DIGEST_WINDOW minutes come as one message.
+    """
+
+    digest = call.data == "turn_digest_on"
+    await schedule_digest(call.from_user.id, digest)
+
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(
+        types.InlineKeyboardButton(
+            text="<< Back to List", callback_data="back_to_list"
+        )
+    )
+
+    if digest:
+        text = (
+            "You got it! Digest is ON. Daily reminders of your countdowns "
+            f"that are due within the same {DIGEST_WINDOW} minutes will come "
+            "as one message."
+        )
+    else:
+        text = "You got it! Digest is OFF."
+
+    await state.finish()
+    await call.message.edit_text(text, reply_markup=keyboard)
+    await call.answer()
@@ -11,13 +11,15 @@ from typing import Union
 
 from aiogram import types
 from aiogram.dispatcher import FSMContext
-from aiogram.utils.emoji import emojize
 
 from handlers.show_countdown import send_countdown_details
 from loader import dp
 from states.states import MyCountdowns
 from utils.get_db_data import get_countdown_details, get_countdown_names
 
+# ":hourglass_flowing_sand:" (aiogram's emojize loads the whole emoji table)
+LOADING = "\u23f3"
+
 
 @dp.message_handler(commands="my_countdowns", state="*")
 @dp.callback_query_handler(text="back_to_list", state="*")
@@ -28,20 +30,14 @@ async def ask_to_pick_countdown(
     """Ask the user to pick a countdown."""
     if type(entity) == types.CallbackQuery:
         # let the user know that its loading and not stuck
-        await entity.message.edit_text(emojize(":hourglass_flowing_sand:"))  # type: ignore
+        await entity.message.edit_text(LOADING)  # type: ignore
 
-    # if the countdown names are saved in the state, get them (faster)
-    state_data = await state.get_data()
-    countdown_names = state_data.get("countdown_names")
     # reset the state since the state may contain more data that is not needed
     await state.finish()
 
-    if not countdown_names:
-        # names are not in state, query supabase (slower)
-        countdown_names = await get_countdown_names(entity.from_user.id)
+    countdown_names = await get_countdown_names(entity.from_user.id)
 
     await MyCountdowns.browsing_cds.set()
-    await state.update_data(countdown_names=countdown_names)
 
     if countdown_names:
         keyboard = types.InlineKeyboardMarkup(row_width=2)
@@ -86,21 +82,15 @@ async def ask_to_pick_countdown(
 async def present_countdown(call: types.CallbackQuery, state: FSMContext):
     """Present selected countdown with options on what to do with it."""
     # let the user know that its loading and not stuck
-    await call.message.edit_text(emojize(":hourglass_flowing_sand:"))
+    await call.message.edit_text(LOADING)
 
     user_id = call.from_user.id
     countdown_name = call.data.split(":")[1]
 
     await MyCountdowns.countdown_selected.set()
 
-    state_data = await state.get_data()
-
-    if state_data.get("cd_name"):
-        # if theres info on countdown name in the state, then all countdown
-        # details should also be available in the state
-        countdown_data = state_data
-    else:
-        countdown_data = await get_countdown_details(user_id, countdown_name)
+    # cached, so picking countdowns one after another doesn't query the db
+    countdown_data = await get_countdown_details(user_id, countdown_name)
 
     if not countdown_data:
         logging.error(
@@ -114,11 +104,12 @@ async def present_countdown(call: types.CallbackQuery, state: FSMContext):
         countdown_reminders = countdown_data["reminders"]
         countdown_format = countdown_data["cd_format"]
 
-        if not state_data.get("cd_name"):
-            await state.update_data(cd_name=countdown_name)
-            await state.update_data(date_time=countdown_dt)
-            await state.update_data(reminders=countdown_reminders)
-            await state.update_data(cd_format=countdown_format)
+        await state.update_data(
+            cd_name=countdown_name,
+            date_time=countdown_dt,
+            reminders=countdown_reminders,
+            cd_format=countdown_format,
+        )
 
         text = await send_countdown_details(
             user_id,
@@ -14,10 +14,11 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
 
 from handlers.schedule_jobs import schedule_goodbye_cd, schedule_reminders
-from loader import dp, supabase
+from loader import dp
 from states.states import NewCountdown
 from utils.check_cd_name import check_countdown_name
 from utils.get_db_data import get_tz_info
+from utils.set_db_data import add_countdown
 from utils.validate_date import validate_dt
 
 
@@ -152,15 +153,13 @@ async def validate_and_insert(message: types.Message, state: FSMContext):
             countdown_reminders = countdown_data["reminders"]
             countdown_format = countdown_data["cd_format"]
 
-            data = {
-                "name": countdown_name,
-                "tg_user_id": user_id,
-                "date_time": utc_dt,
-                "reminders": countdown_reminders,
-                "cd_format": countdown_format,
-            }
-
-            supabase.table("Countdowns").insert(data).execute()
+            await add_countdown(
+                user_id,
+                countdown_name,
+                utc_dt,
+                countdown_reminders,
+                countdown_format,
+            )
             logging.info("Countdown created successfully.")
 
             await message.answer("Yay, countdown created successfully.")
@@ -1,13 +1,58 @@
 """Job scheduling is mainly done here."""
 
+import asyncio
 import datetime as dt
+import itertools
 import logging
-import uuid
+import time
+from typing import Dict, Iterator, List, Union
 
-from handlers.delete_countdown import goodbye_countdown
-from handlers.show_countdown import send_countdown_details
-from loader import sched
-from utils.get_db_data import get_all_countdowns
+from data.config import (
+    CLEANUP_WINDOW,
+    LATENESS_ALERT_INTERVAL,
+    LEADER_ELECTION,
+    REMINDER_BATCH,
+    REMINDER_CLAIM_WORKERS,
+    REMINDER_RENDER_WORKERS,
+    RESYNC_SCHEDULE,
+    SWEEP_INTERVAL,
+)
+from handlers.delete_countdown import goodbye_countdowns, sweep_ended
+from handlers.show_countdown import render_countdowns, render_digest
+from loader import countdowns, dp, leader, sched
+from utils import schedule_store
+from utils.calculate_diff import parse_dt
+from utils.countdown_index import Countdown
+from utils.get_db_data import iter_countdowns
+from utils.in_flight import jobs_in_flight
+from utils.lateness import lateness
+from utils.metrics import (
+    reminder_messages_saved,
+    reminder_minutes_skipped,
+    schedule_mismatches,
+)
+from utils.notify_admin import notify_on_lateness
+from utils.pipeline import Stage, run_pipeline
+from utils.send_message import send_message
+
+# reminders can be at most one hour late (missed minutes are caught up)
+MAX_REMINDER_LATENESS = dt.timedelta(hours=1)
+# seconds to remember sent reminders and clean ups for (to not repeat them)
+SENT_REMINDERS_TTL = 2 * 60 * 60
+SENT_CLEANUPS_TTL = 24 * 60 * 60
+# countdowns still in the db this long after they ended were missed by the
+# clean ups and are swept up
+SWEEP_AFTER = dt.timedelta(minutes=1)
+
+_last_tick: Union[dt.datetime, None] = None
+# time.monotonic() of the last lateness alert to the admin
+_last_alert: Union[float, None] = None
+# applies changes made by other instances while this one is the leader
+_changes_task: Union[asyncio.Task, None] = None
+# cleans up ended countdowns every second while this one is the leader
+_cleanup_task: Union[asyncio.Task, None] = None
+# compares the schedule restored from the store with the db
+_check_task: Union[asyncio.Task, None] = None
 
 
 async def schedule_reminders(
@@ -15,6 +60,8 @@ async def schedule_reminders(
 ):
     """Schedule daily reminders for a specific user.
 
+    Reminders are added to the countdown index and sent by `send_reminders`.
+
     Parameters
     ----------
     user_id : int
@@ -27,32 +74,250 @@ async def schedule_reminders(
         The format in which to send the countdown details
     """
 
-    dt_format = "%Y-%m-%dT%H:%M:%S%z"
-    dt_obj = dt.datetime.strptime(date_time, dt_format)
+    if leader.is_leader:
+        countdowns.set_reminders(user_id, cd_name, date_time, cd_format)
+    await schedule_store.save_reminders(
+        user_id, cd_name, date_time, int(cd_format)
+    )
+    logging.info("Daily reminders scheduled successfully.")
+
+
+async def schedule_digest(user_id: int, digest: bool):
+    """Turn the digest of daily reminders on or off for the user.
+
+    With the digest on, the user's reminders due in the same `DIGEST_WINDOW`
+    minutes are sent together, as one message, at the start of the window.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+    digest : bool
+        Whether the user should get a digest
+    """
+
+    if leader.is_leader:
+        countdowns.set_digest(user_id, digest)
+    await schedule_store.save_digest(user_id, digest)
+    logging.info(f"Digest turned {'on' if digest else 'off'} successfully.")
+
+
+async def send_reminders():
+    """Send all reminders that are due this minute. Runs every minute.
+
+    If previous minutes were missed (the bot was busy, the job was late or
+    the leader changed), their reminders are sent too, up to
+    `MAX_REMINDER_LATENESS` (the admin is told about the ones that are
+    skipped). A minute's reminders go out through `fan_out_reminders`.
+    Reminders are sent at most once (see `schedule_store.claim_sends`), the
+    ones a leader claimed but didn't send before dying are lost. A minute
+    that fails (e.g. redis is down) is tried again on the next run.
+    """
+
+    global _last_tick
+
+    now = dt.datetime.now(dt.timezone.utc).replace(second=0, microsecond=0)
+
+    if _last_tick is None:
+        # carry on from where the previous leader (or run) stopped
+        _last_tick = await schedule_store.load_last_tick()
+
+    if _last_tick is None:
+        minutes = [now]
+    elif now - _last_tick > MAX_REMINDER_LATENESS:
+        skipped = (now - _last_tick) // dt.timedelta(minutes=1) - 1
+        reminder_minutes_skipped.inc(skipped)
+        report = (
+            f"Reminders for {skipped} minutes after "
+            f"{_last_tick:%Y-%m-%d %H:%M} UTC were not sent, they were too "
+            "late."
+        )
+        logging.error(report)
+        await notify_on_lateness(dp, report)
+        # the skipped minutes aren't reported again if `now` fails
+        _last_tick = now - dt.timedelta(minutes=1)
+        await schedule_store.save_last_tick(_last_tick)
+        minutes = [now]
+    else:
+        minutes = []
+        minute = _last_tick + dt.timedelta(minutes=1)
+        while minute <= now:
+            minutes.append(minute)
+            minute += dt.timedelta(minutes=1)
+
+    for minute in minutes:
+        due = countdowns.due(minute)
+
+        if due:
+            sent = await fan_out_reminders(minute, due)
+            logging.info(f"Sent {sent} reminders for {minute:%H:%M}.")
+
+        # only once the minute is done, so that a minute that failed is
+        # tried again on the next tick
+        _last_tick = minute
+        await schedule_store.save_last_tick(minute)
+
+    await report_lateness()
+
+
+async def fan_out_reminders(minute: dt.datetime, due: List[Countdown]) -> int:
+    """Send the reminders due at the minute, about `REMINDER_BATCH` at a time.
+
+    Batches go through a pipeline (see `run_pipeline`): they're claimed in
+    redis (so that a reminder never goes out twice for the same minute),
+    rendered and put in the message queue. Once the message queue is full,
+    batches wait to be put in it and no more are claimed or rendered, so a
+    spike of reminders at one minute (e.g. midnight) turns into a steady
+    stream of messages instead of everything being rendered and queued at
+    once. Texts are rendered right before they're queued, so the time left
+    is up to date even when the queue is long. Delivery is recorded by the
+    lateness tracker.
+
+    Reminders of users who get a digest are kept together in a batch and
+    sent as one message (see `render_digest`).
+
+    Returns
+    -------
+    int
+        Number of reminders sent (the rest were sent by another instance)
+    """
+
+    sent = 0
+    due_at = minute.timestamp()
+
+    singles: List[Countdown] = []
+    digests: Dict[int, List[Countdown]] = {}
+    for reminder in due:
+        if countdowns.is_digest(reminder.user_id):
+            digests.setdefault(reminder.user_id, []).append(reminder)
+        else:
+            singles.append(reminder)
+    for group in digests.values():
+        # the countdown that ends first goes first
+        group.sort(key=lambda reminder: reminder.end)
+
+    def batches() -> Iterator[List[List[Countdown]]]:
+        """Groups of reminders that go to the same message (or digest)."""
+        batch: List[List[Countdown]] = []
+        size = 0
+
+        for group in itertools.chain(([r] for r in singles), digests.values()):
+            batch.append(group)
+            size += len(group)
+            if size >= REMINDER_BATCH:
+                yield batch
+                batch, size = [], 0
+        if batch:
+            yield batch
+
+    async def claim(batch: List[List[Countdown]]) -> Union[list, None]:
+        claimed = iter(
+            await schedule_store.claim_sends(
+                [
+                    f"{r.user_id}:{r.name}:{minute:%Y%m%d%H%M}"
+                    for group in batch
+                    for r in group
+                ],
+                SENT_REMINDERS_TTL,
+            )
+        )
+        batch = [[r for r in group if next(claimed)] for group in batch]
+        return [group for group in batch if group] or None
+
+    async def render(batch: List[List[Countdown]]) -> tuple:
+        texts = iter(
+            render_countdowns(
+                (r.name, r.end, r.cd_format) for group in batch for r in group
+            )
+        )
+        messages = []
+        for group in batch:
+            user_id = group[0].user_id
+            if len(group) == 1:
+                messages.append((user_id, next(texts)))
+            else:
+                digest = [next(texts) for _ in group]
+                messages.extend((user_id, m) for m in render_digest(digest))
+        return messages, sum(len(group) for group in batch)
+
+    async def enqueue(rendered: tuple):
+        nonlocal sent
+        messages, reminders = rendered
+
+        on_sent = lateness.dispatched(
+            "reminder", due_at, time.time(), len(messages)
+        )
+        for user_id, text in messages:
+            # waits while the message queue is full
+            await send_message(user_id, text, on_sent)
+        sent += reminders
+        reminder_messages_saved.inc(reminders - len(messages))
+
+    await run_pipeline(
+        batches(),
+        [
+            Stage(claim, REMINDER_CLAIM_WORKERS),
+            Stage(render, REMINDER_RENDER_WORKERS),
+            # one at a time, the message queue sends them concurrently
+            Stage(enqueue),
+        ],
+    )
+    return sent
 
-    job_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{user_id} {cd_name}"))
 
+async def report_lateness():
+    """Log how late the reminders and clean ups of finished minutes were.
+
+    If p99 lateness of a minute was over `LATENESS_SLO`, the admin is told
+    (at most once every `LATENESS_ALERT_INTERVAL` minutes).
+    """
+
+    global _last_alert
+
+    late = []
+    for summary in lateness.finished(time.time()):
+        if summary.p99 > lateness.slo:
+            logging.error(f"Over the lateness SLO: {summary}")
+            late.append(summary)
+        else:
+            logging.info(str(summary))
+
+    if not late:
+        return
+
+    now = time.monotonic()
+    if _last_alert is not None and (
+        now - _last_alert < LATENESS_ALERT_INTERVAL * 60
+    ):
+        return
+
+    _last_alert = now
+    report = "\n".join(
+        [f"p99 lateness is over {lateness.slo:g} s!"]
+        + [str(summary) for summary in late]
+    )
+    await notify_on_lateness(dp, report)
+
+
+def schedule_reminders_job():
+    """Schedule the job that sends daily reminders every minute."""
     sched.add_job(
-        send_countdown_details,
-        args=[user_id, cd_name, date_time, cd_format],
+        send_reminders,
         trigger="cron",
-        id=job_id,
-        day="*",
-        hour=dt_obj.hour,
-        minute=dt_obj.minute,
-        end_date=dt_obj,
-        timezone="UTC",
+        id="send_reminders",
+        minute="*",
         replace_existing=True,
-        misfire_grace_time=3600,  # max one hour late
+        coalesce=True,
+        max_instances=1,
+        misfire_grace_time=60,  # missed minutes are caught up by next run
     )
-    logging.info("Daily reminders scheduled successfully.")
 
 
 async def schedule_goodbye_cd(user_id: int, cd_name: str, date_time):
     """Schedule clean up to run when the countdown has ended.
 
     Clean up is just deleting the countdown information from db and deleting
-    reminders job if it still exists.
+    reminders if they are still on. It's done by `clean_up_ended`.
 
     Parameters
     ----------
@@ -64,46 +329,291 @@ async def schedule_goodbye_cd(user_id: int, cd_name: str, date_time):
         Countdown date and time (in the '%Y-%m-%dT%H:%M:%S%z' format)
     """
 
-    dt_format = "%Y-%m-%dT%H:%M:%S%z"
-    dt_obj = dt.datetime.strptime(date_time, dt_format)
+    if leader.is_leader:
+        # countdown will be up. if user has reminders on, last reminder
+        # should be delivered by the time it's cleaned up (10 seconds later)
+        # unless sth went wrong.
+        countdowns.add(user_id, cd_name, date_time)
+    await schedule_store.save_cleanup(user_id, cd_name, date_time)
+    logging.info("Clean up for countdown scheduled successfully.")
+
+
+async def clean_up(ended: List[Countdown]):
+    """Clean up countdowns due in the same window.
+
+    Every clean up is claimed in redis first, so that it runs only once even
+    if two instances both think they are the leader for a moment.
+    """
+
+    jobs_in_flight.enter()
+    try:
+        claimed = await schedule_store.claim_sends(
+            [f"bye:{c.user_id}:{c.name}:{c.date_time}" for c in ended],
+            SENT_CLEANUPS_TTL,
+        )
+        ended = [c for c, claim in zip(ended, claimed) if claim]
+
+        if ended:
+            now = time.time()
+            on_sent = {
+                (c.user_id, c.name): lateness.dispatched(
+                    "cleanup", c.end + countdowns.cleanup_delay, now
+                )
+                for c in ended
+            }
+            await goodbye_countdowns(ended, on_sent)
+            logging.info(f"Cleaned up {len(ended)} countdowns.")
+    except Exception:
+        logging.exception("UNEXPECTED: Cleaning up countdowns failed.")
+    finally:
+        jobs_in_flight.exit()
+
 
-    # countdown will be up. if user has reminders on, last reminder should be
-    # delivered by this time unless sth went wrong.
-    run_dt = dt_obj + dt.timedelta(seconds=10)
+async def clean_up_ended():
+    """Clean up countdowns that have ended. Runs every `CLEANUP_WINDOW`
+    seconds.
+
+    Countdowns are taken out of the countdown index (see
+    `CountdownIndex.ended`) at the end of every window, so everything due in
+    the same window is cleaned up as one batch (and deleted from the db with
+    one request). Countdowns that are overdue come out on the first run.
+    """
 
-    job_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"bye {user_id} {cd_name}"))
+    while True:
+        await asyncio.sleep(CLEANUP_WINDOW - time.time() % CLEANUP_WINDOW)
+        ended = countdowns.ended(int(time.time()))
 
+        if ended:
+            # a started clean up is finished even if the leader changes
+            await asyncio.shield(clean_up(ended))
+
+
+async def sweep(before: Union[dt.datetime, None] = None):
+    """Clean up countdowns that were missed by the clean ups. Runs every
+    `SWEEP_INTERVAL` minutes and when the instance becomes the leader.
+
+    These are countdowns that ended while the bot was down (and weren't in
+    the schedule store) or whose clean up failed. All of them are deleted
+    from the db with one request.
+
+    Parameters
+    ----------
+    before : Union[dt.datetime, None]
+        Sweep up countdowns that ended by this time (`SWEEP_AFTER` ago if
+        not given)
+    """
+
+    if before is None:
+        before = dt.datetime.now(dt.timezone.utc) - SWEEP_AFTER
+
+    try:
+        swept = await sweep_ended(before.isoformat())
+    except Exception:
+        logging.exception("UNEXPECTED: Sweeping up ended countdowns failed.")
+        return
+
+    if swept:
+        logging.info(f"Swept up {swept} ended countdowns.")
+
+
+def schedule_sweep_job():
+    """Schedule the job that sweeps up missed countdowns."""
     sched.add_job(
-        goodbye_countdown,
-        args=[user_id, cd_name],
-        trigger="date",
-        id=job_id,
-        run_date=run_dt,
+        sweep,
+        trigger="interval",
+        id="sweep",
+        minutes=SWEEP_INTERVAL,
         replace_existing=True,
-        misfire_grace_time=None,  # delete countdown even if late
+        coalesce=True,
+        max_instances=1,
     )
-    logging.info("Clean up for countdown scheduled successfully.")
 
 
 async def schedule_all():
-    """Recreate all jobs for the apscheduler. Will be used on startup."""
-    countdowns = await get_all_countdowns()
+    """Recreate all jobs for the apscheduler. Will be used on startup.
+
+    Jobs are restored from the schedule store. Countdowns are only read from
+    the db if the store hasn't been filled yet (or RESYNC_SCHEDULE is set).
+    """
+
+    global _check_task
+
+    schedule_reminders_job()
+    schedule_sweep_job()
+
+    # not in the db, only in the store (see schedule_store)
+    for user_id in await schedule_store.load_digests():
+        countdowns.set_digest(user_id, True)
+
+    if not RESYNC_SCHEDULE and await schedule_store.is_synced():
+        for reminder in await schedule_store.load_reminders():
+            countdowns.set_reminders(*reminder)
+
+        for cleanup in await schedule_store.load_cleanups():
+            countdowns.add(*cleanup)
+
+        logging.info("Jobs for the apscheduler restored from the store.")
+        # in the background, startup doesn't wait for all of the db
+        _check_task = asyncio.ensure_future(check_schedule())
+        return
 
-    if countdowns:
-        for countdown in countdowns:
+    await schedule_store.clear()
+    total = 0
+
+    # countdowns that ended while the bot was down are swept up (see `sweep`)
+    columns = "tg_user_id,name,date_time,reminders,cd_format"
+
+    async for page in iter_countdowns(columns):
+        saved_reminders, saved_cleanups = [], []
+
+        for countdown in page:
             name = countdown["name"]
             user_id = countdown["tg_user_id"]
             countdown_dt = countdown["date_time"]
-            reminders = countdown["reminders"]
-            cd_format = countdown["cd_format"]
 
-            if reminders:
-                await schedule_reminders(
+            if countdown.get("reminders"):
+                cd_format = countdown["cd_format"]
+                countdowns.set_reminders(
                     user_id, name, countdown_dt, cd_format
                 )
+                saved_reminders.append(
+                    (user_id, name, countdown_dt, cd_format)
+                )
 
-            await schedule_goodbye_cd(user_id, name, countdown_dt)
+            countdowns.add(user_id, name, countdown_dt)
+            saved_cleanups.append((user_id, name, countdown_dt))
 
-        logging.info("Jobs for the apscheduler recreated.")
+        # written a page at a time instead of one by one
+        await schedule_store.save(saved_reminders, saved_cleanups)
+        total += len(page)
+
+    await schedule_store.mark_synced()
+
+    if total:
+        logging.info(f"Jobs for the apscheduler recreated ({total}).")
     else:
         logging.info("No countdowns. No jobs to recreate.")
+
+
+async def check_schedule():
+    """Compare the schedule store with the countdowns in the db.
+
+    The store is only filled from the db when it's empty (or with
+    RESYNC_SCHEDULE), so if it ever misses a change (e.g. a failed write or a
+    countdown changed in the db by hand), it stays out of date. Countdowns
+    missing from the store, only in the store or different in it are logged
+    and counted in `schedule_mismatches` (changes made while checking can be
+    counted too). Set RESYNC_SCHEDULE to fill the store from the db again.
+    """
+
+    # only countdowns that haven't ended are read from the db
+    now = time.time()
+    reminders = {
+        (user_id, name): (parse_dt(date_time), cd_format)
+        for user_id, name, date_time, cd_format in (
+            await schedule_store.load_reminders()
+        )
+        if parse_dt(date_time) > now
+    }
+    cleanups = {
+        (user_id, name): parse_dt(date_time)
+        for user_id, name, date_time in await schedule_store.load_cleanups()
+        if parse_dt(date_time) > now
+    }
+    missing = different = 0
+
+    columns = "tg_user_id,name,date_time,reminders,cd_format"
+    try:
+        async for page in iter_countdowns(columns):
+            for countdown in page:
+                key = (countdown["tg_user_id"], countdown["name"])
+                end = parse_dt(countdown["date_time"])
+
+                expected = [(cleanups, end)]
+                if countdown.get("reminders"):
+                    expected.append(
+                        (reminders, (end, int(countdown["cd_format"])))
+                    )
+
+                for saved, value in expected:
+                    stored = saved.pop(key, None)
+                    if stored is None:
+                        missing += 1
+                    elif stored != value:
+                        different += 1
+    except Exception:
+        logging.exception("UNEXPECTED: Couldn't check the schedule store.")
+        return
+
+    # whatever is left isn't in the db
+    extra = len(reminders) + len(cleanups)
+
+    for kind, count in (
+        ("missing", missing),
+        ("extra", extra),
+        ("different", different),
+    ):
+        schedule_mismatches.labels(kind).set(count)
+
+    if missing or extra or different:
+        logging.error(
+            "UNEXPECTED: Schedule store differs from the db: "
+            f"{missing} missing, {extra} not in the db, {different} "
+            "different. Set RESYNC_SCHEDULE to fill it from the db again."
+        )
+    else:
+        logging.info("Schedule store matches the db.")
+
+
+async def apply_changes(pubsub):
+    """Apply schedule changes made by other instances to this one."""
+    async for change, args in schedule_store.changes(pubsub):
+        if change == "reminders":
+            countdowns.set_reminders(*args)
+        elif change == "delete_reminders":
+            countdowns.remove_reminders(*args)
+        elif change == "cleanup":
+            countdowns.add(*args)
+        elif change == "delete_cleanup":
+            countdowns.remove(*args)
+        elif change == "digest":
+            countdowns.set_digest(*args)
+
+
+async def start_scheduling():
+    """Start sending reminders and cleaning up (when elected the leader)."""
+    global _changes_task, _cleanup_task
+
+    if LEADER_ELECTION:
+        # subscribe before loading, so that no change is missed in between
+        pubsub = await schedule_store.subscribe()
+        try:
+            await schedule_all()
+        except Exception:
+            await pubsub.reset()
+            raise
+        _changes_task = asyncio.ensure_future(apply_changes(pubsub))
+    else:
+        await schedule_all()
+
+    # before the first clean up, so that countdowns that have already ended
+    # are swept up with one request instead of coming out of the index
+    await sweep(dt.datetime.now(dt.timezone.utc))
+    _cleanup_task = asyncio.ensure_future(clean_up_ended())
+
+
+async def stop_scheduling():
+    """Stop sending reminders and cleaning up (when another instance is the
+    leader now or on shutdown)."""
+    global _changes_task, _cleanup_task, _check_task, _last_tick
+
+    for task in (_changes_task, _cleanup_task, _check_task):
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    _changes_task = _cleanup_task = _check_task = None
+
+    sched.remove_all_jobs()
+    countdowns.clear()
+    lateness.clear()
+    _last_tick = None
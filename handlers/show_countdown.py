@@ -1,9 +1,121 @@
 """Show countdown operation is handled here."""
 
-from utils.calculate_diff import calculate_diff
+from functools import lru_cache
+from typing import Iterable, List, Tuple, Union
+
+from aiogram.utils.parts import MAX_MESSAGE_LENGTH
+
+from utils.calculate_diff import (
+    join_parts,
+    parse_dt,
+    time_left,
+    time_left_batch,
+)
 from utils.send_message import send_message
 
 
+@lru_cache(maxsize=10_000)
+def _heading(cd_name: str, cd_format: int) -> str:
+    """Part of the countdown text that doesn't change."""
+    text_divider = "=" * len(cd_name)
+    text = f"<b>{cd_name}</b>\n{text_divider}\n"
+
+    if cd_format != 1:
+        text += "<i>Time left:</i>\n"
+
+    return text
+
+
+def render_countdown(
+    cd_name: str, end: int, cd_format: int, now: Union[int, None] = None
+) -> str:
+    """Render how much time is left till the countdown is up.
+
+    Parameters
+    ----------
+    cd_name : str
+        Name of the countdown
+    end : int
+        Countdown end as a unix timestamp
+    cd_format : int
+        The format in which to show the countdown details
+    now : Union[int, None]
+        Current time as a unix timestamp in microseconds (taken if not given)
+    """
+
+    return _heading(cd_name, cd_format) + _body(time_left(end, now), cd_format)
+
+
+def _body(parts: List[str], cd_format: int) -> str:
+    if cd_format != 1:
+        # every part on its own line
+        return "\n".join(parts) + "\n"
+
+    return f"{join_parts(parts)} left"
+
+
+def render_countdowns(
+    countdowns: Iterable[Tuple[str, int, int]], now: Union[int, None] = None
+) -> List[str]:
+    """Render how much time is left for many countdowns at once.
+
+    Same texts as `render_countdown` gives, but the time left is calculated
+    with one `now` for the whole batch and the text of every distinct end is
+    only made once.
+
+    Parameters
+    ----------
+    countdowns : Iterable[Tuple[str, int, int]]
+        (cd_name, end, cd_format) of every countdown, end being a unix
+        timestamp
+    now : Union[int, None]
+        Current time as a unix timestamp in microseconds (taken if not given)
+    """
+
+    countdowns = list(countdowns)
+    batch = time_left_batch((end for _, end, _ in countdowns), now)
+    # end -> (text of format 1, text of format 2)
+    bodies = {
+        end: (_body(parts, 1), _body(parts, 2)) for end, parts in batch.items()
+    }
+
+    return [
+        _heading(cd_name, cd_format) + bodies[end][cd_format != 1]
+        for cd_name, end, cd_format in countdowns
+    ]
+
+
+def render_digest(texts: Iterable[str]) -> List[str]:
+    """Put rendered countdowns together into as few messages as possible.
+
+    Countdowns are separated by an empty line and a countdown is never split
+    between messages (unless it's too long for a message on its own).
+
+    Parameters
+    ----------
+    texts : Iterable[str]
+        Countdowns rendered with `render_countdown(s)`
+
+    Returns
+    -------
+    List[str]
+        Texts of the messages
+    """
+
+    messages: List[str] = []
+
+    for text in texts:
+        text = text.rstrip("\n")
+        if messages and (
+            len(messages[-1]) + 2 + len(text) <= MAX_MESSAGE_LENGTH
+        ):
+            messages[-1] += "\n\n" + text
+        else:
+            messages.append(text)
+
+    return messages
+
+
 async def send_countdown_details(
     user_id: int, cd_name: str, date_time: str, cd_format: int, scheduled=True
 ):
@@ -26,24 +138,7 @@ async def send_countdown_details(
         Identifies whether this function is being triggered by a scheduled job
     """
 
-    time_diff = calculate_diff(date_time)
-
-    text_divider = "=" * len(cd_name)
-
-    text = f"<b>{cd_name}</b>\n{text_divider}\n"
-
-    if cd_format == 1:
-        text += f"{time_diff} left"
-    else:
-        text += "<i>Time left:</i>\n"
-        time_diff_list = time_diff.split(", ")
-
-        # last item may be like -> 5 minutes and 6 seconds
-        if "and" in time_diff_list[-1]:
-            time_diff_list[-1:] = time_diff_list[-1].split(" and ")
-
-        for item in time_diff_list:
-            text += f"{item}\n"
+    text = render_countdown(cd_name, parse_dt(date_time), cd_format)
 
     if scheduled:
         await send_message(user_id, text)
@@ -10,12 +10,13 @@ import logging
 
 from aiogram import types
 from aiogram.dispatcher import FSMContext
-from timezonefinder import TimezoneFinder
 
-from loader import dp, supabase
+from loader import dp
 from states.states import Start
 from utils.get_coordinates import get_coordinates
 from utils.get_db_data import get_tz_info
+from utils.get_timezone import get_timezone
+from utils.set_db_data import add_account
 
 
 @dp.message_handler(commands="start", state="*")
@@ -57,9 +58,9 @@ async def greet_user(message: types.Message):
 async def add_user(message: types.Message, state: FSMContext):
     """Insert user info to the db if valid time zone is provided."""
     if message.location:
-        location = message.location
+        location = message.location.to_python()
     else:
-        location = get_coordinates(message.text)
+        location = await get_coordinates(message.text)
 
     if not location:
         await message.reply(
@@ -67,16 +68,16 @@ async def add_user(message: types.Message, state: FSMContext):
         )
         return
 
-    longitude, latitude = location["longitude"], location["latitude"]
-    tf = TimezoneFinder()
-    time_zone = tf.timezone_at(lng=longitude, lat=latitude)
+    # bundled cities already come with their time zone
+    time_zone = location.get("time_zone")
+
+    if not time_zone:
+        time_zone = await get_timezone(
+            location["latitude"], location["longitude"]
+        )
 
     if time_zone:
-        user_info = {
-            "tg_user_id": message.from_user.id,
-            "time_zone": time_zone,
-        }
-        supabase.table("Accounts").insert(user_info).execute()
+        await add_account(message.from_user.id, time_zone)
         logging.info("Added new user successfully.")
 
         await state.finish()
@@ -1,17 +1,36 @@
 import logging
 
-from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.fsm_storage.redis import RedisStorage2
+from aiogram import Dispatcher, types
 from apscheduler.schedulers.asyncio import AsyncIOScheduler as Scheduler
-from supabase.client import Client, create_client
 
 from data import config
+from utils.bot_session import PooledBot
+from utils.db_api import PostgrestClient
+from utils.countdown_index import CountdownIndex
+from utils.leader import LeaderElection
+from utils.state_session import StateSessionStorage
 
-supabase: Client = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+db = PostgrestClient(
+    config.SUPABASE_URL,
+    config.SUPABASE_KEY,
+    max_connections=config.DB_MAX_CONNECTIONS,
+    timeout=config.DB_TIMEOUT,
+)
 
-bot = Bot(token=config.BOT_TOKEN, parse_mode=types.ParseMode.HTML)
+# connections to the Bot API are kept open and reused (see bot_session)
+bot = PooledBot(
+    token=config.BOT_TOKEN,
+    connections=config.BOT_CONNECTIONS,
+    dns_ttl=config.BOT_DNS_TTL,
+    keepalive=config.BOT_KEEPALIVE,
+    timeout=config.BOT_TIMEOUT,
+    connect_timeout=config.BOT_CONNECT_TIMEOUT,
+    http2=config.BOT_HTTP2,
+    parse_mode=types.ParseMode.HTML,
+)
 
-storage = RedisStorage2(
+# states are read and written once per update (see utils/state_session.py)
+storage = StateSessionStorage(
     config.REDIS_HOST,
     config.REDIS_PORT,
     config.REDIS_DB,
@@ -19,11 +38,26 @@ storage = RedisStorage2(
 )
 dp = Dispatcher(bot, storage=storage)
 
+# started in on_startup, on the running event loop
 sched = Scheduler(
     timezone="Asia/Tashkent",
     daemon=True,
 )
-sched.start()
+
+# scheduled countdowns, daily reminders are sent by a single job from this
+# index (see schedule_jobs)
+countdowns = CountdownIndex(
+    reminder_spread=config.REMINDER_SPREAD,
+    digest_window=config.DIGEST_WINDOW,
+)
+
+# only the leader sends reminders and cleans up (see utils/leader.py)
+leader = LeaderElection(
+    storage,
+    "schedule:leader",
+    ttl=config.LEADER_TTL,
+    enabled=config.LEADER_ELECTION,
+)
 
 logging.basicConfig(
     level=logging.INFO,
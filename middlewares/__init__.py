@@ -0,0 +1,11 @@
+from loader import dp, storage
+
+from .in_flight import InFlightMiddleware
+from .metrics import MetricsMiddleware
+from .state_session import StateSessionMiddleware
+
+if __name__ == "middlewares":
+    # first, so that the time of the other middlewares is counted too
+    dp.middleware.setup(MetricsMiddleware())
+    dp.middleware.setup(InFlightMiddleware())
+    dp.middleware.setup(StateSessionMiddleware(storage))
@@ -0,0 +1,16 @@
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from utils.in_flight import updates_in_flight
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Count updates that are being handled, so shutdown can wait for them."""
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        updates_in_flight.enter()
+
+    async def on_post_process_update(
+        self, update: types.Update, results: list, data: dict
+    ):
+        updates_in_flight.exit()
@@ -0,0 +1,57 @@
+import time
+
+from aiogram import types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from utils.metrics import handler_seconds, update_seconds
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Time updates and the handlers that handle them (see utils.metrics)."""
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data["metrics_started"] = time.perf_counter()
+
+    async def on_post_process_update(
+        self, update: types.Update, results: list, data: dict
+    ):
+        elapsed = time.perf_counter() - data["metrics_started"]
+        # the update has its id and one of the update types
+        kind = next((k for k in update.values if k != "update_id"), "")
+        update_seconds.labels(kind).observe(elapsed)
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        self._handler_started(data)
+
+    async def on_post_process_message(
+        self, message: types.Message, results: list, data: dict
+    ):
+        self._handler_finished(data)
+
+    async def on_process_callback_query(
+        self, call: types.CallbackQuery, data: dict
+    ):
+        self._handler_started(data)
+
+    async def on_post_process_callback_query(
+        self, call: types.CallbackQuery, results: list, data: dict
+    ):
+        self._handler_finished(data)
+
+    @staticmethod
+    def _handler_started(data: dict):
+        # called right before the handler that is going to handle it
+        data["metrics_handler"] = (
+            current_handler.get().__name__,
+            time.perf_counter(),
+        )
+
+    @staticmethod
+    def _handler_finished(data: dict):
+        # not there if no handler handled the update
+        handler = data.get("metrics_handler")
+
+        if handler is not None:
+            name, started = handler
+            handler_seconds.labels(name).observe(time.perf_counter() - started)
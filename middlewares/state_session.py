@@ -0,0 +1,33 @@
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from utils.state_session import StateSessionStorage
+
+
+class StateSessionMiddleware(BaseMiddleware):
+    """Keep the user's FSM state in memory while a handler runs and save it
+    in one go afterwards (see utils.state_session)."""
+
+    def __init__(self, storage: StateSessionStorage):
+        super().__init__()
+        self.storage = storage
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        self.storage.open_session(message.chat.id, message.from_user.id)
+
+    async def on_post_process_message(
+        self, message: types.Message, results: list, data: dict
+    ):
+        await self.storage.close_session()
+
+    async def on_pre_process_callback_query(
+        self, call: types.CallbackQuery, data: dict
+    ):
+        # callback queries from inline messages have no chat
+        chat = call.message.chat.id if call.message else call.from_user.id
+        self.storage.open_session(chat, call.from_user.id)
+
+    async def on_post_process_callback_query(
+        self, call: types.CallbackQuery, results: list, data: dict
+    ):
+        await self.storage.close_session()
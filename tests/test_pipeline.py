@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from utils.pipeline import Stage, run_pipeline
+
+
+class RedisHiccup(Exception):
+    pass
+
+
+def test_claimed_batches_are_sent_when_a_later_claim_fails():
+    """Batch 1 is claimed (and waiting to be rendered) when claiming batch 2
+    fails; batch 1 must still be sent."""
+    claimed, sent = [], []
+
+    async def claim(batch):
+        if batch == 2:
+            raise RedisHiccup
+        claimed.append(batch)
+        return batch
+
+    async def render(batch):
+        # slower than claiming, so batch 1 waits here when batch 2 fails
+        await asyncio.sleep(0.05)
+        return batch
+
+    async def enqueue(batch):
+        await asyncio.sleep(0.01)
+        sent.append(batch)
+
+    with pytest.raises(RedisHiccup):
+        asyncio.run(
+            run_pipeline(
+                iter(range(1, 10)),
+                [Stage(claim, 2), Stage(render), Stage(enqueue)],
+            )
+        )
+
+    assert 1 in sent
+    # everything that was claimed was sent, nothing after the failure
+    assert sent == claimed
+    assert 9 not in claimed
+
+
+def test_no_tasks_are_left_behind():
+    async def fail(item):
+        raise RedisHiccup
+
+    async def main():
+        with pytest.raises(RedisHiccup):
+            await run_pipeline(range(5), [Stage(fail, 2), Stage(fail)])
+        return asyncio.all_tasks()
+
+    assert len(asyncio.run(main())) == 1
+
+
+def test_items_go_through_every_stage():
+    done = []
+
+    async def double(item):
+        return item * 2
+
+    async def drop_odd(item):
+        return None if item % 4 else item
+
+    async def collect(item):
+        done.append(item)
+
+    asyncio.run(
+        run_pipeline(
+            range(10),
+            [Stage(double, 3), Stage(drop_odd, 2), Stage(collect)],
+        )
+    )
+    assert sorted(done) == [0, 4, 8, 12, 16]
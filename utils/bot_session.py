@@ -0,0 +1,223 @@
+"""Bot API session tuned for sending a lot of messages.
+
+All requests to the Bot API go through one session of the bot. aiogram's
+default one closes idle connections after 15 seconds and caches DNS lookups
+for 10, so reminders (sent in bursts every minute) mostly open a new
+connection, with a new TLS handshake, every burst. `PooledBot` keeps
+connections open for longer, caches DNS lookups for longer, limits how long
+a request can take and records in metrics how often connections are reused
+and how long opening them takes (TCP connect and TLS handshake).
+
+With `http2`, requests are made with httpx over HTTP/2 (needs the h2
+package), so that they share a single connection. Requests that upload
+files still go through aiohttp.
+"""
+
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Union
+
+import aiohttp
+import httpx
+from aiogram import Bot
+from aiogram.bot import api
+from aiogram.utils import exceptions, json
+
+from utils.metrics import (
+    bot_api_connect_seconds,
+    bot_api_dns_lookups,
+    bot_api_pool_wait_seconds,
+    bot_api_requests,
+)
+
+
+async def _on_queued_start(session, context: SimpleNamespace, params):
+    context.queued = time.perf_counter()
+
+
+async def _on_queued_end(session, context: SimpleNamespace, params):
+    bot_api_pool_wait_seconds.observe(time.perf_counter() - context.queued)
+
+
+async def _on_create_start(session, context: SimpleNamespace, params):
+    context.connecting = time.perf_counter()
+
+
+async def _on_create_end(session, context: SimpleNamespace, params):
+    bot_api_connect_seconds.observe(time.perf_counter() - context.connecting)
+    bot_api_requests.labels("new").inc()
+
+
+async def _on_reuse(session, context: SimpleNamespace, params):
+    bot_api_requests.labels("reused").inc()
+
+
+async def _on_dns_hit(session, context: SimpleNamespace, params):
+    bot_api_dns_lookups.labels("hit").inc()
+
+
+async def _on_dns_miss(session, context: SimpleNamespace, params):
+    bot_api_dns_lookups.labels("miss").inc()
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_queued_start.append(_on_queued_start)
+    trace.on_connection_queued_end.append(_on_queued_end)
+    trace.on_connection_create_start.append(_on_create_start)
+    trace.on_connection_create_end.append(_on_create_end)
+    trace.on_connection_reuseconn.append(_on_reuse)
+    trace.on_dns_cache_hit.append(_on_dns_hit)
+    trace.on_dns_cache_miss.append(_on_dns_miss)
+    return trace
+
+
+class _HttpxTrace:
+    """Records the connection a request made with httpx got."""
+
+    __slots__ = ("reused", "_started")
+
+    def __init__(self):
+        self.reused = True
+        self._started = 0.0
+
+    async def __call__(self, event: str, info: dict):
+        if event == "connection.connect_tcp.started":
+            self.reused = False
+            self._started = time.perf_counter()
+        elif self._started and event in (
+            "connection.start_tls.complete",
+            # no TLS (e.g. a local Bot API server)
+            "http11.send_request_headers.started",
+            "http2.send_connection_init.started",
+        ):
+            bot_api_connect_seconds.observe(
+                time.perf_counter() - self._started
+            )
+            self._started = 0.0
+
+
+class PooledBot(Bot):
+    """Bot with a tuned and instrumented Bot API session.
+
+    Parameters
+    ----------
+    token : str
+        Bot token
+    connections : int
+        Maximum number of connections (and requests at the same time)
+    dns_ttl : int
+        Seconds DNS lookups are cached for
+    keepalive : float
+        Seconds an idle connection is kept open for
+    timeout : float
+        Seconds a request can take
+    connect_timeout : float
+        Seconds opening a connection (or waiting for a free one) can take
+    http2 : bool
+        Whether to make requests with httpx over HTTP/2
+    **kwargs
+        Passed on to `aiogram.Bot`
+    """
+
+    def __init__(
+        self,
+        token: str,
+        connections: int = 100,
+        dns_ttl: int = 300,
+        keepalive: float = 75.0,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        http2: bool = False,
+        **kwargs,
+    ):
+        super().__init__(
+            token,
+            connections_limit=connections,
+            timeout=aiohttp.ClientTimeout(
+                total=timeout, connect=connect_timeout
+            ),
+            **kwargs,
+        )
+        self._connector_init.update(
+            ttl_dns_cache=dns_ttl, keepalive_timeout=keepalive
+        )
+        self.connections = connections
+        self.keepalive = keepalive
+        self.http2 = http2
+
+        if http2:
+            # fail on startup rather than on every request
+            import h2  # noqa: F401
+
+        # created lazily so that it's bound to the running event loop
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def get_new_session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=self._connector_class(**self._connector_init),
+            json_serialize=json.dumps,
+            trace_configs=[_trace_config()],
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.connections,
+                    max_keepalive_connections=self.connections,
+                    keepalive_expiry=self.keepalive,
+                ),
+            )
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        data: Optional[Dict] = None,
+        files: Optional[Dict] = None,
+        **kwargs,
+    ) -> Union[List, Dict, bool]:
+        if not self.http2 or files:
+            return await super().request(method, data, files, **kwargs)
+
+        url = self.server.api_url(
+            token=self._ctx_token.get(self._token), method=method
+        )
+        data = {key: str(value) for key, value in (data or {}).items()}
+        timeout = self.timeout
+        trace = _HttpxTrace()
+
+        try:
+            request = self.client.build_request(
+                "POST",
+                url,
+                data=data,
+                timeout=httpx.Timeout(timeout.total, connect=timeout.connect),
+                extensions={"trace": trace},
+            )
+            response = await self.client.send(request)
+        except httpx.HTTPError as e:
+            raise exceptions.NetworkError(
+                f"httpx client throws an error: {e.__class__.__name__}: {e}"
+            )
+
+        bot_api_requests.labels("reused" if trace.reused else "new").inc()
+        return api.check_result(
+            method,
+            response.headers.get("content-type", "").split(";")[0],
+            response.status_code,
+            response.text,
+        )
+
+    async def close_sessions(self):
+        """Close the aiohttp session and the httpx client.
+
+        Not `close`, which is deprecated (and a Bot API method in aiogram 3).
+        """
+        if self._session is not None:
+            await self._session.close()
+        if self._client is not None:
+            await self._client.aclose()
@@ -1,35 +1,162 @@
 import datetime as dt
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Union
 
-from humanize.time import precisedelta
+DT_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+DAY = 24 * 60 * 60
+# the day is shown rounded if it's at most this many seconds away
+ROUND_TO_DAY = 10
 
 
-def calculate_diff(date_time: str) -> str:
-    """Calculate the time difference between specified date and now.
+@lru_cache(maxsize=100_000)
+def parse_dt(date_time: str) -> int:
+    """Convert a countdown date and time to a unix timestamp.
 
-    `precisedelta` from the `humanize` package is used to get a precise
-    representation of a timedelta object. 1 year is equivalent to 365 days and
-    1 month is equivalent to 30.5 days.
+    The same countdowns are shown again and again (every day for reminders),
+    so parsed values are memoised.
 
     Parameters
     ----------
     date_time : str
         datetime string (with time zone) in the '%Y-%m-%dT%H:%M:%S%z' format
+    """
+
+    try:
+        # a lot faster than strptime, the db gives dates like this
+        dt_obj = dt.datetime.fromisoformat(date_time)
+    except ValueError:
+        # '+0000' offsets (fromisoformat only takes '+00:00' before 3.11)
+        dt_obj = dt.datetime.strptime(date_time, DT_FORMAT)
+
+    if dt_obj.tzinfo is None:
+        raise ValueError(f"date and time without time zone: {date_time!r}")
+
+    return int(dt_obj.timestamp())
+
+
+def _plural(value: int, unit: str, singular: bool) -> str:
+    return f"{value} {unit}" if singular else f"{value} {unit}s"
+
+
+def time_left(end: int, now: Union[int, None] = None) -> List[str]:
+    """Calculate the time difference between the countdown end and now.
+
+    1 year is equivalent to 365 days and 1 month is equivalent to 30.5 days.
+    The parts are the same as the ones `precisedelta` from the `humanize`
+    package (which was used before) gives with whole seconds, including its
+    quirks: a half day left over from months is dropped ('1 month, 0 days')
+    and rounded seconds are always plural ('1 seconds').
+
+    Parameters
+    ----------
+    end : int
+        Countdown end as a unix timestamp
+    now : Union[int, None]
+        Current time as a unix timestamp in microseconds (taken if not given)
 
     Returns
     -------
-    str
-        difference between specified date and now as a string
+    List[str]
+        Non-zero parts of the difference from years down to seconds, like
+        ['1 year', '2 months', '3 days', '4 hours', '5 minutes', '6 seconds']
     """
 
-    dt_format = "%Y-%m-%dT%H:%M:%S%z"
-    dt_obj = dt.datetime.strptime(date_time, dt_format)
-    now = dt.datetime.now(dt.timezone.utc)
+    if now is None:
+        now = time.time_ns() // 1000
+
+    difference = end * 1_000_000 - now
+    days, usecs = divmod(abs(difference), DAY * 1_000_000)
+    secs, usecs = divmod(usecs, 1_000_000)
+
+    years, days = divmod(days, 365)
+    # months are 30.5 days long, so the rest is counted in half days
+    months, half_days = divmod(days * 2, 61)
 
-    difference = dt_obj - now
+    parts = []
+    if years:
+        parts.append(_plural(years, "year", years == 1))
+    if months:
+        parts.append(_plural(months, "month", months == 1))
 
     # if its very close to being a day, show it as a day
     # instead of '4 days 23 hours 59 minutes 59.99 seconds' show '5 days'
-    if difference.seconds >= 86390 and difference.seconds <= 86400:
-        return precisedelta(difference, minimum_unit="days", format="%0.f")
-    else:
-        return precisedelta(difference, format="%0.f")
+    if difference // 1_000_000 % DAY >= DAY - ROUND_TO_DAY:
+        value = half_days / 2 + secs / DAY
+        if value > 0 or not parts:
+            shown = f"{value:.0f}" if value % 1 else str(int(value))
+            parts.append(f"{shown} day" if value == 1 else f"{shown} days")
+        return parts
+
+    if half_days:
+        parts.append(_plural(half_days // 2, "day", half_days == 2))
+
+    hours, secs = divmod(secs, 3600)
+    minutes, secs = divmod(secs, 60)
+    if hours:
+        parts.append(_plural(hours, "hour", hours == 1))
+    if minutes:
+        parts.append(_plural(minutes, "minute", minutes == 1))
+
+    if usecs:
+        parts.append(f"{secs + usecs / 1_000_000:.0f} seconds")
+    elif secs or not parts:
+        parts.append(_plural(secs, "second", secs == 1))
+
+    return parts
+
+
+def time_left_batch(
+    ends: Iterable[int], now: Union[int, None] = None
+) -> Dict[int, List[str]]:
+    """Calculate the time left till many countdowns end with one "now".
+
+    Reminders that are due in the same minute end at the same time of day,
+    so their ends only differ by whole days and many of them are the same.
+    Every distinct end is only broken down once.
+
+    Parameters
+    ----------
+    ends : Iterable[int]
+        Countdown ends as unix timestamps
+    now : Union[int, None]
+        Current time as a unix timestamp in microseconds, the same for all of
+        the countdowns (taken if not given)
+
+    Returns
+    -------
+    Dict[int, List[str]]
+        Every distinct end mapped to the parts of its difference (see
+        `time_left`)
+    """
+
+    if now is None:
+        now = time.time_ns() // 1000
+
+    return {end: time_left(end, now) for end in set(ends)}
+
+
+def calculate_diff(date_time: str) -> str:
+    """Calculate the time difference between specified date and now.
+
+    Parameters
+    ----------
+    date_time : str
+        datetime string (with time zone) in the '%Y-%m-%dT%H:%M:%S%z' format
+
+    Returns
+    -------
+    str
+        difference between specified date and now as a string, like
+        '1 year, 2 months and 3 days'
+    """
+
+    return join_parts(time_left(parse_dt(date_time)))
+
+
+def join_parts(parts: List[str]) -> str:
+    """Join parts of a time difference like '1 year, 2 months and 3 days'."""
+    if len(parts) == 1:
+        return parts[0]
+
+    return f"{', '.join(parts[:-1])} and {parts[-1]}"
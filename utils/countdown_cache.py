@@ -0,0 +1,237 @@
+"""Per-user countdown cache in front of the Countdowns table.
+
+All countdowns of a user are kept in a redis hash (and in memory in front of
+it, as `Countdown` records), so browsing /my_countdowns and checking new
+countdown names doesn't query the db:
+
+    countdowns:<user_id>          "#version" -> version the hash was filled at
+                                  "<cd_name>" -> json of the countdown details
+    countdowns:<user_id>:version  version of the user's countdowns
+
+Writes go to the db first and then through the cache. Every write bumps the
+version, and the hash and in-memory copies are only used if they were made
+at the current version, so a copy that missed a write (made by another
+instance, or filled from the db while a write was going on) is never used.
+"""
+
+import asyncio
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loader import db, storage
+from utils.countdown_index import Countdown
+from utils.ttl_cache import TTLCache
+
+CACHE_PREFIX = "countdowns"
+VERSION_FIELD = "#version"  # countdown names can't have "#" in them
+REDIS_TTL = 7 * 24 * 60 * 60
+COLUMNS = "name,date_time,reminders,cd_format"
+
+# fill the hash only if no write happened since the version was read
+FILL_SCRIPT = """
+if (redis.call('get', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('del', KEYS[1])
+redis.call('hset', KEYS[1], '#version', ARGV[1], unpack(ARGV, 3))
+redis.call('expire', KEYS[1], ARGV[2])
+return 1
+"""
+# bump the version and apply the change if the hash is at the previous one
+WRITE_SCRIPT = """
+local version = redis.call('incr', KEYS[2])
+redis.call('expire', KEYS[2], ARGV[1])
+if redis.call('hget', KEYS[1], '#version') ~= tostring(version - 1) then
+    redis.call('del', KEYS[1])
+    return version
+end
+local deleted = tonumber(ARGV[2])
+for i = 3, 2 + deleted do
+    redis.call('hdel', KEYS[1], ARGV[i])
+end
+for i = 3 + deleted, #ARGV, 2 do
+    redis.call('hset', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('hset', KEYS[1], '#version', version)
+redis.call('expire', KEYS[1], ARGV[1])
+return version
+"""
+
+# user_id -> (version, {cd_name: Countdown})
+local_cache = TTLCache(maxsize=10000, ttl=5 * 60)
+_memory_hits = 0
+_redis_hits = 0
+_db_queries = 0
+
+
+def cache_info() -> dict:
+    """Get countdown cache counters (where countdown lookups were answered)."""
+    return {
+        "memory_hits": _memory_hits,
+        "redis_hits": _redis_hits,
+        "db_queries": _db_queries,
+    }
+
+
+def _keys(user_id: int) -> Tuple[str, str]:
+    key = f"{CACHE_PREFIX}:{user_id}"
+    return key, f"{key}:version"
+
+
+def _dump(countdowns: Iterable[Countdown]) -> list:
+    fields = []
+    for countdown in countdowns:
+        fields += [countdown.name, json.dumps(countdown.details())]
+    return fields
+
+
+async def get_countdowns(user_id: int) -> Dict[str, Countdown]:
+    """Get all countdowns of the user.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+
+    Returns
+    -------
+    Dict[str, Countdown]
+        Countdown names mapped to the countdowns. Shared with the cache, so
+        they must not be modified.
+    """
+
+    global _memory_hits, _redis_hits, _db_queries
+
+    redis = await storage.redis()
+    key, version_key = _keys(user_id)
+
+    found, cached = local_cache.get(user_id)
+    if found:
+        version = await redis.get(version_key) or "0"
+        if cached[0] == version:
+            _memory_hits += 1
+            return cached[1]
+        saved = await redis.hgetall(key)
+    else:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.get(version_key)
+            pipe.hgetall(key)
+            version, saved = await pipe.execute()
+        version = version or "0"
+
+    if saved.get(VERSION_FIELD) == version:
+        _redis_hits += 1
+        countdowns = {}
+        for name, details in saved.items():
+            if name != VERSION_FIELD:
+                countdown = Countdown.from_row(
+                    user_id, {"name": name, **json.loads(details)}
+                )
+                countdowns[countdown.name] = countdown
+    else:
+        _db_queries += 1
+        data = await db.select("Countdowns", COLUMNS, tg_user_id=user_id)
+        countdowns = {}
+        for row in data:
+            countdown = Countdown.from_row(user_id, row)
+            countdowns[countdown.name] = countdown
+
+        filled = await redis.eval(
+            FILL_SCRIPT,
+            2,
+            key,
+            version_key,
+            version,
+            REDIS_TTL,
+            *_dump(countdowns.values()),
+        )
+        if not filled:
+            # the countdowns were changed while reading them, the next read
+            # gets them again
+            return countdowns
+
+    local_cache.set(user_id, (version, countdowns))
+    return countdowns
+
+
+async def _write(
+    user_id: int,
+    deleted: Iterable[str] = (),
+    changed: Optional[Dict[str, Countdown]] = None,
+):
+    """Apply a change (already made in the db) to the cache."""
+    deleted = list(deleted)
+    changed = changed or {}
+
+    redis = await storage.redis()
+    key, version_key = _keys(user_id)
+
+    args = [REDIS_TTL, len(deleted), *deleted, *_dump(changed.values())]
+
+    version = await redis.eval(WRITE_SCRIPT, 2, key, version_key, *args)
+
+    found, cached = local_cache.get(user_id)
+    if found and cached[0] == str(int(version) - 1):
+        # a new dict, the old one may still be used by a reader
+        countdowns = {
+            name: details
+            for name, details in cached[1].items()
+            if name not in deleted
+        }
+        countdowns.update(changed)
+        local_cache.set(user_id, (str(version), countdowns))
+    else:
+        local_cache.delete(user_id)
+
+
+async def save_countdown(
+    user_id: int, countdown: dict, old_name: Optional[str] = None
+):
+    """Cache a created or updated countdown.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+    countdown : dict
+        Countdown with (at least) name, date_time, reminders and cd_format
+    old_name : Optional[str]
+        Name of the countdown before it was renamed
+    """
+
+    record = Countdown.from_row(user_id, countdown)
+    deleted = [old_name] if old_name and old_name != record.name else []
+    await _write(user_id, deleted, {record.name: record})
+
+
+async def delete_countdown(user_id: int, cd_name: str):
+    """Remove a deleted countdown from the cache.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+    cd_name : str
+        Countdown name
+    """
+
+    await _write(user_id, deleted=[cd_name])
+
+
+async def delete_countdowns(countdowns: Iterable[Tuple[int, str]]):
+    """Remove many deleted countdowns (of any users) from the cache.
+
+    Parameters
+    ----------
+    countdowns : Iterable[Tuple[int, str]]
+        (user_id, cd_name) of every deleted countdown
+    """
+
+    by_user: Dict[int, List[str]] = defaultdict(list)
+    for user_id, cd_name in countdowns:
+        by_user[user_id].append(cd_name)
+
+    await asyncio.gather(
+        *(_write(user_id, deleted=names) for user_id, names in by_user.items())
+    )
@@ -0,0 +1,399 @@
+"""Countdowns kept in memory as compact records.
+
+Every countdown is a `Countdown` with four slots instead of a row dict or
+job arguments full of strings: the user id, the (interned) name, the end as a
+unix timestamp and flags (daily reminders on and the format). The index
+finds them by user and, for countdowns with daily reminders, by the UTC
+minute of the day the reminders are sent at. Reminders are sent every day at
+the same time as the countdown ends, so a single tick per minute only has to
+look at one bucket.
+
+Reminders can be spread over the minutes before that time (see
+`reminder_offset`), so that they don't all go out at the same few minutes
+(e.g. midnight, the default time of a countdown). Users who get a digest
+have their reminders sent at the start of the window (of `digest_window`
+minutes) their time falls in, so that the ones in the same window are due
+together and can be sent as one message.
+
+Every countdown in the index is also in an `ExpiryWheel` at the second it
+should be cleaned up at (a little after it ends), so the countdowns to clean
+up are taken out of the wheel every second instead of each one having its own
+scheduler job.
+"""
+
+import datetime as dt
+import sys
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Set, Union
+
+from utils.calculate_diff import parse_dt
+from utils.expiry_wheel import ExpiryWheel
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def reminder_offset(user_id: int, cd_name: str, spread: int) -> int:
+    """Get how many minutes before the countdown's time of day its daily
+    reminders are sent at.
+
+    The offset is picked from a hash of the countdown, so it's the same
+    every day (and after restarts) and the countdowns ending at the same
+    minute are spread evenly over the `spread` minutes before it.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+    cd_name : str
+        Name of the countdown
+    spread : int
+        Number of minutes to spread reminders over (0 to not spread them)
+    """
+
+    if spread <= 1:
+        return 0
+    return zlib.crc32(f"{user_id}:{cd_name}".encode()) % spread
+
+
+class Countdown:
+    """A countdown as kept in memory.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+    name : str
+        Countdown name (interned, many users have the same ones)
+    end : int
+        Countdown end as a unix timestamp
+    reminders : bool
+        Whether daily reminders are on
+    cd_format : int
+        The format in which to send the countdown details
+    """
+
+    __slots__ = ("user_id", "name", "end", "flags")
+
+    REMINDERS = 1
+    FORMAT_2 = 2
+
+    def __init__(
+        self,
+        user_id: int,
+        name: str,
+        end: int,
+        reminders: bool = False,
+        cd_format: int = 1,
+    ):
+        self.user_id = user_id
+        self.name = sys.intern(name)
+        self.end = end
+        self.flags = 0
+        self.set_reminders(reminders, cd_format)
+
+    def __repr__(self) -> str:
+        return (
+            f"Countdown({self.user_id!r}, {self.name!r}, {self.end!r}, "
+            f"reminders={self.reminders!r}, cd_format={self.cd_format!r})"
+        )
+
+    @classmethod
+    def from_row(cls, user_id: int, row: dict) -> "Countdown":
+        """Make a countdown out of a Countdowns row (or its details)."""
+        return cls(
+            user_id,
+            row["name"],
+            parse_dt(row["date_time"]),
+            row.get("reminders", False),
+            row.get("cd_format", 1),
+        )
+
+    @property
+    def reminders(self) -> bool:
+        return bool(self.flags & self.REMINDERS)
+
+    @property
+    def cd_format(self) -> int:
+        return 2 if self.flags & self.FORMAT_2 else 1
+
+    @property
+    def date_time(self) -> str:
+        """Countdown end (UTC) in the '%Y-%m-%dT%H:%M:%S%z' format."""
+        return dt.datetime.fromtimestamp(self.end, dt.timezone.utc).isoformat()
+
+    @property
+    def minute(self) -> int:
+        """UTC minute of the day the countdown ends at."""
+        return self.end // 60 % MINUTES_PER_DAY
+
+    def set_reminders(self, reminders: bool, cd_format: int):
+        self.flags = (self.REMINDERS if reminders else 0) | (
+            self.FORMAT_2 if int(cd_format) == 2 else 0
+        )
+
+    def details(self) -> dict:
+        """Countdown details like they are in the Countdowns table."""
+        return {
+            "date_time": self.date_time,
+            "reminders": self.reminders,
+            "cd_format": self.cd_format,
+        }
+
+
+class CountdownIndex:
+    """Countdowns by user, daily reminders by the minute they're sent at and
+    clean ups by the second they're due at.
+
+    Parameters
+    ----------
+    cleanup_delay : int
+        Seconds after the end of a countdown to clean it up at
+    reminder_spread : int
+        Number of minutes before the countdown's time of day to spread its
+        daily reminders over (see `reminder_offset`), 0 to send them at
+        that time
+    digest_window : int
+        Number of minutes whose reminders go in the same digest
+    """
+
+    def __init__(
+        self,
+        cleanup_delay: int = 10,
+        reminder_spread: int = 0,
+        digest_window: int = 60,
+    ):
+        self.cleanup_delay = cleanup_delay
+        self.reminder_spread = reminder_spread
+        self.digest_window = digest_window
+        self._users: Dict[int, Dict[str, Countdown]] = {}
+        # records hash by identity, so a set is the cheapest bucket
+        self._buckets: Dict[int, Set[Countdown]] = defaultdict(set)
+        self._cleanups = ExpiryWheel()
+        # users who get their reminders in a digest
+        self._digests: Set[int] = set()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get(self, user_id: int, cd_name: str) -> Union[Countdown, None]:
+        """Get the countdown if it's in the index."""
+        return self._users.get(user_id, {}).get(cd_name)
+
+    def user_countdowns(self, user_id: int) -> List[Countdown]:
+        """Get all countdowns of the user."""
+        return list(self._users.get(user_id, {}).values())
+
+    def clear(self):
+        """Remove all countdowns."""
+        self._users.clear()
+        self._buckets.clear()
+        self._cleanups.clear()
+        self._digests.clear()
+        self._size = 0
+
+    def add(self, user_id: int, cd_name: str, date_time: str) -> Countdown:
+        """Add the countdown (or move its end), reminders stay as they are.
+
+        The countdown is cleaned up `cleanup_delay` seconds after it ends
+        (see `ended`).
+
+        Parameters
+        ----------
+        user_id : int
+            Telegram user id
+        cd_name : str
+            Name of the countdown
+        date_time : str
+            Countdown date and time (in the '%Y-%m-%dT%H:%M:%S%z' format)
+        """
+
+        end = parse_dt(date_time)
+        countdown = self.get(user_id, cd_name)
+
+        if countdown is None:
+            countdown = Countdown(user_id, cd_name, end)
+            self._users.setdefault(user_id, {})[countdown.name] = countdown
+            self._cleanups.add(countdown, end + self.cleanup_delay)
+            self._size += 1
+        elif countdown.end != end:
+            self._unbucket(countdown)
+            self._cleanups.cancel(
+                countdown, countdown.end + self.cleanup_delay
+            )
+            countdown.end = end
+            self._cleanups.add(countdown, end + self.cleanup_delay)
+            if countdown.reminders:
+                self._buckets[self._minute(countdown)].add(countdown)
+
+        return countdown
+
+    def set_reminders(
+        self, user_id: int, cd_name: str, date_time: str, cd_format: int
+    ):
+        """Turn daily reminders on for the countdown (adding it if needed).
+
+        Parameters
+        ----------
+        user_id : int
+            Telegram user id to whom the reminders should be sent
+        cd_name : str
+            Name of the countdown
+        date_time : str
+            Countdown date and time (in the '%Y-%m-%dT%H:%M:%S%z' format)
+        cd_format : int
+            The format in which to send the countdown details
+        """
+
+        countdown = self.add(user_id, cd_name, date_time)
+        countdown.set_reminders(True, cd_format)
+        self._buckets[self._minute(countdown)].add(countdown)
+
+    def is_digest(self, user_id: int) -> bool:
+        """Check whether the user gets their reminders in a digest."""
+        return user_id in self._digests
+
+    def set_digest(self, user_id: int, digest: bool):
+        """Turn the digest on or off for the user.
+
+        Reminders of the user's countdowns are moved to the minutes they're
+        sent at now.
+        """
+
+        if digest == self.is_digest(user_id):
+            return
+
+        reminders = [
+            countdown
+            for countdown in self.user_countdowns(user_id)
+            if countdown.reminders
+        ]
+        for countdown in reminders:
+            self._unbucket(countdown)
+
+        if digest:
+            self._digests.add(user_id)
+        else:
+            self._digests.discard(user_id)
+
+        for countdown in reminders:
+            self._buckets[self._minute(countdown)].add(countdown)
+
+    def remove_reminders(self, user_id: int, cd_name: str) -> bool:
+        """Turn daily reminders off for the countdown.
+
+        Returns
+        -------
+        bool
+            True if the countdown had reminders, else False
+        """
+
+        countdown = self.get(user_id, cd_name)
+
+        if countdown is None or not countdown.reminders:
+            return False
+
+        self._unbucket(countdown)
+        countdown.set_reminders(False, countdown.cd_format)
+        return True
+
+    def remove(self, user_id: int, cd_name: str) -> bool:
+        """Remove the countdown (with its reminders and clean up).
+
+        Returns
+        -------
+        bool
+            True if the countdown was in the index, else False
+        """
+
+        countdowns = self._users.get(user_id)
+        countdown = countdowns.pop(cd_name, None) if countdowns else None
+
+        if countdown is None:
+            return False
+
+        if not countdowns:
+            del self._users[user_id]
+        self._unbucket(countdown)
+        self._cleanups.cancel(countdown, countdown.end + self.cleanup_delay)
+        self._size -= 1
+        return True
+
+    def due(self, now: dt.datetime) -> List[Countdown]:
+        """Get countdowns whose reminders should be sent at the given minute.
+
+        Reminders of countdowns that have already ended are turned off.
+
+        Parameters
+        ----------
+        now : dt.datetime
+            Time zone aware datetime of the minute to get reminders for
+        """
+
+        now = now.astimezone(dt.timezone.utc)
+        bucket = self._buckets.get(now.hour * 60 + now.minute)
+
+        if not bucket:
+            return []
+
+        # the last reminder goes out at the same minute as the countdown ends
+        # (or a few minutes before if reminders are spread)
+        minute_start = int(now.replace(second=0, microsecond=0).timestamp())
+        due = []
+
+        for countdown in list(bucket):
+            if countdown.end < minute_start:
+                self.remove_reminders(countdown.user_id, countdown.name)
+            else:
+                due.append(countdown)
+
+        return due
+
+    def ended(self, now: int) -> List[Countdown]:
+        """Take out countdowns that are due to be cleaned up.
+
+        The countdowns are removed from the index (with their reminders).
+
+        Parameters
+        ----------
+        now : int
+            Current unix timestamp
+        """
+
+        ended = self._cleanups.expire(now)
+
+        for countdown in ended:
+            countdowns = self._users[countdown.user_id]
+            del countdowns[countdown.name]
+            if not countdowns:
+                del self._users[countdown.user_id]
+            self._unbucket(countdown)
+
+        self._size -= len(ended)
+        return ended
+
+    def _minute(self, countdown: Countdown) -> int:
+        """UTC minute of the day the countdown's reminders are sent at."""
+        if countdown.user_id in self._digests:
+            # the whole digest is spread (by the user), not every reminder
+            window = self.digest_window
+            minute = countdown.minute // window * window
+            offset = reminder_offset(
+                countdown.user_id, "", self.reminder_spread
+            )
+        else:
+            minute = countdown.minute
+            offset = reminder_offset(
+                countdown.user_id, countdown.name, self.reminder_spread
+            )
+        return (minute - offset) % MINUTES_PER_DAY
+
+    def _unbucket(self, countdown: Countdown):
+        minute = self._minute(countdown)
+        bucket = self._buckets.get(minute)
+
+        if bucket is not None:
+            bucket.discard(countdown)
+            if not bucket:
+                del self._buckets[minute]
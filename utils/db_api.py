@@ -0,0 +1,149 @@
+"""Async client for the Supabase REST (PostgREST) API.
+
+The supabase-py client is synchronous, so every query made with it blocks the
+event loop (and with it every other update and scheduled job). This client
+talks to the same REST endpoint through a single pooled httpx session instead.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional, Union
+
+import httpx
+
+from utils.metrics import db_errors, db_request_seconds
+
+
+class PostgrestClient:
+    """Pooled async client for the PostgREST API exposed by Supabase.
+
+    Parameters
+    ----------
+    url : str
+        Supabase project url
+    key : str
+        Supabase api key
+    max_connections : int
+        Maximum number of connections (and concurrent requests) to the API
+    timeout : float
+        Timeout (in seconds) for a single request
+    """
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        max_connections: int = 20,
+        timeout: float = 10.0,
+    ):
+        self.base_url = f"{url}/rest/v1"
+        self.headers = {
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Prefer": "return=representation",
+        }
+        self.max_connections = max_connections
+        self.timeout = timeout
+
+        # created lazily so that they are bound to the running event loop
+        self._session: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def session(self) -> httpx.AsyncClient:
+        if self._session is None or self._session.is_closed:
+            self._session = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        return self._session
+
+    async def request(
+        self,
+        method: str,
+        table: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Union[dict, list, None] = None,
+    ) -> list:
+        """Make a request to the API and return the rows from the response.
+
+        Parameters
+        ----------
+        method : str
+            HTTP method (GET, POST, PATCH, DELETE)
+        table : str
+            Table name
+        params : Optional[Dict[str, Any]]
+            Query parameters (columns to select and PostgREST filters)
+        json : Union[dict, list, None]
+            Request body
+
+        Returns
+        -------
+        list
+            Rows returned by the API (selected, inserted, updated or deleted)
+        """
+
+        session = self.session
+        start = time.perf_counter()
+
+        try:
+            async with self._semaphore:  # type: ignore
+                response = await session.request(
+                    method, f"/{table}", params=params, json=json
+                )
+            response.raise_for_status()
+        except Exception:
+            db_errors.labels(method, table).inc()
+            raise
+        finally:
+            # waiting for a free connection included
+            db_request_seconds.labels(method, table).observe(
+                time.perf_counter() - start
+            )
+
+        return response.json()
+
+    async def select(self, table: str, columns: str = "*", **filters) -> list:
+        """Select rows where each column in `filters` equals the given value."""
+        params = {"select": columns, **eq_filters(filters)}
+        return await self.request("GET", table, params=params)
+
+    async def insert(self, table: str, row: dict) -> list:
+        """Insert a row into the table."""
+        return await self.request("POST", table, json=row)
+
+    async def update(self, table: str, values: dict, **filters) -> list:
+        """Update rows where each column in `filters` equals the given value."""
+        return await self.request(
+            "PATCH", table, params=eq_filters(filters), json=values
+        )
+
+    async def delete(self, table: str, **filters) -> list:
+        """Delete rows where each column in `filters` equals the given value."""
+        return await self.request("DELETE", table, params=eq_filters(filters))
+
+    async def close(self):
+        """Close the underlying session (and all of its connections)."""
+        if self._session is not None:
+            await self._session.aclose()
+
+
+def eq_filters(filters: Dict[str, Any]) -> Dict[str, str]:
+    """Convert {"column": value} pairs to PostgREST equality filters."""
+    params = {}
+
+    for column, value in filters.items():
+        if isinstance(value, bool):
+            # postgrest expects lowercase booleans
+            value = str(value).lower()
+        params[column] = f"eq.{value}"
+
+    return params
@@ -0,0 +1,131 @@
+"""Timing wheel for things that expire at a given second.
+
+Items are kept in a slot for the second they expire at: a hashed timing wheel
+with a slot per second, kept sparse in a dict, so a wheel with a slot for
+every second of the next ten years costs nothing for the empty ones. Adding
+and cancelling is O(1) (a set add or discard), and everything due in the same
+second comes out of `expire` together, as one batch.
+
+Most seconds only have one item, so a slot holds the item itself and only
+becomes a set when a second item is added to it (an empty set alone is
+bigger than a countdown record).
+"""
+
+from typing import Dict, Hashable, List, Set, Union
+
+
+class ExpiryWheel:
+    """Items by the unix timestamp (in seconds) they expire at.
+
+    Items are kept in sets, so they have to be hashable (and are only kept
+    once per second). They can't be sets themselves.
+    """
+
+    def __init__(self):
+        self._slots: Dict[int, Union[Hashable, Set[Hashable]]] = {}
+        # next second to expire, None until the first `expire`
+        self._cursor: Union[int, None] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _slot(self, at: int) -> int:
+        # items that are already due go to the next second to expire
+        if self._cursor is not None and at < self._cursor:
+            return self._cursor
+        return at
+
+    def add(self, item: Hashable, at: int):
+        """Add the item to expire at the given second.
+
+        Parameters
+        ----------
+        item : Hashable
+            Item to add
+        at : int
+            Unix timestamp the item expires at. If it has already passed,
+            the item is returned by the next `expire`.
+        """
+
+        second = self._slot(at)
+        slot = self._slots.get(second)
+
+        if slot is None:
+            self._slots[second] = item
+        elif isinstance(slot, set):
+            if item in slot:
+                return
+            slot.add(item)
+        elif slot == item:
+            return
+        else:
+            self._slots[second] = {slot, item}
+
+        self._size += 1
+
+    def cancel(self, item: Hashable, at: int) -> bool:
+        """Remove the item (added to expire at the given second).
+
+        Returns
+        -------
+        bool
+            True if the item was in the wheel, else False (e.g. it has
+            already expired)
+        """
+
+        second = self._slot(at)
+        slot = self._slots.get(second)
+
+        if isinstance(slot, set):
+            if item not in slot:
+                return False
+            slot.remove(item)
+            if not slot:
+                del self._slots[second]
+        elif slot is not None and slot == item:
+            del self._slots[second]
+        else:
+            return False
+
+        self._size -= 1
+        return True
+
+    def expire(self, now: int) -> List[Hashable]:
+        """Take out every item that expires at or before the given second.
+
+        Parameters
+        ----------
+        now : int
+            Current unix timestamp
+
+        Returns
+        -------
+        List[Hashable]
+            Expired items, in the order they expired in
+        """
+
+        if self._cursor is None or now - self._cursor > len(self._slots):
+            # first run or far behind: only look at the slots there are
+            seconds = sorted(second for second in self._slots if second <= now)
+        else:
+            seconds = range(self._cursor, now + 1)
+
+        expired: List[Hashable] = []
+        for second in seconds:
+            slot = self._slots.pop(second, None)
+            if isinstance(slot, set):
+                expired.extend(slot)
+            elif slot is not None:
+                expired.append(slot)
+
+        self._size -= len(expired)
+        if self._cursor is None or now >= self._cursor:
+            self._cursor = now + 1
+        return expired
+
+    def clear(self):
+        """Remove all items."""
+        self._slots.clear()
+        self._cursor = None
+        self._size = 0
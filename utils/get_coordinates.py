@@ -1,9 +1,128 @@
-from typing import Union
+"""Find coordinates (and time zone if known) for a city name.
 
-from geopy.geocoders import Nominatim
+Places are looked up in this order:
+    1. Bundled table of the biggest cities (data/cities.csv)
+    2. Previous Nominatim answers cached in redis
+    3. Nominatim itself (no more than 1 request per second as required by its
+       usage policy, identical queries in flight share a single request)
 
+geopy is only imported when Nominatim is asked for the first time.
+"""
 
-def get_coordinates(address: str) -> Union[dict, None]:
+import asyncio
+import csv
+import json
+import logging
+import os
+import unicodedata
+from typing import Dict, Union
+
+from loader import storage
+from utils.token_bucket import TokenBucket
+
+CITIES_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "cities.csv"
+)
+CACHE_PREFIX = "geocode"
+# places that were not found are forgotten after a day (might be added later)
+NOT_FOUND_TTL = 24 * 60 * 60
+
+_cities: Union[Dict[str, dict], None] = None
+_in_flight: Dict[str, asyncio.Future] = {}
+_limiter = TokenBucket(rate=1, capacity=1)
+_geolocator = None
+
+
+def normalise(address: str) -> str:
+    """Normalise address so that different spellings share the cache entry.
+
+    Case, accents, hyphens and extra whitespace are ignored, so "Tashkent",
+    " tashkent " and "TASHKENT" are all the same.
+    """
+
+    address = unicodedata.normalize("NFKD", address.casefold())
+    address = "".join(ch for ch in address if not unicodedata.combining(ch))
+    return " ".join(address.replace("-", " ").split())
+
+
+def load_cities() -> Dict[str, dict]:
+    """Load the bundled table of cities (once), keyed by normalised name.
+
+    The table is ordered by population, so if several cities share a name,
+    the biggest one is used.
+    """
+
+    global _cities
+
+    if _cities is None:
+        _cities = {}
+
+        with open(CITIES_FILE, encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                location = {
+                    "longitude": float(row["longitude"]),
+                    "latitude": float(row["latitude"]),
+                    "time_zone": row["timezone"],
+                }
+                names = [row["name"]] + row["alternate_names"].split("|")
+
+                for name in filter(None, map(normalise, names)):
+                    _cities.setdefault(name, location)
+
+    return _cities
+
+
+async def _geocode(address: str) -> Union[dict, None]:
+    """Ask Nominatim for the coordinates (rate limited)."""
+    global _geolocator
+
+    if _geolocator is None:
+        from geopy.adapters import AioHTTPAdapter
+        from geopy.geocoders import Nominatim
+
+        _geolocator = Nominatim(
+            user_agent="countdownTgBot", adapter_factory=AioHTTPAdapter
+        )
+
+    await _limiter.acquire()
+    location = await _geolocator.geocode(address)
+
+    if location:
+        return {
+            "longitude": location.longitude,  # type: ignore
+            "latitude": location.latitude,  # type: ignore
+        }
+    else:
+        return None
+
+
+async def _lookup(key: str) -> Union[dict, None]:
+    """Look up the place in the redis cache, then ask Nominatim."""
+    redis = await storage.redis()
+    cache_key = f"{CACHE_PREFIX}:{key}"
+
+    cached = await redis.get(cache_key)
+    if cached is not None:
+        return json.loads(cached)
+
+    from geopy.exc import GeopyError
+
+    try:
+        coordinates = await _geocode(key)
+    except GeopyError:
+        # not cached, the problem might be temporary
+        logging.exception("Geocoding request failed.")
+        return None
+
+    await redis.set(
+        cache_key,
+        json.dumps(coordinates),
+        ex=None if coordinates else NOT_FOUND_TTL,
+    )
+    return coordinates
+
+
+async def get_coordinates(address: str) -> Union[dict, None]:
     """Get coordinates (longitude and latitude) for a given address.
 
     Parameters
@@ -14,17 +133,36 @@ def get_coordinates(address: str) -> Union[dict, None]:
     Returns
     -------
     Union[dict, None]
-        dict with longitude and latitude values if location is valid, else None
+        dict with longitude and latitude values (and time zone if it is
+        already known) if location is valid, else None
     """
 
-    geolocator = Nominatim(user_agent="countdownTgBot")
-    location = geolocator.geocode(address)
-
-    if location:
-        coordinates = {
-            "longitude": location.longitude,  # type: ignore
-            "latitude": location.latitude,  # type: ignore
-        }
-        return coordinates
-    else:
+    key = normalise(address)
+    if not key:
         return None
+
+    cities = _cities
+    if cities is None:
+        # first lookup, read the table without blocking the event loop
+        loop = asyncio.get_running_loop()
+        cities = await loop.run_in_executor(None, load_cities)
+
+    city = cities.get(key)
+    if city:
+        return city
+
+    # wait for the same query if it is already in progress
+    if key in _in_flight:
+        return await asyncio.shield(_in_flight[key])
+
+    task = asyncio.ensure_future(_lookup(key))
+    task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    _in_flight[key] = task
+
+    return await asyncio.shield(task)
+
+
+async def close_geocoder():
+    """Close the Nominatim http session if it was opened."""
+    if _geolocator is not None:
+        await _geolocator.__aexit__(None, None, None)
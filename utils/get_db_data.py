@@ -1,12 +1,34 @@
 """Basic select queries."""
 
-from typing import Union
+import datetime as dt
+from typing import AsyncIterator, Union
 
-from loader import supabase
+from loader import db, storage
+from utils import countdown_cache
+from utils.ttl_cache import TTLCache
+
+# time zones almost never change, so they are cached in memory and in redis.
+# the in-memory entries expire sooner so that processes don't drift apart.
+# users without a time zone are only cached in redis: they're about to set
+# one, and invalidate_tz_info can't reach the memory of other instances.
+TZ_CACHE_PREFIX = "tz"
+TZ_REDIS_TTL = 7 * 24 * 60 * 60
+tz_cache = TTLCache(maxsize=10000, ttl=5 * 60)
+_tz_redis_hits = 0
+_tz_db_queries = 0
+
+
+def tz_cache_info() -> dict:
+    """Get time zone cache counters (where time zone lookups were answered)."""
+    return {
+        "memory_hits": tz_cache.hits,
+        "redis_hits": _tz_redis_hits,
+        "db_queries": _tz_db_queries,
+    }
 
 
 async def get_tz_info(user_id: int) -> Union[str, None]:
-    """Get user's time zone information from the db.
+    """Get user's time zone information (cached) from the db.
 
     Parameters
     ----------
@@ -19,25 +41,58 @@ async def get_tz_info(user_id: int) -> Union[str, None]:
         str if time zone informaton is found, None otherwise.
     """
 
-    tz_info = (
-        supabase.table("Accounts")
-        .select("time_zone")
-        .eq("tg_user_id", user_id)
-        .execute()
-    )
+    global _tz_redis_hits, _tz_db_queries
+
+    found, time_zone = tz_cache.get(user_id)
+    if found:
+        return time_zone
+
+    redis = await storage.redis()
+    cache_key = f"{TZ_CACHE_PREFIX}:{user_id}"
+
+    cached = await redis.get(cache_key)
+    if cached is not None:
+        _tz_redis_hits += 1
+        # empty string -> user has no time zone set
+        time_zone = cached or None
+        if time_zone is not None:
+            tz_cache.set(user_id, time_zone)
+        return time_zone
+
+    _tz_db_queries += 1
+    tz_info = await db.select("Accounts", "time_zone", tg_user_id=user_id)
 
     try:
-        # tz_info[0] -> list containing the results of the query
-        # tz-info[0] -> [{'time_zone': 'Asia/Tashkent'}]
-        assert len(tz_info[0]) > 0
+        # tz_info -> [{'time_zone': 'Asia/Tashkent'}]
+        assert len(tz_info) > 0
     except AssertionError:
-        return None
+        time_zone = None
     else:
-        return tz_info[0][0]["time_zone"]
+        time_zone = tz_info[0]["time_zone"]
+
+    await redis.set(cache_key, time_zone or "", ex=TZ_REDIS_TTL)
+    if time_zone is not None:
+        tz_cache.set(user_id, time_zone)
+
+    return time_zone
+
+
+async def invalidate_tz_info(user_id: int):
+    """Forget cached time zone information of the user.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+    """
+
+    tz_cache.delete(user_id)
+    redis = await storage.redis()
+    await redis.delete(f"{TZ_CACHE_PREFIX}:{user_id}")
 
 
 async def get_countdown_names(user_id: int) -> Union[list, None]:
-    """Get user's countdown names from the db.
+    """Get user's countdown names (cached, see utils/countdown_cache.py).
 
     Parameters
     ----------
@@ -50,24 +105,13 @@ async def get_countdown_names(user_id: int) -> Union[list, None]:
         list if at least one countdown is found, None otherwise.
     """
 
-    data = (
-        supabase.table("Countdowns")
-        .select("name")
-        .eq("tg_user_id", user_id)
-        .execute()
-    )
+    countdowns = await countdown_cache.get_countdowns(user_id)
 
-    try:
-        # data[0] -> [{'name': 'end of the world'}, {'name': 'hello there'}]
-        assert len(data[0]) > 0
-    except AssertionError:
-        return None
-    else:
-        return [countdown["name"] for countdown in data[0]]
+    return list(countdowns) or None
 
 
 async def get_countdown_details(user_id: int, name: str) -> Union[dict, None]:
-    """Get specific countdown's details from the db.
+    """Get specific countdown's details (cached, see utils/countdown_cache.py).
 
     Parameters
     ----------
@@ -79,40 +123,59 @@ async def get_countdown_details(user_id: int, name: str) -> Union[dict, None]:
     Returns
     -------
     Union[dict, None]
-        Countdown details as a dictionary if countdown is found, None otherwise
+        Countdown details (date_time, reminders and cd_format) as a
+        dictionary if countdown is found, None otherwise
     """
 
-    data = (
-        supabase.table("Countdowns")
-        .select("*")
-        .eq("tg_user_id", user_id)
-        .eq("name", name)
-        .execute()
-    )
+    countdowns = await countdown_cache.get_countdowns(user_id)
+    countdown = countdowns.get(name)
 
-    try:
-        # data[0] -> [{'date_time': '2022-01-29T10:00:00+00:00', 'format': 2}]
-        assert len(data[0]) > 0
-    except AssertionError:
-        return None
-    else:
-        return data[0][0]
+    return countdown.details() if countdown else None
 
 
-async def get_all_countdowns() -> Union[list, None]:
-    """Get a list of all countdown.
+async def iter_countdowns(
+    columns: str, ended: bool = False, page_size: int = 1000
+) -> AsyncIterator[list]:
+    """Go through countdowns page by page.
 
-    Returns
-    -------
-    Union[list, None]
-        A list of all countdowns if at least one is found, else None
+    Keyset pagination (by id) is used, so every page is a cheap query no
+    matter how deep into the table it is, and only one page is kept in
+    memory at a time. The Countdowns table must have an `id` column (an
+    increasing integer primary key, see the README).
+
+    Parameters
+    ----------
+    columns : str
+        Comma separated columns to select (id is always selected)
+    ended : bool
+        Whether to go through countdowns that have already ended instead of
+        the ones that haven't
+    page_size : int
+        Maximum number of countdowns in a page
+
+    Yields
+    ------
+    list
+        Page of countdowns (dicts with the selected columns)
     """
 
-    data = supabase.table("Countdowns").select("*").execute()
+    now = dt.datetime.now(dt.timezone.utc).isoformat()
+    last_id = 0
 
-    try:
-        assert len(data[0]) > 0
-    except AssertionError:
-        return None
-    else:
-        return data[0]
+    while True:
+        params = {
+            "select": f"id,{columns}",
+            "id": f"gt.{last_id}",
+            "date_time": f"{'lte' if ended else 'gt'}.{now}",
+            "order": "id.asc",
+            "limit": page_size,
+        }
+        page = await db.request("GET", "Countdowns", params=params)
+
+        if page:
+            yield page
+
+        if len(page) < page_size:
+            return
+
+        last_id = page[-1]["id"]
@@ -0,0 +1,70 @@
+"""Time zone lookup by coordinates.
+
+`TimezoneFinder` loads its polygon data on creation, so a single instance is
+shared by the whole process. It's only needed when a new user shares their
+location, so timezonefinder (and numpy with it) is imported on the first
+lookup instead of on startup. Lookups run in a dedicated thread (the finder
+reads from its data files and is not thread safe) and results are cached per
+grid cell, so users from the same city are resolved without a lookup.
+"""
+
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional, Tuple, Union
+
+from data.config import TZ_CACHE_SIZE, TZ_IN_MEMORY
+
+if TYPE_CHECKING:
+    from timezonefinder import TimezoneFinder
+
+# 2 decimal places -> grid cells of roughly 1 km
+GRID_PRECISION = 2
+
+_finder: Optional["TimezoneFinder"] = None
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tz")
+_cache: "OrderedDict[Tuple[float, float], Union[str, None]]" = OrderedDict()
+
+
+def _timezone_at(latitude: float, longitude: float) -> Union[str, None]:
+    """Look up the time zone (runs in the time zone thread)."""
+    global _finder
+
+    if _finder is None:
+        from timezonefinder import TimezoneFinder
+
+        _finder = TimezoneFinder(in_memory=TZ_IN_MEMORY)
+
+    return _finder.timezone_at(lng=longitude, lat=latitude)
+
+
+async def get_timezone(latitude: float, longitude: float) -> Union[str, None]:
+    """Get the time zone name for the given coordinates.
+
+    Parameters
+    ----------
+    latitude : float
+        Latitude of the location
+    longitude : float
+        Longitude of the location
+
+    Returns
+    -------
+    Union[str, None]
+        Time zone name (like 'Asia/Tashkent') if found, else None
+    """
+
+    cell = (round(latitude, GRID_PRECISION), round(longitude, GRID_PRECISION))
+
+    if cell in _cache:
+        _cache.move_to_end(cell)
+        return _cache[cell]
+
+    loop = asyncio.get_running_loop()
+    time_zone = await loop.run_in_executor(_executor, _timezone_at, *cell)
+
+    _cache[cell] = time_zone
+    if len(_cache) > TZ_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+    return time_zone
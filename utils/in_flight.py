@@ -0,0 +1,73 @@
+import asyncio
+from typing import Optional
+
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_SUBMITTED,
+    JobExecutionEvent,
+)
+from apscheduler.schedulers.base import BaseScheduler
+
+
+class InFlight:
+    """Counter of work in progress that shutdown can wait on.
+
+    `enter` is called when a piece of work (an update, a job run) starts and
+    `exit` when it's finished, `wait` returns once nothing is running.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    def _event(self) -> asyncio.Event:
+        if self._idle is None:
+            # created lazily so that it is bound to the running event loop
+            self._idle = asyncio.Event()
+            if not self.count:
+                self._idle.set()
+        return self._idle
+
+    def enter(self):
+        self.count += 1
+        self._event().clear()
+
+    def exit(self):
+        self.count -= 1
+        if not self.count:
+            self._event().set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait until nothing is in progress.
+
+        Returns
+        -------
+        bool
+            True if everything finished in time, else False
+        """
+
+        try:
+            await asyncio.wait_for(self._event().wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+# updates being handled (counted by middlewares.in_flight)
+updates_in_flight = InFlight()
+# scheduler job runs (counted once `track_jobs` is called)
+jobs_in_flight = InFlight()
+
+
+def track_jobs(scheduler: BaseScheduler):
+    """Count running jobs of the scheduler in `jobs_in_flight`."""
+
+    def on_submitted(event: JobExecutionEvent):
+        jobs_in_flight.enter()
+
+    def on_finished(event: JobExecutionEvent):
+        jobs_in_flight.exit()
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+    scheduler.add_listener(on_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
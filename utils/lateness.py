@@ -0,0 +1,191 @@
+"""How late reminders and clean ups are, per minute they were due in.
+
+Every reminder and clean up has a time it's due at. When it's dispatched (the
+reminder is queued, the clean up starts) and when its message is delivered,
+how late that is gets recorded in the bucket of the minute it was due in.
+Once every message of a minute has been delivered (or has been undelivered
+for `slo` seconds), the bucket is finished and summed up in percentiles, so
+the scheduler can tell the admin if p99 lateness is over the SLO.
+"""
+
+import datetime as dt
+import functools
+import time
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from data.config import LATENESS_SLO
+from utils.metrics import lateness_seconds
+
+# (lateness in seconds, number of things that were that late)
+Latenesses = List[Tuple[float, int]]
+
+
+def percentile(latenesses: Latenesses, q: float) -> float:
+    """Get the q-th (0 to 1) percentile of the latenesses (0 if none)."""
+    total = sum(count for _, count in latenesses)
+    if not total:
+        return 0.0
+
+    rank = min(total - 1, int(total * q))
+    for lateness, count in sorted(latenesses):
+        rank -= count
+        if rank < 0:
+            break
+    return lateness
+
+
+class Summary(NamedTuple):
+    """Lateness of the reminders or clean ups due in a minute (seconds)."""
+
+    kind: str
+    minute: dt.datetime
+    count: int
+    failed: int
+    undelivered: int
+    dispatch_p50: float
+    dispatch_p99: float
+    delivery_p50: float
+    delivery_p99: float
+
+    @property
+    def p99(self) -> float:
+        return max(self.dispatch_p99, self.delivery_p99)
+
+    def __str__(self) -> str:
+        text = (
+            f"{self.kind.capitalize()}s due at {self.minute:%H:%M} UTC: "
+            f"{self.count}, dispatched p50 {self.dispatch_p50:.1f} s p99 "
+            f"{self.dispatch_p99:.1f} s, delivered p50 "
+            f"{self.delivery_p50:.1f} s p99 {self.delivery_p99:.1f} s"
+        )
+        if self.failed:
+            text += f", {self.failed} failed"
+        if self.undelivered:
+            text += f", {self.undelivered} not delivered yet"
+        return text
+
+
+class _Bucket:
+    __slots__ = ("dispatch", "delivery", "pending", "failed")
+
+    def __init__(self):
+        self.dispatch: Latenesses = []
+        self.delivery: Latenesses = []
+        self.pending = 0
+        self.failed = 0
+
+
+class LatenessTracker:
+    """Lateness of reminders and clean ups, in buckets per minute.
+
+    Parameters
+    ----------
+    slo : float
+        Seconds a reminder or clean up can be late. Messages that haven't
+        been delivered this long after their minute ended are counted as
+        that late, and their minute is finished without them.
+    """
+
+    def __init__(self, slo: float):
+        self.slo = slo
+        # (kind, minute as a unix timestamp) -> bucket
+        self._buckets: Dict[Tuple[str, int], _Bucket] = {}
+
+    def dispatched(
+        self, kind: str, due: float, now: float, count: int = 1
+    ) -> Callable[[bool], None]:
+        """Record that `count` things of the kind due at the same time were
+        dispatched.
+
+        Parameters
+        ----------
+        kind : str
+            What was dispatched, e.g. "reminder"
+        due : float
+            Unix timestamp they were due at
+        now : float
+            Unix timestamp they were dispatched at
+        count : int
+            Number of things dispatched
+
+        Returns
+        -------
+        Callable[[bool], None]
+            To be called once for each of their messages when it's sent
+            (with True) or couldn't be sent (with False)
+        """
+
+        key = (kind, int(due) // 60 * 60)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+
+        lateness = now - due
+        bucket.dispatch.append((lateness, count))
+        bucket.pending += count
+        lateness_seconds.labels(kind, "dispatch").observe(lateness, count)
+        return functools.partial(self._delivered, kind, due, bucket)
+
+    @staticmethod
+    def _delivered(kind: str, due: float, bucket: _Bucket, sent: bool):
+        bucket.pending -= 1
+
+        if sent:
+            lateness = time.time() - due
+            bucket.delivery.append((lateness, 1))
+            lateness_seconds.labels(kind, "delivery").observe(lateness)
+        else:
+            bucket.failed += 1
+
+    def finished(self, now: float) -> List[Summary]:
+        """Take out the minutes that are finished and sum them up.
+
+        Parameters
+        ----------
+        now : float
+            Current unix timestamp
+
+        Returns
+        -------
+        List[Summary]
+            Summaries of the finished minutes, oldest first
+        """
+
+        summaries = []
+
+        for key in sorted(self._buckets, key=lambda key: key[1]):
+            kind, minute = key
+            bucket = self._buckets[key]
+            # how late the undelivered messages are at least
+            waited = now - minute - 60
+
+            if waited < 0 or (bucket.pending and waited < self.slo):
+                continue
+
+            del self._buckets[key]
+            delivery = bucket.delivery
+            if bucket.pending:
+                delivery = delivery + [(waited, bucket.pending)]
+
+            summaries.append(
+                Summary(
+                    kind=kind,
+                    minute=dt.datetime.fromtimestamp(minute, dt.timezone.utc),
+                    count=sum(count for _, count in bucket.dispatch),
+                    failed=bucket.failed,
+                    undelivered=bucket.pending,
+                    dispatch_p50=percentile(bucket.dispatch, 0.5),
+                    dispatch_p99=percentile(bucket.dispatch, 0.99),
+                    delivery_p50=percentile(delivery, 0.5),
+                    delivery_p99=percentile(delivery, 0.99),
+                )
+            )
+
+        return summaries
+
+    def clear(self):
+        """Forget everything that hasn't finished yet."""
+        self._buckets.clear()
+
+
+lateness = LatenessTracker(slo=LATENESS_SLO)
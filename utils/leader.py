@@ -0,0 +1,180 @@
+"""Leader election for running several instances of the bot.
+
+All instances handle updates, but only the leader sends reminders and cleans
+up ended countdowns. The leader is whoever holds a lock in redis: a key with
+the instance id as its value that expires after `ttl` seconds. The leader
+renews it every `ttl / 3` seconds, so if the leader dies, the key expires and
+another instance takes over.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Optional
+
+from aiogram.contrib.fsm_storage.redis import RedisStorage2
+
+# only touch the lock if it's still ours
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderElection:
+    """Redis lock with lease renewal that only one instance holds at a time.
+
+    Parameters
+    ----------
+    storage : RedisStorage2
+        FSM storage whose redis connection is used for the lock
+    key : str
+        Redis key of the lock
+    ttl : float
+        Lease in seconds, the longest time without a leader after the
+        leader dies
+    enabled : bool
+        If False, this instance is always the leader (single instance)
+    """
+
+    def __init__(
+        self,
+        storage: RedisStorage2,
+        key: str,
+        ttl: float,
+        enabled: bool = True,
+    ):
+        self.storage = storage
+        self.key = key
+        self.ttl = ttl
+        self.enabled = enabled
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+
+        # the lease can't have run out before this (monotonic time)
+        self._lease_until = 0.0
+        self._on_elected: Optional[Callable[[], Awaitable]] = None
+        self._on_demoted: Optional[Callable[[], Awaitable]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._takeover: Optional[asyncio.Task] = None
+
+    async def start(
+        self,
+        on_elected: Callable[[], Awaitable],
+        on_demoted: Callable[[], Awaitable],
+    ):
+        """Try to become the leader and keep trying in the background.
+
+        Parameters
+        ----------
+        on_elected : Callable[[], Awaitable]
+            Called when this instance becomes the leader
+        on_demoted : Callable[[], Awaitable]
+            Called when this instance stops being the leader
+        """
+
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+
+        if not self.enabled:
+            self.is_leader = True
+            await on_elected()
+            return
+
+        await self._step()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop taking part in the election and give up the lock."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        if self.is_leader:
+            await self._demote()
+            await self._release()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self._step()
+
+    async def _step(self):
+        started_at = time.monotonic()
+
+        try:
+            redis = await self.storage.redis()
+
+            if self.is_leader:
+                renewed = await redis.eval(
+                    RENEW_SCRIPT,
+                    1,
+                    self.key,
+                    self.instance_id,
+                    int(self.ttl * 1000),
+                )
+                if renewed:
+                    self._lease_until = started_at + self.ttl
+                else:
+                    logging.error("Leadership lost to another instance.")
+                    await self._demote()
+            else:
+                acquired = await redis.set(
+                    self.key,
+                    self.instance_id,
+                    px=int(self.ttl * 1000),
+                    nx=True,
+                )
+                if acquired:
+                    self._lease_until = started_at + self.ttl
+                    await self._elect()
+        except Exception:
+            logging.exception("UNEXPECTED: Leader election failed.")
+
+            # step down before someone else can take over
+            if self.is_leader and time.monotonic() > self._lease_until - (
+                self.ttl / 3
+            ):
+                await self._demote()
+
+    async def _elect(self):
+        logging.info(f"Instance {self.instance_id} is the leader now.")
+        self.is_leader = True
+        # taking over can take longer than the lease (the schedule is loaded),
+        # so it must not hold up renewing the lease
+        self._takeover = asyncio.ensure_future(self._take_over())
+
+    async def _take_over(self):
+        try:
+            await self._on_elected()  # type: ignore
+        except Exception:
+            logging.exception("UNEXPECTED: Failed to take over as the leader.")
+            await self._demote()
+            await self._release()
+
+    async def _demote(self):
+        logging.info(f"Instance {self.instance_id} is not the leader anymore.")
+        self.is_leader = False
+
+        takeover, self._takeover = self._takeover, None
+        if takeover is not None and takeover is not asyncio.current_task():
+            takeover.cancel()
+            await asyncio.gather(takeover, return_exceptions=True)
+
+        await self._on_demoted()  # type: ignore
+
+    async def _release(self):
+        if self.enabled:
+            redis = await self.storage.redis()
+            await redis.eval(RELEASE_SCRIPT, 1, self.key, self.instance_id)
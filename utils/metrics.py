@@ -0,0 +1,375 @@
+"""Metrics of the bot, exposed in the Prometheus text format on /metrics.
+
+Only what the bot needs from a metrics library is here: counters, gauges
+and histograms (with labels), kept as plain numbers and rendered when
+/metrics is scraped. Recording a value is a dict lookup and an addition (a
+bisect too for histograms), so it can be done on every update and every db
+request. Gauges and counters can also be read from a function when scraped
+(e.g. the depth of the message queue).
+
+The endpoint is served on METRICS_HOST:METRICS_PORT (off if the port is 0).
+"""
+
+import abc
+import bisect
+import datetime as dt
+import logging
+import math
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from aiohttp import web
+from apscheduler.events import EVENT_JOB_SUBMITTED, JobSubmissionEvent
+from apscheduler.schedulers.base import BaseScheduler
+
+# seconds, for things that take milliseconds to seconds
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# seconds, for things that are due at a time and can be late
+LATENESS_BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(abc.ABC):
+    """Metric family: a value (child) per combination of label values."""
+
+    type = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, *values) -> "_Metric":
+        """Get the child for the label values (created on first use)."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} has labels {self.labelnames}, got {key}"
+                )
+            child = self._children[key] = self._child()
+        return child
+
+    @abc.abstractmethod
+    def _child(self) -> "_Metric":
+        """New child of the metric (for a combination of label values)."""
+
+    @abc.abstractmethod
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        """(suffix, labels, value) of every sample of the metric."""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Value that only goes up."""
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def _child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def _samples(self):
+        if self.function is not None:
+            return [("", "", self.function())]
+        if not self.labelnames:
+            return [("", "", self.value)]
+        return [
+            ("", _labels(self.labelnames, key), child.value)  # type: ignore
+            for key, child in self._children.items()
+        ]
+
+
+class Gauge(Counter):
+    """Value that goes up and down."""
+
+    type = "gauge"
+
+    def set(self, value: float):
+        self.value = value
+
+    def _child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+
+class Histogram(_Metric):
+    """Distribution of values in buckets (plus their sum and count)."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # not cumulative, the last one is for values above all buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, times: int = 1):
+        """Record the value (`times` times, e.g. for a batch of things that
+        were all equally late)."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += times
+        self.sum += value * times
+        self.count += times
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def _samples(self):
+        if self.labelnames:
+            children = self._children.items()
+        else:
+            children = [((), self)]  # type: ignore
+
+        samples = []
+        for key, child in children:
+            cumulative = 0
+            for bound, count in zip(
+                self.buckets + (math.inf,), child.counts  # type: ignore
+            ):
+                cumulative += count
+                labels = _labels(
+                    self.labelnames + ("le",), key + (_number(bound),)
+                )
+                samples.append(("_bucket", labels, cumulative))
+
+            labels = _labels(self.labelnames, key)
+            samples.append(("_sum", labels, child.sum))  # type: ignore
+            samples.append(("_count", labels, child.count))  # type: ignore
+        return samples
+
+
+M = TypeVar("M", bound=_Metric)
+
+
+class Registry:
+    """Metrics rendered together on /metrics."""
+
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: M) -> M:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Get all metrics in the Prometheus text format."""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+update_seconds = registry.register(
+    Histogram(
+        "bot_update_seconds",
+        "Time to handle an update (all middlewares and handlers).",
+        ["type"],
+    )
+)
+handler_seconds = registry.register(
+    Histogram(
+        "bot_handler_seconds",
+        "Time a handler took to handle an update.",
+        ["handler"],
+    )
+)
+fsm_storage_seconds = registry.register(
+    Histogram(
+        "bot_fsm_storage_seconds",
+        "Time to read or write FSM state in redis.",
+        ["operation"],
+    )
+)
+db_request_seconds = registry.register(
+    Histogram(
+        "bot_db_request_seconds",
+        "Time a request to the db (PostgREST) took.",
+        ["method", "table"],
+    )
+)
+db_errors = registry.register(
+    Counter(
+        "bot_db_errors_total",
+        "Requests to the db (PostgREST) that failed.",
+        ["method", "table"],
+    )
+)
+job_lag_seconds = registry.register(
+    Histogram(
+        "bot_job_lag_seconds",
+        "Time from when a scheduler job was due to when it started.",
+        ["job"],
+        buckets=LATENESS_BUCKETS,
+    )
+)
+lateness_seconds = registry.register(
+    Histogram(
+        "bot_lateness_seconds",
+        "Time from when reminders and clean ups were due to them being "
+        "dispatched and their messages being delivered.",
+        ["kind", "stage"],
+        buckets=LATENESS_BUCKETS,
+    )
+)
+reminder_messages_saved = registry.register(
+    Counter(
+        "bot_reminder_messages_saved_total",
+        "Messages (Bot API calls) saved by sending reminders in digests.",
+    )
+)
+reminder_minutes_skipped = registry.register(
+    Counter(
+        "bot_reminder_minutes_skipped_total",
+        "Minutes whose reminders were not sent, they were too late.",
+    )
+)
+
+bot_api_requests = registry.register(
+    Counter(
+        "bot_api_requests_total",
+        "Requests to the Bot API, by whether they opened a new connection "
+        "or reused an open one.",
+        ["connection"],
+    )
+)
+bot_api_connect_seconds = registry.register(
+    Histogram(
+        "bot_api_connect_seconds",
+        "Time to open a connection to the Bot API (TCP connect and TLS "
+        "handshake).",
+    )
+)
+bot_api_pool_wait_seconds = registry.register(
+    Histogram(
+        "bot_api_pool_wait_seconds",
+        "Time requests to the Bot API waited for a free connection.",
+    )
+)
+bot_api_dns_lookups = registry.register(
+    Counter(
+        "bot_api_dns_lookups_total",
+        "DNS lookups of the Bot API host, by whether they were cached.",
+        ["cache"],
+    )
+)
+
+schedule_mismatches = registry.register(
+    Gauge(
+        "bot_schedule_mismatches",
+        "Countdowns the schedule store and the db disagree on (checked when "
+        "the schedule is restored from the store).",
+        ["kind"],
+    )
+)
+
+
+def track_job_lag(scheduler: BaseScheduler):
+    """Record how late jobs of the scheduler start in `job_lag_seconds`."""
+
+    def on_submitted(event: JobSubmissionEvent):
+        now = dt.datetime.now(dt.timezone.utc)
+        for run_time in event.scheduled_run_times:
+            job_lag_seconds.labels(event.job_id).observe(
+                (now - run_time).total_seconds()
+            )
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+
+
+_runner: Union[web.AppRunner, None] = None
+
+
+async def _metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        text=registry.render(), content_type="text/plain", charset="utf-8"
+    )
+
+
+async def start_server(host: str, port: int):
+    """Serve /metrics (does nothing if the port is 0)."""
+    global _runner
+
+    if not port:
+        return
+
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logging.info(f"Metrics are served on http://{host}:{port}/metrics")
+
+
+async def stop_server():
+    """Stop serving /metrics."""
+    global _runner
+
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
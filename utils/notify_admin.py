@@ -12,6 +12,14 @@ async def notify_on_startup(dp: Dispatcher):
         logging.exception(err)
 
 
+async def notify_on_lateness(dp: Dispatcher, report: str):
+    """Notify admin that reminders or clean ups are late."""
+    try:
+        await dp.bot.send_message(ADMIN, report)
+    except Exception as err:
+        logging.exception(err)
+
+
 async def notify_on_shutdown(dp: Dispatcher):
     """Notify admin that the bot has shut down."""
     try:
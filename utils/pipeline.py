@@ -0,0 +1,86 @@
+import asyncio
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    List,
+    NamedTuple,
+    Sequence,
+)
+
+
+class Stage(NamedTuple):
+    """Step of a pipeline.
+
+    Parameters
+    ----------
+    work : Callable[[Any], Awaitable[Any]]
+        Coroutine function that takes an item and returns the item for the
+        next stage (None to drop it)
+    workers : int
+        Number of items the stage works on at the same time
+    """
+
+    work: Callable[[Any], Awaitable[Any]]
+    workers: int = 1
+
+
+async def run_pipeline(items: Iterable, stages: Sequence[Stage]):
+    """Pass every item through the stages, in order.
+
+    Every stage has its own workers and a queue with room for as many items
+    as it has workers. When a stage falls behind, its queue fills up and the
+    stages before it wait to hand over their items, so only a bounded number
+    of items are in the pipeline at any time (items are only taken from
+    `items` when there's room). What the last stage returns is dropped.
+
+    If a stage raises an exception, no more items are taken from `items`,
+    but the items already in the pipeline still go through the stages (so
+    e.g. batches that were claimed are still sent), and then the first
+    exception is raised.
+    """
+
+    queues = [asyncio.Queue(maxsize=stage.workers) for stage in stages]
+    errors: List[Exception] = []
+
+    async def work(index: int):
+        queue = queues[index]
+
+        while True:
+            item = await queue.get()
+            try:
+                item = await stages[index].work(item)
+                if item is not None and index + 1 < len(stages):
+                    await queues[index + 1].put(item)
+            except Exception as e:
+                # the other items keep going
+                errors.append(e)
+            finally:
+                queue.task_done()
+
+    workers = [
+        asyncio.ensure_future(work(index))
+        for index, stage in enumerate(stages)
+        for _ in range(stage.workers)
+    ]
+
+    try:
+        try:
+            for item in items:
+                if errors:
+                    break
+                await queues[0].put(item)
+        except Exception as e:
+            errors.append(e)
+
+        # a stage is done once everything before it is done
+        for queue in queues:
+            await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    if errors:
+        raise errors[0]
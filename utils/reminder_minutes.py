@@ -0,0 +1,98 @@
+"""Histogram of the minutes of the day daily reminders are sent at.
+
+    python -m utils.reminder_minutes [--spread MINUTES] [--top N]
+
+Goes through the countdowns with reminders on in the Countdowns table and
+reports how many reminders are sent at each UTC minute of the day: the
+busiest minutes and an hourly histogram, as reminders are sent now (with
+REMINDER_SPREAD) and as they would be if spread over --spread minutes, so
+that the peaks (e.g. at users' midnight) can be compared.
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+from typing import Dict, List
+
+from data.config import REMINDER_SPREAD
+from loader import db
+from utils.calculate_diff import parse_dt
+from utils.countdown_index import MINUTES_PER_DAY, reminder_offset
+from utils.get_db_data import iter_countdowns
+
+TOP = 10
+SPREAD = 30
+BAR = 50
+
+
+async def load_reminders() -> List[tuple]:
+    """Get (user_id, cd_name, minute of the day it ends at) of every
+    countdown with reminders on."""
+    reminders = []
+
+    async for page in iter_countdowns("tg_user_id,name,date_time,reminders"):
+        for row in page:
+            if row.get("reminders"):
+                minute = parse_dt(row["date_time"]) // 60 % MINUTES_PER_DAY
+                reminders.append((row["tg_user_id"], row["name"], minute))
+
+    await db.close()
+    return reminders
+
+
+def histogram(reminders: List[tuple], spread: int) -> Dict[int, int]:
+    """Number of reminders sent at every minute of the day (UTC)."""
+    return Counter(
+        (minute - reminder_offset(user_id, name, spread)) % MINUTES_PER_DAY
+        for user_id, name, minute in reminders
+    )
+
+
+def _time(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def report(reminders: List[tuple], spread: int, top: int) -> str:
+    minutes = histogram(reminders, spread)
+    per_minute = sorted(minutes.values()) or [0]
+    busiest = sorted(minutes.items(), key=lambda m: (-m[1], m[0]))[:top]
+    hours = Counter()
+    for minute, count in minutes.items():
+        hours[minute // 60] += count
+    most = max(hours.values(), default=0) or 1
+
+    lines = [
+        f"spread over {spread} minutes" if spread > 1 else "not spread",
+        f"  minutes with reminders: {len(minutes)}, reminders per minute: "
+        f"median {per_minute[len(per_minute) // 2]}, "
+        f"max {per_minute[-1]}",
+        "  busiest minutes: "
+        + ", ".join(f"{_time(m)} {count}" for m, count in busiest),
+    ]
+    for hour in range(24):
+        bar = "#" * round(hours[hour] / most * BAR)
+        lines.append(f"  {hour:02d}:00 {hours[hour]:>8} {bar}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--spread",
+        type=int,
+        default=SPREAD,
+        help="minutes to compare spreading reminders over",
+    )
+    parser.add_argument("--top", type=int, default=TOP)
+    args = parser.parse_args()
+
+    reminders = asyncio.run(load_reminders())
+    print(f"{len(reminders)} countdowns with daily reminders (UTC times)\n")
+    print(report(reminders, REMINDER_SPREAD, args.top))
+    if args.spread != REMINDER_SPREAD:
+        print()
+        print(report(reminders, args.spread, args.top))
+
+
+if __name__ == "__main__":
+    main()
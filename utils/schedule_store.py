@@ -0,0 +1,290 @@
+"""Scheduled reminders and clean ups, saved in redis.
+
+Everything that gets scheduled is also written here, so on restart the
+scheduler can be rebuilt from two redis hashes instead of reading the whole
+Countdowns table from the db:
+
+    schedule:reminders  "<user_id>:<cd_name>" -> "<date_time>|<cd_format>"
+    schedule:cleanups   "<user_id>:<cd_name>" -> "<date_time>"
+
+Users who get their reminders in a digest are kept here too (and only
+here, so they're not removed when the store is filled from the db again):
+
+    schedule:digests    "<user_id>" -> "1"
+
+With leader election on, every change is also published, so that the leader
+can apply changes made by the other instances to its schedule.
+"""
+
+import datetime as dt
+import json
+from typing import AsyncIterator, List, Tuple, Union
+
+from aioredis.client import PubSub
+
+from data.config import LEADER_ELECTION
+from loader import leader, storage
+
+REMINDERS_KEY = "schedule:reminders"
+CLEANUPS_KEY = "schedule:cleanups"
+DIGESTS_KEY = "schedule:digests"
+# set once the store has been filled from the db
+SYNCED_KEY = "schedule:synced"
+# last minute reminders were sent for (so the next leader can carry on)
+LAST_TICK_KEY = "schedule:last_tick"
+CHANGES_CHANNEL = "schedule:changes"
+# prefix of the keys that make sure every send happens only once
+SENT_PREFIX = "schedule:sent:"
+
+
+def _field(user_id: int, cd_name: str) -> str:
+    return f"{user_id}:{cd_name}"
+
+
+def _split_field(field: str) -> Tuple[int, str]:
+    user_id, cd_name = field.split(":", 1)
+    return int(user_id), cd_name
+
+
+def _change(change: str, *args) -> str:
+    return json.dumps([leader.instance_id, change, *args])
+
+
+async def _publish(redis, change: str, *args):
+    if LEADER_ELECTION:
+        await redis.publish(CHANGES_CHANNEL, _change(change, *args))
+
+
+async def save_reminders(
+    user_id: int, cd_name: str, date_time: str, cd_format: int
+):
+    """Save daily reminders of the countdown."""
+    redis = await storage.redis()
+    await redis.hset(
+        REMINDERS_KEY, _field(user_id, cd_name), f"{date_time}|{cd_format}"
+    )
+    await _publish(redis, "reminders", user_id, cd_name, date_time, cd_format)
+
+
+async def delete_reminders(user_id: int, cd_name: str):
+    """Forget daily reminders of the countdown."""
+    redis = await storage.redis()
+    await redis.hdel(REMINDERS_KEY, _field(user_id, cd_name))
+    await _publish(redis, "delete_reminders", user_id, cd_name)
+
+
+async def save_cleanup(user_id: int, cd_name: str, date_time: str):
+    """Save clean up of the countdown."""
+    redis = await storage.redis()
+    await redis.hset(CLEANUPS_KEY, _field(user_id, cd_name), date_time)
+    await _publish(redis, "cleanup", user_id, cd_name, date_time)
+
+
+async def delete_cleanup(user_id: int, cd_name: str):
+    """Forget clean up of the countdown."""
+    redis = await storage.redis()
+    await redis.hdel(CLEANUPS_KEY, _field(user_id, cd_name))
+    await _publish(redis, "delete_cleanup", user_id, cd_name)
+
+
+async def save_digest(user_id: int, digest: bool):
+    """Save whether the user gets their reminders in a digest."""
+    redis = await storage.redis()
+    if digest:
+        await redis.hset(DIGESTS_KEY, str(user_id), 1)
+    else:
+        await redis.hdel(DIGESTS_KEY, str(user_id))
+    await _publish(redis, "digest", user_id, digest)
+
+
+async def is_digest(user_id: int) -> bool:
+    """Check whether the user gets their reminders in a digest."""
+    redis = await storage.redis()
+    return bool(await redis.hget(DIGESTS_KEY, str(user_id)))
+
+
+async def load_digests() -> List[int]:
+    """Get all users who get their reminders in a digest."""
+    redis = await storage.redis()
+    return [int(user_id) for user_id in await redis.hgetall(DIGESTS_KEY)]
+
+
+async def delete_ended(countdowns: List[Tuple[int, str]]):
+    """Forget reminders and clean ups of many countdowns at once (once
+    they've been cleaned up).
+
+    Parameters
+    ----------
+    countdowns : List[Tuple[int, str]]
+        (user_id, cd_name) of every countdown
+    """
+
+    if not countdowns:
+        return
+
+    redis = await storage.redis()
+    fields = [_field(user_id, cd_name) for user_id, cd_name in countdowns]
+
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hdel(REMINDERS_KEY, *fields)
+        pipe.hdel(CLEANUPS_KEY, *fields)
+        if LEADER_ELECTION:
+            for user_id, cd_name in countdowns:
+                pipe.publish(
+                    CHANGES_CHANNEL,
+                    _change("delete_cleanup", user_id, cd_name),
+                )
+        await pipe.execute()
+
+
+async def is_synced() -> bool:
+    """Check whether the store has been filled from the db."""
+    redis = await storage.redis()
+    return bool(await redis.exists(SYNCED_KEY))
+
+
+async def clear():
+    """Remove everything from the store (before filling it from the db)."""
+    redis = await storage.redis()
+    await redis.delete(REMINDERS_KEY, CLEANUPS_KEY, SYNCED_KEY)
+
+
+async def mark_synced():
+    """Mark the store as filled from the db."""
+    redis = await storage.redis()
+    await redis.set(SYNCED_KEY, 1)
+
+
+async def save(
+    reminders: List[Tuple[int, str, str, int]],
+    cleanups: List[Tuple[int, str, str]],
+):
+    """Save many reminders and clean ups at once (used when filling the store
+    from the db).
+
+    Parameters
+    ----------
+    reminders : List[Tuple[int, str, str, int]]
+        (user_id, cd_name, date_time, cd_format) of every countdown with
+        daily reminders on
+    cleanups : List[Tuple[int, str, str]]
+        (user_id, cd_name, date_time) of every countdown
+    """
+
+    redis = await storage.redis()
+
+    if reminders:
+        await redis.hset(
+            REMINDERS_KEY,
+            mapping={
+                _field(user_id, name): f"{date_time}|{cd_format}"
+                for user_id, name, date_time, cd_format in reminders
+            },
+        )
+    if cleanups:
+        await redis.hset(
+            CLEANUPS_KEY,
+            mapping={
+                _field(user_id, name): date_time
+                for user_id, name, date_time in cleanups
+            },
+        )
+
+
+async def load_reminders() -> List[Tuple[int, str, str, int]]:
+    """Get all saved reminders as (user_id, cd_name, date_time, cd_format)."""
+    redis = await storage.redis()
+    saved = await redis.hgetall(REMINDERS_KEY)
+
+    reminders = []
+    for field, value in saved.items():
+        date_time, cd_format = value.rsplit("|", 1)
+        reminders.append((*_split_field(field), date_time, int(cd_format)))
+
+    return reminders
+
+
+async def load_cleanups() -> List[Tuple[int, str, str]]:
+    """Get all saved clean ups as (user_id, cd_name, date_time)."""
+    redis = await storage.redis()
+    saved = await redis.hgetall(CLEANUPS_KEY)
+
+    return [(*_split_field(field), value) for field, value in saved.items()]
+
+
+async def subscribe() -> PubSub:
+    """Start listening to changes made by all instances.
+
+    Changes are buffered until they're read with `changes`, so nothing is
+    missed while the schedule is being loaded.
+    """
+
+    redis = await storage.redis()
+    pubsub = redis.pubsub()
+    await pubsub.subscribe(CHANGES_CHANNEL)
+    return pubsub
+
+
+async def changes(pubsub: PubSub) -> AsyncIterator[Tuple[str, list]]:
+    """Get changes made by other instances as (change, args).
+
+    Changes are "reminders" (user_id, cd_name, date_time, cd_format),
+    "delete_reminders" (user_id, cd_name), "cleanup" (user_id, cd_name,
+    date_time), "delete_cleanup" (user_id, cd_name) and "digest" (user_id,
+    digest).
+    """
+
+    try:
+        async for message in pubsub.listen():
+            if message["type"] != "message":
+                continue
+
+            instance_id, change, *args = json.loads(message["data"])
+            if instance_id != leader.instance_id:
+                yield change, args
+    finally:
+        await pubsub.reset()
+
+
+async def claim_sends(keys: List[str], ttl: int) -> List[bool]:
+    """Claim sends so that each of them happens only once, even if two
+    instances both think they are the leader for a moment.
+
+    Sends are claimed before they're queued, so they happen at most once: a
+    send that was claimed by an instance that died before sending it is
+    not sent by any other instance.
+
+    Parameters
+    ----------
+    keys : List[str]
+        Idempotency keys of the sends
+    ttl : int
+        Seconds to remember the claims for
+
+    Returns
+    -------
+    List[bool]
+        For every key, True if it was claimed now (the send should go ahead)
+        and False if it had already been claimed
+    """
+
+    redis = await storage.redis()
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.set(SENT_PREFIX + key, 1, ex=ttl, nx=True)
+        return [bool(claimed) for claimed in await pipe.execute()]
+
+
+async def save_last_tick(minute: dt.datetime):
+    """Save the last minute reminders were sent for."""
+    redis = await storage.redis()
+    await redis.set(LAST_TICK_KEY, minute.isoformat())
+
+
+async def load_last_tick() -> Union[dt.datetime, None]:
+    """Get the last minute reminders were sent for (by any instance)."""
+    redis = await storage.redis()
+    last_tick = await redis.get(LAST_TICK_KEY)
+
+    return dt.datetime.fromisoformat(last_tick) if last_tick else None
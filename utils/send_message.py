@@ -1,13 +1,338 @@
+"""Outgoing message queue.
+
+Messages that aren't direct replies (reminders, countdown deleted messages)
+go through a queue served by a fixed number of workers, so that a lot of
+messages at the same minute don't exceed Telegram's limits (~30 messages per
+second overall and about 1 message per second to the same chat). Messages
+are queued per chat, and a chat only gets a worker once its next message can
+be sent, so several messages to one chat don't hold up the others.
+"""
+
 import asyncio
+import heapq
 import logging
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 from aiogram.utils import exceptions
 
+from data.config import SEND_QUEUE_SIZE, SEND_RATE, SEND_WORKERS
 from loader import dp
+from utils.metrics import Counter, Gauge, registry
+from utils.token_bucket import TokenBucket
+
+# minimum number of seconds between messages to the same chat
+PER_CHAT_INTERVAL = 1.0
+MAX_ATTEMPTS = 5
+# backoff after a network error, doubled on every attempt
+BACKOFF = 1.0
+
+
+class MessageQueue:
+    """Rate limited queue of messages to send.
+
+    Parameters
+    ----------
+    rate : float
+        Maximum number of messages sent per second (across all chats)
+    workers : int
+        Number of messages that can be sent at the same time
+    maxsize : int
+        Maximum number of messages waiting in the queue. When the queue is
+        full, adding a message waits until there is room.
+    """
+
+    def __init__(self, rate: float, workers: int, maxsize: int):
+        self.rate = rate
+        self.workers = workers
+        self.maxsize = maxsize
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        # seconds from adding a message to the queue to it being sent
+        self.latencies: deque = deque(maxlen=1000)
+
+        self._bucket = TokenBucket(rate=rate, capacity=1)
+        # chat id -> time when a message can be sent to the chat again
+        self._next_send: Dict[int, float] = {}
+        # flood control applies to the whole bot, so everyone waits
+        self._paused_until = 0.0
+
+        # chat id -> its messages that haven't been sent yet, for chats that
+        # are either in `_ready` or `_later` (never both, at most once)
+        self._chats: Dict[int, deque] = {}
+        # (time, chat id) of chats that can be sent to again at that time
+        self._later: List[Tuple[float, int]] = []
+        # messages that are queued or being sent
+        self._pending = 0
+        # created in start(), on the running event loop
+        self._ready: Optional[asyncio.Queue] = None
+        self._room: Optional[asyncio.Semaphore] = None
+        self._later_changed: Optional[asyncio.Event] = None
+        self._empty: Optional[asyncio.Event] = None
+        self._tasks = []
+
+    @property
+    def depth(self) -> int:
+        """Number of messages waiting in the queue."""
+        return sum(len(messages) for messages in self._chats.values())
+
+    def stats(self) -> dict:
+        """Get queue counters and send latency percentiles (in seconds)."""
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return {
+            "depth": self.depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latency_p50": percentile(0.5),
+            "latency_p99": percentile(0.99),
+        }
+
+    def start(self):
+        """Start the workers (must be called from the running event loop)."""
+        self._chats.clear()
+        self._later.clear()
+        self._pending = 0
+        self._ready = asyncio.Queue()
+        self._room = asyncio.Semaphore(self.maxsize)
+        self._later_changed = asyncio.Event()
+        self._empty = asyncio.Event()
+        self._empty.set()
+        self._tasks = [asyncio.ensure_future(self._wake_up_chats())] + [
+            asyncio.ensure_future(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self, timeout: Union[float, None] = None):
+        """Wait for queued messages to be sent and stop the workers.
+
+        Messages that aren't sent within `timeout` seconds (if given) are
+        dropped.
+        """
+        if self._empty is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._empty.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.error(
+                f"UNEXPECTED: {self._pending} queued messages dropped on "
+                "shutdown."
+            )
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def put(
+        self,
+        user_id: int,
+        text: str,
+        on_sent: Union[Callable[[bool], None], None] = None,
+    ):
+        """Add a message to the queue (waits if the queue is full).
+
+        `on_sent` is called with True once the message is sent or with False
+        if it couldn't be sent.
+        """
+
+        if self._room is None:
+            raise RuntimeError(
+                "The message queue isn't started, call start() first."
+            )
+
+        await self._room.acquire()
+        self._pending += 1
+        self._empty.clear()  # type: ignore
+
+        message = (text, time.monotonic(), on_sent)
+        messages = self._chats.get(user_id)
+        if messages is not None:
+            # the chat is already waiting for its turn
+            messages.append(message)
+        else:
+            self._chats[user_id] = deque([message])
+            self._schedule(user_id)
+
+    def _schedule(self, user_id: int):
+        """Make the chat ready now, or once a message can be sent to it."""
+        send_at = self._next_send.get(user_id, 0.0)
+
+        if send_at <= time.monotonic():
+            self._ready.put_nowait(user_id)  # type: ignore
+            return
+
+        heapq.heappush(self._later, (send_at, user_id))
+        if self._later[0][1] == user_id:
+            # sooner than the chat the waker waits for
+            self._later_changed.set()  # type: ignore
+
+    async def _wake_up_chats(self):
+        """Move chats that can be sent to again to the ready queue.
+
+        Messages to a chat that was sent to less than `PER_CHAT_INTERVAL`
+        ago wait here instead of holding up a worker, so the workers keep
+        sending to the other chats.
+        """
+
+        while True:
+            self._later_changed.clear()  # type: ignore
+            now = time.monotonic()
+
+            while self._later and self._later[0][0] <= now:
+                _, user_id = heapq.heappop(self._later)
+                self._ready.put_nowait(user_id)  # type: ignore
+
+            timeout = self._later[0][0] - now if self._later else None
+            try:
+                await asyncio.wait_for(
+                    self._later_changed.wait(), timeout  # type: ignore
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def _sent_to(self, user_id: int):
+        """Note that a message was just sent to the chat."""
+        now = time.monotonic()
+        self._next_send[user_id] = now + PER_CHAT_INTERVAL
+
+        if len(self._next_send) > 10 * self.maxsize:
+            # forget chats that can be messaged right away
+            self._next_send = {
+                chat: t for chat, t in self._next_send.items() if t > now
+            }
+
+    async def _worker(self):
+        while True:
+            user_id = await self._ready.get()  # type: ignore
+            messages = self._chats[user_id]
+            text, queued_at, on_sent = messages.popleft()
+            sent = False
+
+            try:
+                sent = await self._send(user_id, text)
+                if sent:
+                    self.sent += 1
+                    self.latencies.append(time.monotonic() - queued_at)
+                else:
+                    self.failed += 1
+            except Exception:
+                self.failed += 1
+                logging.exception(f"Target [ID:{user_id}]: failed")
+            finally:
+                # the chat's next message waits for its turn again (counted
+                # from when telegram got this one at the latest)
+                self._sent_to(user_id)
+                if messages:
+                    self._schedule(user_id)
+                else:
+                    del self._chats[user_id]
+
+                self._pending -= 1
+                if not self._pending:
+                    self._empty.set()  # type: ignore
+                self._room.release()  # type: ignore
+
+            if on_sent is not None:
+                try:
+                    on_sent(sent)
+                except Exception:
+                    logging.exception(f"Target [ID:{user_id}]: on_sent failed")
+
+    async def _send(self, user_id: int, text: str) -> bool:
+        """Send the message, retrying on flood control and network errors.
+
+        Returns
+        -------
+        bool
+            True if the message was sent, else False
+        """
+
+        for attempt in range(MAX_ATTEMPTS):
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+            await self._bucket.acquire()
+
+            try:
+                await dp.bot.send_message(user_id, text)
+            except exceptions.BotBlocked:
+                logging.error(f"Target [ID:{user_id}]: blocked by user")
+                return False
+            except exceptions.UserDeactivated:
+                logging.error(f"Target [ID:{user_id}]: user is deactivated")
+                return False
+            except exceptions.RetryAfter as e:
+                logging.error(
+                    f"Target [ID:{user_id}]: Flood limit is exceeded. "
+                    f"Sleep {e.timeout} seconds."
+                )
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + e.timeout
+                )
+            except (exceptions.NetworkError, asyncio.TimeoutError):
+                delay = BACKOFF * 2**attempt
+                logging.error(
+                    f"Target [ID:{user_id}]: network error. Retry in "
+                    f"{delay} seconds."
+                )
+                await asyncio.sleep(delay)
+            except exceptions.TelegramAPIError:
+                logging.exception(f"Target [ID:{user_id}]: failed")
+                return False
+            else:
+                logging.info(f"Target [ID:{user_id}]: success.")
+                return True
+
+            self.retries += 1
+
+        logging.error(f"Target [ID:{user_id}]: gave up after retries")
+        return False
+
+
+message_queue = MessageQueue(
+    rate=SEND_RATE, workers=SEND_WORKERS, maxsize=SEND_QUEUE_SIZE
+)
+
+registry.register(
+    Gauge(
+        "bot_send_queue_depth",
+        "Messages waiting in the message queue.",
+        function=lambda: message_queue.depth,
+    )
+)
+registry.register(
+    Counter(
+        "bot_messages_sent_total",
+        "Messages sent from the message queue.",
+        function=lambda: message_queue.sent,
+    )
+)
+registry.register(
+    Counter(
+        "bot_messages_failed_total",
+        "Messages from the message queue that could not be sent.",
+        function=lambda: message_queue.failed,
+    )
+)
 
 
-async def send_message(user_id: int, text: str):
-    """Send a message to the user on Telegram.
+async def send_message(
+    user_id: int,
+    text: str,
+    on_sent: Union[Callable[[bool], None], None] = None,
+):
+    """Queue a message to be sent to the user on Telegram.
 
     Parameters
     ----------
@@ -15,21 +340,9 @@ async def send_message(user_id: int, text: str):
         Telegram user id to whom the message should be sent
     text: str
         Text to send
+    on_sent : Union[Callable[[bool], None], None]
+        Called with True when the message is sent, with False if it
+        couldn't be sent
     """
 
-    try:
-        await dp.bot.send_message(user_id, text)
-    except exceptions.BotBlocked:
-        logging.error(f"Target [ID:{user_id}]: blocked by user")
-    except exceptions.RetryAfter as e:
-        logging.error(
-            f"Target [ID:{user_id}]: Flood limit is exceeded. Sleep {e.timeout} seconds."
-        )
-        await asyncio.sleep(e.timeout)
-        return await send_message(user_id, text)  # Recursive call
-    except exceptions.UserDeactivated:
-        logging.error(f"Target [ID:{user_id}]: user is deactivated")
-    except exceptions.TelegramAPIError:
-        logging.exception(f"Target [ID:{user_id}]: failed")
-    else:
-        logging.info(f"Target [ID:{user_id}]: success.")
+    await message_queue.put(user_id, text, on_sent)
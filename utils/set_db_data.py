@@ -0,0 +1,192 @@
+"""Basic insert, update and delete queries.
+
+Changes to countdowns are also written to the countdown cache.
+"""
+
+import asyncio
+from typing import Dict, List, Union
+
+from loader import db
+from utils import countdown_cache
+from utils.countdown_index import Countdown
+from utils.get_db_data import invalidate_tz_info
+
+# users whose countdowns are deleted with one request (keeps the url short)
+MAX_USERS_PER_DELETE = 500
+
+
+async def add_account(user_id: int, time_zone: str):
+    """Insert user's time zone information to the db.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+    time_zone : str
+        User's time zone (like 'Asia/Tashkent')
+    """
+
+    await db.insert(
+        "Accounts", {"tg_user_id": user_id, "time_zone": time_zone}
+    )
+    # user was cached as one without time zone info
+    await invalidate_tz_info(user_id)
+
+
+async def add_countdown(
+    user_id: int, name: str, date_time: str, reminders: bool, cd_format: int
+):
+    """Insert a new countdown to the db.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+    name : str
+        Countdown name
+    date_time : str
+        Countdown date and time (in the '%Y-%m-%dT%H:%M:%S%z' format)
+    reminders : bool
+        Whether daily reminders are on
+    cd_format : int
+        The format in which to send the countdown details
+    """
+
+    data = {
+        "name": name,
+        "tg_user_id": user_id,
+        "date_time": date_time,
+        "reminders": reminders,
+        "cd_format": cd_format,
+    }
+    await db.insert("Countdowns", data)
+    await countdown_cache.save_countdown(user_id, data)
+
+
+async def update_countdown(
+    user_id: int, name: str, values: dict
+) -> Union[dict, None]:
+    """Update specific countdown in the db.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+    name : str
+        Countdown name
+    values : dict
+        Columns to update with their new values
+
+    Returns
+    -------
+    Union[dict, None]
+        Updated countdown as a dictionary if countdown was found, else None
+    """
+
+    data = await db.update("Countdowns", values, tg_user_id=user_id, name=name)
+
+    try:
+        # data -> what just got updated
+        assert len(data) > 0
+    except AssertionError:
+        # the cache shouldn't have it either
+        await countdown_cache.delete_countdown(user_id, name)
+        return None
+    else:
+        await countdown_cache.save_countdown(user_id, data[0], old_name=name)
+        return data[0]
+
+
+async def remove_countdown(user_id: int, name: str) -> Union[list, None]:
+    """Delete specific countdown from the db.
+
+    Parameters
+    ----------
+    user_id : int
+        Telegram user id
+    name : str
+        Countdown name
+
+    Returns
+    -------
+    Union[list, None]
+        List containing deleted row if countdown was found, else None
+    """
+
+    data = await db.delete("Countdowns", tg_user_id=user_id, name=name)
+    await countdown_cache.delete_countdown(user_id, name)
+
+    try:
+        # data -> what just got deleted
+        assert len(data) > 0
+    except AssertionError:
+        return None
+    else:
+        return data
+
+
+async def remove_ended(countdowns: List[Countdown]) -> list:
+    """Delete countdowns that have ended from the db.
+
+    They are all deleted with a single request: countdowns of their users
+    (`in` filter) that ended by the time the last of them did (range
+    filter). Other countdowns of these users that have ended by then are
+    deleted too, they are due to be cleaned up anyway. Batches of more than
+    `MAX_USERS_PER_DELETE` users are split, so that the url isn't too long.
+
+    Parameters
+    ----------
+    countdowns : List[Countdown]
+        Countdowns to delete
+
+    Returns
+    -------
+    list
+        Deleted rows (tg_user_id and name of every deleted countdown)
+    """
+
+    if not countdowns:
+        return []
+
+    last_end = max(countdowns, key=lambda c: c.end).date_time
+    user_ids = sorted({countdown.user_id for countdown in countdowns})
+
+    requests = []
+    for i in range(0, len(user_ids), MAX_USERS_PER_DELETE):
+        chunk = ",".join(map(str, user_ids[i : i + MAX_USERS_PER_DELETE]))
+        requests.append(
+            _delete_ended({"tg_user_id": f"in.({chunk})"}, last_end)
+        )
+
+    return [row for rows in await asyncio.gather(*requests) for row in rows]
+
+
+async def remove_all_ended(date_time: str) -> list:
+    """Delete every countdown that ended by the given time from the db.
+
+    Parameters
+    ----------
+    date_time : str
+        Countdown date and time (in the '%Y-%m-%dT%H:%M:%S%z' format)
+
+    Returns
+    -------
+    list
+        Deleted rows (tg_user_id and name of every deleted countdown)
+    """
+
+    return await _delete_ended({}, date_time)
+
+
+async def _delete_ended(filters: Dict[str, str], date_time: str) -> list:
+    params = {
+        "select": "tg_user_id,name",
+        **filters,
+        "date_time": f"lte.{date_time}",
+    }
+    data = await db.request("DELETE", "Countdowns", params=params)
+    await countdown_cache.delete_countdowns(
+        (row["tg_user_id"], row["name"]) for row in data
+    )
+
+    return data
@@ -0,0 +1,112 @@
+"""Startup profile: where the time goes before the bot is ready.
+
+Run the bot with
+
+    python -m utils.startup_profile
+
+instead of `python app.py` and once startup has finished, a report like
+`python -X importtime` gives (but sorted, and only the slowest imports) is
+logged along with the time the imports and `on_startup` took. Imports are
+timed by wrapping `exec_module` of the file loaders, so only the time spent
+running the modules is counted (not finding them).
+"""
+
+import logging
+import runpy
+import time
+from importlib.machinery import (
+    ExtensionFileLoader,
+    SourceFileLoader,
+    SourcelessFileLoader,
+)
+from typing import List, Tuple, Union
+
+# number of imports in the report
+TOP = 20
+LOADERS = (SourceFileLoader, SourcelessFileLoader, ExtensionFileLoader)
+
+# (module, cumulative seconds, self seconds) of every import
+_imports: List[Tuple[str, float, float]] = []
+# time spent in the imports nested in the ones that are running
+_nested: List[float] = []
+_originals: dict = {}
+_started: Union[float, None] = None
+_imported: Union[float, None] = None
+
+
+def _timed(exec_module):
+    def timed_exec_module(loader, module):
+        start = time.perf_counter()
+        _nested.append(0.0)
+        try:
+            exec_module(loader, module)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = _nested.pop()
+            if _nested:
+                _nested[-1] += elapsed
+            _imports.append((module.__name__, elapsed, elapsed - nested))
+
+    return timed_exec_module
+
+
+def install():
+    """Start timing imports."""
+    global _started
+
+    _started = time.perf_counter()
+    for loader in LOADERS:
+        _originals[loader] = loader.exec_module
+        loader.exec_module = _timed(loader.exec_module)
+
+
+def imported():
+    """Mark the end of the imports (the bot is starting up now)."""
+    global _imported
+
+    if _started is not None and _imported is None:
+        _imported = time.perf_counter()
+
+
+def report():
+    """Log the startup profile and stop timing imports.
+
+    Does nothing unless the bot was started by this module.
+    """
+
+    if _started is None or not _originals:
+        return
+
+    for loader, exec_module in _originals.items():
+        loader.exec_module = exec_module
+    _originals.clear()
+
+    ready = time.perf_counter()
+    imported_at = _imported or ready
+    lines = [
+        "Startup profile:",
+        f"  imports     {(imported_at - _started) * 1000:8.1f} ms"
+        f" ({len(_imports)} modules)",
+        f"  on_startup  {(ready - imported_at) * 1000:8.1f} ms",
+        f"  ready after {(ready - _started) * 1000:8.1f} ms",
+        f"  {'cumulative':>10} {'self':>8}  slowest imports",
+    ]
+    slowest = sorted(_imports, key=lambda i: i[1], reverse=True)[:TOP]
+    for name, cumulative, own in slowest:
+        lines.append(
+            f"  {cumulative * 1000:7.1f} ms {own * 1000:5.1f} ms  {name}"
+        )
+
+    logging.info("\n".join(lines))
+
+
+def main():
+    # this module runs as __main__, the state has to be in the one app uses
+    from utils import startup_profile
+
+    startup_profile.install()
+    runpy.run_module("app", run_name="__main__", alter_sys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""FSM storage that reads and writes a user's state once per update.
+
+With plain `RedisStorage2` every `state.get_data()`, `state.update_data()`
+(a read and a write), `state.finish()` and `State.set()` is a separate redis
+round trip. Here the state and data of the user whose update is being handled
+are loaded with one MGET the first time they're needed, changed in memory and
+written back in one pipeline when the handler is done (see
+middlewares.state_session). Other users' records go to redis directly.
+"""
+
+import copy
+import json
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Union
+
+from aiogram.contrib.fsm_storage.redis import (
+    STATE_DATA_KEY,
+    STATE_KEY,
+    RedisStorage2,
+)
+
+from utils.metrics import fsm_storage_seconds
+
+
+class StateSession:
+    """State and data of one user, as loaded from and saved to redis."""
+
+    def __init__(self, chat: str, user: str):
+        self.chat = chat
+        self.user = user
+        self.loaded = False
+        self.closed = False
+
+        self.state: Optional[str] = None
+        self.data: Dict = {}
+        # what's in redis, to write only what has changed
+        self.saved_state: Optional[str] = None
+        self.saved_data: Optional[str] = None
+
+
+_session: ContextVar[Optional[StateSession]] = ContextVar(
+    "state_session", default=None
+)
+
+
+class StateSessionStorage(RedisStorage2):
+    """`RedisStorage2` with per-update state sessions."""
+
+    def open_session(self, chat: Union[str, int], user: Union[str, int]):
+        """Start keeping the user's state in memory for this update."""
+        _session.set(StateSession(str(chat), str(user)))
+
+    async def close_session(self):
+        """Write the user's state back to redis if it has changed."""
+        session = _session.get()
+        if session is None:
+            return
+
+        # tasks started by the handler see the session too, from now on they
+        # go to redis directly
+        session.closed = True
+        _session.set(None)
+
+        if not session.loaded:
+            return
+
+        data = json.dumps(session.data) if session.data else None
+        state_key = self.generate_key(session.chat, session.user, STATE_KEY)
+        data_key = self.generate_key(
+            session.chat, session.user, STATE_DATA_KEY
+        )
+
+        if session.state == session.saved_state and data == session.saved_data:
+            return
+
+        redis = await self.redis()
+
+        async with redis.pipeline(transaction=True) as pipe:
+            if session.state != session.saved_state:
+                if session.state is None:
+                    pipe.delete(state_key)
+                else:
+                    pipe.set(state_key, session.state, ex=self._state_ttl)
+
+            if data != session.saved_data:
+                if data is None:
+                    pipe.delete(data_key)
+                else:
+                    pipe.set(data_key, data, ex=self._data_ttl)
+
+            start = time.perf_counter()
+            await pipe.execute()
+            fsm_storage_seconds.labels("write").observe(
+                time.perf_counter() - start
+            )
+
+    async def _get_session(self, chat, user) -> Optional[StateSession]:
+        """Get the open session if it's for this chat and user."""
+        session = _session.get()
+        if session is None or session.closed:
+            return None
+
+        chat, user = self.check_address(chat=chat, user=user)
+        if (str(chat), str(user)) != (session.chat, session.user):
+            return None
+
+        if not session.loaded:
+            redis = await self.redis()
+            start = time.perf_counter()
+            state, data = await redis.mget(
+                self.generate_key(chat, user, STATE_KEY),
+                self.generate_key(chat, user, STATE_DATA_KEY),
+            )
+            fsm_storage_seconds.labels("read").observe(
+                time.perf_counter() - start
+            )
+
+            session.state = session.saved_state = state
+            session.data = json.loads(data) if data else {}
+            session.saved_data = data
+            session.loaded = True
+
+        return session
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        session = await self._get_session(chat, user)
+        if session is None:
+            return await super().get_state(
+                chat=chat, user=user, default=default
+            )
+
+        return session.state or self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        session = await self._get_session(chat, user)
+        if session is None:
+            return await super().get_data(
+                chat=chat, user=user, default=default
+            )
+
+        # a copy, like a fresh read from redis would be
+        return copy.deepcopy(session.data) or default or {}
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        session = await self._get_session(chat, user)
+        if session is None:
+            return await super().set_state(chat=chat, user=user, state=state)
+
+        session.state = None if state is None else self.resolve_state(state)
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        session = await self._get_session(chat, user)
+        if session is None:
+            return await super().set_data(chat=chat, user=user, data=data)
+
+        session.data = copy.deepcopy(data) or {}
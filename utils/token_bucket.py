@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Token bucket rate limiter for coroutines.
+
+    Tokens are added at `rate` per second up to `capacity`. `acquire` waits
+    until a token is available, so callers are spread out evenly once the
+    initial burst (of up to `capacity` calls) is used up.
+
+    Parameters
+    ----------
+    rate : float
+        Number of tokens added per second
+    capacity : float
+        Maximum number of tokens the bucket can hold (burst size)
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available right now."""
+        self._refill()
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        if self._lock is None:
+            # created lazily so that it is bound to the running event loop
+            self._lock = asyncio.Lock()
+
+        # waiters are served one at a time, in order of arrival
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep((1 - self.tokens) / self.rate)
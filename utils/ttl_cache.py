@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+
+
+class TTLCache:
+    """In-process LRU cache whose entries expire after `ttl` seconds.
+
+    Hits and misses are counted so that cache efficiency can be checked.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of entries, least recently used ones are evicted first
+    ttl : float
+        Number of seconds after which an entry expires
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Get the value for the key.
+
+        Returns
+        -------
+        Tuple[bool, Any]
+            (True, value) if the key is cached (value may be None), else
+            (False, None)
+        """
+
+        item = self._data.get(key)
+
+        if item is not None and item[0] < time.monotonic():
+            del self._data[key]
+            item = None
+
+        if item is None:
+            self.misses += 1
+            return False, None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, item[1]
+
+    def set(self, key: Hashable, value: Any):
+        """Cache the value for the key."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        """Forget the key if it is cached."""
+        self._data.pop(key, None)